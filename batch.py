@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+# Render file perintah (lihat ops.py) ke PNG tanpa display:
+#   python batch.py commands/*.json -o out/ -j 8
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+_app = None
+
+
+def _init_worker():
+    global _app
+    _app = QApplication.instance() or QApplication([])
+
+
+def render_file(path, out_dir):
+    from main import Canvas
+    import ops
+    _init_worker()
+    doc = ops.load(path)
+    canvas = Canvas()
+    if 'size' in doc:
+        canvas.new_document(*doc['size'])
+    ops.replay(canvas, doc['ops'])
+    canvas.apply_transform()
+    name = os.path.splitext(os.path.basename(path))[0] + '.png'
+    out = os.path.join(out_dir, name)
+    canvas.save_image(out)
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render MiniPaint command files to PNG')
+    parser.add_argument('files', nargs='+', help='command files (.json / .jsonl)')
+    parser.add_argument('-o', '--out', default='.', help='output directory')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='worker processes (0 = one per CPU)')
+    args = parser.parse_args(argv)
+    os.makedirs(args.out, exist_ok=True)
+    jobs = args.jobs or os.cpu_count() or 1
+    start = time.perf_counter()
+    failed = 0
+    if jobs == 1:
+        results = []
+        for path in args.files:
+            try:
+                results.append((path, render_file(path, args.out), None))
+            except Exception as e:
+                results.append((path, None, e))
+    else:
+        # spawn, bukan fork: tiap worker punya QApplication sendiri
+        with ProcessPoolExecutor(jobs, mp_context=get_context('spawn'),
+                                 initializer=_init_worker) as pool:
+            futures = [(path, pool.submit(render_file, path, args.out)) for path in args.files]
+            results = []
+            for path, future in futures:
+                try:
+                    results.append((path, future.result(), None))
+                except Exception as e:
+                    results.append((path, None, e))
+    for path, out, error in results:
+        if error is not None:
+            failed += 1
+            print(f'{path}: error: {error}', file=sys.stderr)
+        else:
+            print(f'{path} -> {out}')
+    print(f'{len(results) - failed}/{len(results)} rendered in '
+          f'{time.perf_counter() - start:.2f}s', file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,500 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+# Benchmark hot path Canvas tanpa display:
+#   python bench.py                      semua case, ukuran 512/2048/8192
+#   python bench.py -k fill -s 4096      hanya case yang namanya mengandung "fill"
+#   python bench.py --save               simpan hasil sebagai baseline
+#   python bench.py --raster -n 5000     bandingkan backend raster.py
+#   python bench.py --session -c 10      latency sesi bersama (session.py)
+#   python bench.py --startup -r 10      cold start sampai frame pertama
+# Tiap (case, ukuran) jalan di proses baru supaya peak memory tidak
+# tercampur. Hasil dibandingkan dengan baseline (default bench_baseline.json),
+# exit code 1 kalau ada yang lebih lambat/boros dari toleransi. Baseline
+# bergantung mesin, jadi tidak ikut repo: buat sekali dengan --save di mesin
+# yang sama (mis. sebelum mengubah kode). Tanpa baseline hasil hanya dicetak
+# dan exit code selalu 0.
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+SIZES = (512, 2048, 8192)
+VIEW = (1280, 800)
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+_app = None
+
+
+def _reset_peak():
+    # Linux: reset VmHWM supaya peak yang terukur hanya milik operasi,
+    # bukan setup. Return False kalau tidak didukung.
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    raise ValueError(field)
+
+
+def _rss():
+    try:
+        return _status_kb('VmRSS')
+    except (OSError, ValueError):
+        return _peak_rss()
+
+
+def _peak_rss():
+    try:
+        return _status_kb('VmHWM')
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# Setiap case: setup(canvas, n) -> (run, before). run diukur, before
+# (boleh None) dipanggil tanpa diukur sebelum tiap ulangan.
+
+def _fill(connectivity, huge):
+    def setup(canvas, n):
+        from PyQt5.QtCore import QPoint
+        from PyQt5.QtGui import QColor
+        if huge:
+            point = QPoint(n // 2, n // 2)
+        else:
+            # Region kecil: kotak 64x64 dengan garis tepi
+            canvas.draw_shape('rect', QPoint(10, 10), QPoint(74, 74), QColor('black'), 2)
+            point = QPoint(40, 40)
+        colors = [QColor('red'), QColor('blue')]
+
+        def run():
+            colors.reverse()
+            canvas.flood_fill(point, colors[0], connectivity, 0)
+        return run, None
+    return setup
+
+
+def _brush(canvas, n):
+    import math
+    from PyQt5.QtCore import QEvent, QPoint, QPointF, Qt
+    from PyQt5.QtGui import QMouseEvent
+    center = QPoint(n // 2, n // 2)
+    radius = min(n, VIEW[1]) * 0.4
+    points = [canvas._to_widget(center + QPoint(int(radius * math.cos(i / 40.0)),
+                                                int(radius * math.sin(i / 23.0))))
+              for i in range(1000)]
+    canvas.set_mode('brush')
+    canvas.set_brush_size(12)
+
+    def event(kind, pos, button, buttons):
+        return QMouseEvent(kind, QPointF(pos), button, buttons, Qt.NoModifier)
+
+    def run():
+        canvas.mousePressEvent(event(QEvent.MouseButtonPress, points[0],
+                                     Qt.LeftButton, Qt.LeftButton))
+        for i, pos in enumerate(points[1:], 1):
+            canvas.mouseMoveEvent(event(QEvent.MouseMove, pos, Qt.NoButton, Qt.LeftButton))
+            if i % 16 == 0:
+                canvas._flush_stroke()  # ~1 frame per 16 event, seperti timer
+        canvas.mouseReleaseEvent(event(QEvent.MouseButtonRelease, points[-1],
+                                       Qt.LeftButton, Qt.NoButton))
+    return run, None
+
+
+def _paint(zoom, pan):
+    def setup(canvas, n):
+        from PyQt5.QtCore import QPoint
+        from PyQt5.QtGui import QColor, QImage
+        for i in range(0, n, max(1, n // 16)):
+            canvas.draw_shape('line', QPoint(i, 0), QPoint(n - i, n), QColor('green'), 3)
+        canvas.set_zoom(zoom)
+        # pan relatif ke ukuran image yang di-zoom
+        canvas._pan = QPoint(int(pan[0] * n * zoom), int(pan[1] * n * zoom))
+        target = QImage(*VIEW, QImage.Format_ARGB32_Premultiplied)
+
+        def run():
+            canvas.render(target)
+        return run, canvas._render.invalidate
+    return setup
+
+
+def _transform(mode, **kwargs):
+    def setup(canvas, n):
+        from PyQt5.QtCore import QPoint, QRect
+        from PyQt5.QtGui import QColor
+        canvas.draw_shape('circle', QPoint(n // 4, n // 4), QPoint(3 * n // 4, 3 * n // 4),
+                          QColor('red'), 8)
+        rect = QRect(n // 4, n // 4, n // 2, n // 2)
+
+        def run():
+            canvas.transform_selection(rect, mode, **kwargs)
+        return run, canvas.undo
+    return setup
+
+
+def _filter(name, params):
+    def setup(canvas, n):
+        from PyQt5.QtCore import QPoint
+        from PyQt5.QtGui import QColor
+        canvas.draw_shape('circle', QPoint(n // 4, n // 4), QPoint(3 * n // 4, 3 * n // 4),
+                          QColor('red'), 8)
+
+        def run():
+            canvas.apply_filter(name, params)
+        return run, canvas.undo
+    return setup
+
+
+def _wand(connectivity, tolerance):
+    def setup(canvas, n):
+        from PyQt5.QtCore import QPoint
+        from PyQt5.QtGui import QColor
+        for i in range(0, n, max(1, n // 16)):
+            canvas.draw_shape('line', QPoint(i, 0), QPoint(n - i, n), QColor('green'), 3)
+        point = QPoint(n // 2 + 7, n // 3)
+
+        def run():
+            canvas.magic_wand(point, 'replace', connectivity, tolerance)
+        return run, canvas.undo  # undo = batalkan floating selection
+    return setup
+
+
+def _undo_redo(canvas, n):
+    from PyQt5.QtCore import QPoint
+    from PyQt5.QtGui import QColor
+    step = max(1, n // 50)
+    for i in range(50):
+        canvas.draw_shape('line', QPoint(0, i * step), QPoint(n - 1, n - 1 - i * step),
+                          QColor('blue'), 5)
+    canvas.flood_fill(QPoint(n - 1, 0), QColor('yellow'), 4, 0)
+
+    def run():
+        for _ in range(len(canvas.history.undo_stack)):
+            canvas.undo()
+        for _ in range(len(canvas.history.redo_stack)):
+            canvas.redo()
+    return run, None
+
+
+CASES = {
+    'fill4_small': _fill(4, False),
+    'fill4_huge': _fill(4, True),
+    'fill8_small': _fill(8, False),
+    'fill8_huge': _fill(8, True),
+    'brush_stroke': _brush,
+    'paint_zoom0.25': _paint(0.25, (0, 0)),
+    'paint_zoom1': _paint(1.0, (0, 0)),
+    'paint_zoom1_pan': _paint(1.0, (-0.3, -0.3)),
+    'paint_zoom4_pan': _paint(4.0, (0.2, -0.2)),
+    'rotate': _transform('rotate', angle=30),
+    'scale': _transform('scale', scale=1.5),
+    'filter_blur': _filter('gaussian_blur', {'radius': 4}),
+    'filter_invert': _filter('invert', {}),
+    'wand4': _wand(4, 0),
+    'wand8_tolerance': _wand(8, 32),
+    'undo_redo': _undo_redo,
+}
+
+
+def run_case(name, size, repeat):
+    # Dijalankan di proses worker
+    global _app
+    _app = QApplication.instance() or QApplication([])
+    from main import Canvas
+    start_rss = _rss()
+    canvas = Canvas()
+    canvas.resize(*VIEW)
+    canvas.new_document(size, size)
+    run, before = CASES[name](canvas, size)
+    # NumPy (startup.lazy_module) dimuat di setup, bukan di repeat pertama
+    import numpy  # noqa: F401
+    if _reset_peak():
+        start_rss = _rss()  # tanpa dukungan reset, peak termasuk setup
+    times = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        t = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t)
+    return {'median': statistics.median(times), 'min': min(times),
+            'peak_mb': max(0, _peak_rss() - start_rss) / 2 ** 20}
+
+
+def compare(result, base, tolerance):
+    # Return daftar keluhan (kosong = OK)
+    problems = []
+    # Waktu dibandingkan lewat min (paling stabil), plus 0.5 ms untuk case kecil
+    if result['min'] > base['min'] * (1 + tolerance) + 0.0005:
+        problems.append(f"time {result['min'] / base['min']:.2f}x")
+    # Peak memory diberi kelonggaran 8 MB untuk noise allocator
+    if result['peak_mb'] > base['peak_mb'] * (1 + tolerance) + 8:
+        problems.append(f"memory {result['peak_mb']:.0f}/{base['peak_mb']:.0f} MB")
+    return problems
+
+
+RASTER_CASES = (('line', 1), ('line', 5), ('rect', 1), ('rect', 5),
+                ('circle', 1), ('circle', 5), ('brush', 12))
+
+
+def _ink_diff(a, b):
+    # Jumlah pixel berbeda antara dua TiledImage seukuran, dan pixel yang
+    # ditulis di a (beda dari warna dasar), dihitung per tile
+    import numpy as np
+    from imagebuf import image_array
+    diff = ink = 0
+    for key, rect in a.tile_keys(a.rect()):
+        pa, pb = a.tile_state(key), b.tile_state(key)
+        if isinstance(pa, int) and isinstance(pb, int):
+            diff += (pa != pb) * rect.width() * rect.height()
+            ink += (pa != a.default) * rect.width() * rect.height()
+            continue
+        arr_a = pa if isinstance(pa, int) else image_array(pa, readonly=True)
+        arr_b = pb if isinstance(pb, int) else image_array(pb, readonly=True)
+        shape = (rect.height(), rect.width())
+        diff += int(np.count_nonzero(np.broadcast_to(arr_a != arr_b, shape)))
+        ink += int(np.count_nonzero(np.broadcast_to(arr_a != a.default, shape)))
+    return diff, ink
+
+
+def compare_raster(count, size, repeat):
+    # Throughput tiap backend raster.py untuk count primitive acak (panjang
+    # <= 128 px) di canvas size x size, plus selisih pixel terhadap QPainter
+    import numpy as np
+    import raster
+    from tiles import TiledImage
+    rng = np.random.default_rng(0)
+    names = list(raster.BACKENDS)
+    print(f"{'primitive':<10} {'width':>5} {'count':>6}  "
+          + '  '.join(f'{name + " ms":>12} {"prim/s":>9}' for name in names)
+          + f"  {'speedup':>7} {'diff %':>6}")
+    for kind, width in RASTER_CASES:
+        start = rng.integers(0, size, (count, 2))
+        coords = np.concatenate([start, start + rng.integers(-128, 129, (count, 2))], axis=1)
+        times, images = {}, {}
+        for name in names:
+            backend = raster.get(name)
+            best = None
+            for _ in range(repeat):
+                image = TiledImage(size, size)
+                t = time.perf_counter()
+                if kind == 'brush':
+                    backend.dabs(image, image.rect(), coords[:, :2].tolist(), width, 0xff000000)
+                else:
+                    backend.shapes(image, image.rect(), kind, coords.tolist(), 0xff000000, width)
+                elapsed = time.perf_counter() - t
+                best = elapsed if best is None else min(best, elapsed)
+            times[name], images[name] = best, image
+        diff, ink = _ink_diff(images[names[0]], images[names[-1]])
+        print(f'{kind:<10} {width:>5} {count:>6}  '
+              + '  '.join(f'{times[n] * 1000:>12.1f} {count / times[n]:>9.0f}' for n in names)
+              + f'  {times[names[0]] / times[names[-1]]:>6.1f}x {100.0 * diff / max(ink, 1):>6.1f}',
+              flush=True)
+
+
+SESSION_CASES = ('brush', 'rect', 'fill')
+
+
+def session_latency(clients, size, count):
+    # Server session.py di thread + clients Canvas dalam satu proses.
+    # Latency = op selesai di client pengirim sampai delta terpasang di
+    # semua client lain (encode, jaringan lokal, decode, pasang tile).
+    import numpy as np
+    import session
+    from PyQt5.QtCore import QPoint
+    from PyQt5.QtGui import QColor
+    from main import Canvas
+    rng = np.random.default_rng(0)
+    server, thread = session.serve_in_thread(size, size)
+    canvases = [Canvas() for _ in range(clients)]
+    links = [session.SessionClient(canvas, port=server.port) for canvas in canvases]
+    committed = []
+    for canvas in canvases:
+        canvas.operation.connect(lambda op: committed.append(time.perf_counter()))
+    payload = []
+    links[-1].applied.connect(lambda header: payload.append(
+        sum(ref[-1]['blob'][1] for ref in header.get('tiles', ()) if 'blob' in ref[-1])))
+
+    def wait(ready):
+        while not ready():
+            _app.processEvents()
+            time.sleep(0.0005)
+
+    wait(lambda: all(link.client is not None for link in links))
+    print(f"{'op':<8} {'clients':>7} {'ops':>5} {'local ms':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'KB/op':>7}")
+    for kind in SESSION_CASES:
+        latencies, local = [], []
+        payload.clear()
+        for i in range(count):
+            canvas = canvases[i % (clients - 1)]  # client terakhir hanya menerima
+            x, y = (int(v) for v in rng.integers(0, size - 256, 2))
+            color = QColor(*(int(v) for v in rng.integers(0, 256, 3)))
+            target = server.seq + 1
+            t = time.perf_counter()
+            if kind == 'brush':
+                canvas.brush_stroke([QPoint(x + int(dx), y + int(dy))
+                                     for dx, dy in rng.integers(0, 256, (8, 2))], color, 12)
+            elif kind == 'rect':
+                canvas.draw_shape('rect', QPoint(x, y), QPoint(x + 255, y + 255), color, 5, False)
+            else:
+                canvas.flood_fill(QPoint(x, y), color)
+            wait(lambda: min(link.seq for link in links) >= target)
+            local.append(committed[-1] - t)
+            latencies.append(time.perf_counter() - committed[-1])
+        latencies.sort()
+        print(f'{kind:<8} {clients:>7} {count:>5} {statistics.median(local) * 1000:>8.1f} '
+              f'{latencies[len(latencies) // 2] * 1000:>8.1f} '
+              f'{latencies[int(len(latencies) * 0.95)] * 1000:>8.1f} {latencies[-1] * 1000:>8.1f} '
+              f'{sum(payload) / max(len(payload), 1) / 1024:>7.1f}', flush=True)
+    for link in links:
+        link.close()
+    session.stop_server(server, thread)
+
+
+STARTUP_MODES = (('lazy', {}), ('eager', {'MINIPAINT_LAZY': '0'}))
+
+
+def cold_start(repeat, size):
+    # Tiap run `python main.py` di proses baru dengan HOME sementara (journal
+    # dan state startup.py kosong), keluar setelah frame pertama. wall =
+    # spawn sampai report tercetak; kolom lain = mark startup.py sejak awal
+    # main.py. "restore" = state sesi lalu dengan satu tab project size².
+    import subprocess
+    import tempfile
+    import startup
+    from PyQt5.QtCore import QPoint
+    from PyQt5.QtGui import QColor
+    from main import Canvas
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    stages = ('imports', 'window', 'paint', 'restore')
+    with tempfile.TemporaryDirectory() as tmp:
+        canvas = Canvas()
+        canvas.new_document(size, size)
+        canvas.draw_shape('rect', QPoint(8, 8), QPoint(size - 8, size - 8), QColor('red'), 5, False)
+        path = os.path.join(tmp, 'restore.mpp')
+        canvas.save_project(path)
+        state = {'tool': canvas.tool_state(), 'view': canvas.view_state(),
+                 'documents': [{'path': path, 'view': canvas.view_state()}], 'active': path}
+        print(f"{'mode':<6} {'state':<8} {'wall ms':>8} {'min ms':>8}"
+              + ''.join(f' {stage:>8}' for stage in stages))
+        for restore in (False, True):
+            for mode, env in STARTUP_MODES:
+                walls, marks = [], []
+                for _ in range(repeat):
+                    with tempfile.TemporaryDirectory() as home:
+                        if restore:
+                            startup.write_state(state, os.path.join(home, '.minipaint', 'state.json'))
+                        t = time.perf_counter()
+                        proc = subprocess.Popen(
+                            [sys.executable, script], stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True,
+                            env=dict(os.environ, HOME=home, MINIPAINT_STARTUP_BENCH='1', **env))
+                        line = proc.stdout.readline()
+                        walls.append(time.perf_counter() - t)
+                        proc.wait()
+                    marks.append(json.loads(line))
+                print(f"{mode:<6} {'restore' if restore else 'empty':<8} "
+                      f'{statistics.median(walls) * 1000:>8.1f} {min(walls) * 1000:>8.1f}'
+                      + ''.join(f' {statistics.median(m.get(stage, 0.0) for m in marks):>8.1f}'
+                                for stage in stages), flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark MiniPaint Canvas hot paths')
+    parser.add_argument('-k', '--filter', default='', help='only cases containing this text')
+    parser.add_argument('-s', '--sizes', default=','.join(map(str, SIZES)),
+                        help='comma separated canvas sizes (square)')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('-b', '--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='write results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown/memory growth vs baseline (0.25 = 25%%)')
+    parser.add_argument('--raster', action='store_true',
+                        help='compare raster.py backends instead of running cases')
+    parser.add_argument('-n', '--count', type=int, default=5000,
+                        help='primitives per raster comparison')
+    parser.add_argument('--session', action='store_true',
+                        help='measure shared session latency instead of running cases')
+    parser.add_argument('-c', '--clients', type=int, default=10)
+    parser.add_argument('--ops', type=int, default=100, help='operations per session case')
+    parser.add_argument('--startup', action='store_true',
+                        help='measure cold start to first paint instead of running cases')
+    args = parser.parse_args(argv)
+
+    if args.raster:
+        global _app
+        _app = QApplication.instance() or QApplication([])
+        for size in (int(s) for s in args.sizes.split(',') if s):
+            print(f'canvas {size}x{size}')
+            compare_raster(args.count, size, args.repeat)
+        return 0
+
+    if args.session:
+        _app = QApplication.instance() or QApplication([])
+        for size in (int(s) for s in args.sizes.split(',') if s):
+            print(f'canvas {size}x{size}')
+            session_latency(args.clients, size, args.ops)
+        return 0
+
+    if args.startup:
+        _app = QApplication.instance() or QApplication([])
+        for size in (int(s) for s in args.sizes.split(',') if s):
+            cold_start(args.repeat, size)
+        return 0
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    names = [name for name in CASES if args.filter in name]
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    elif not args.save:
+        print(f'no baseline at {args.baseline}: results are not compared '
+              f'(run with --save first to create one)', file=sys.stderr)
+
+    results = {}
+    regressions = 0
+    print(f"{'case':<18} {'size':>6} {'median ms':>10} {'min ms':>9} {'peak MB':>8}  baseline")
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn'),
+                             max_tasks_per_child=1) as pool:
+        for name in names:
+            for size in sizes:
+                key = f'{name}@{size}'
+                result = results[key] = pool.submit(run_case, name, size, args.repeat).result()
+                note = 'new' if baseline else ''
+                if key in baseline:
+                    problems = compare(result, baseline[key], args.tolerance)
+                    regressions += bool(problems)
+                    note = ('REGRESSION ' + ', '.join(problems) if problems else
+                            f"{baseline[key]['min'] / result['min']:.2f}x")
+                print(f"{name:<18} {size:>6} {result['median'] * 1000:>10.1f} "
+                      f"{result['min'] * 1000:>9.1f} {result['peak_mb']:>8.1f}  {note}",
+                      flush=True)
+
+    if args.save:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                results = {**json.load(f), **results}
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print(f'baseline written to {args.baseline}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtGui import QImage
+
+from tiles import PackedTile, decode_tile, encode_tile
+
+# Banyak dokumen (Canvas) terbuka dengan satu budget memori bersama.
+# Memori satu dokumen = pixel tile yang hidup di layer, history, composite
+# cache dan render cache; tile yang di-share (copy-on-write) dihitung
+# sekali. Kalau total melewati budget, dokumen tidak aktif yang paling
+# lama tidak dipakai di-evict: tile layer + history dikompres ke file
+# sementara dan diganti PackedTile (tetap bisa dibaca journal, project,
+# export dan ops tanpa di-restore), cache dibuang. Saat dokumen diaktifkan
+# lagi semua tile di-decode paralel dan file dilepas.
+
+DEFAULT_BUDGET = 1 << 30
+
+_pool = None
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+    return _pool
+
+
+class SpillFile:
+    # File sementara berisi blob encode_tile, source untuk PackedTile.
+    # Bisa dibaca dari thread lain (snapshot journal, export).
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(prefix='minipaint-doc-')
+        self._lock = threading.Lock()
+        self.size = 0
+
+    def append(self, blob):
+        with self._lock:
+            offset = self.size
+            self._file.seek(offset)
+            self._file.write(blob)
+            self.size += len(blob)
+        return offset
+
+    def read(self, offset, length):
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def load(self, offset, length):
+        return decode_tile(self.read(offset, length))
+
+
+def _entries(canvas):
+    # Semua daftar [(key, state)] history, bisa diganti isinya di tempat
+    for stack in (canvas.history.undo_stack, canvas.history.redo_stack):
+        for entry, _ in stack:
+            yield entry
+
+
+def document_bytes(canvas):
+    seen = {}
+    images = [state for layer in canvas.image.layers
+              for state in layer.image._tiles.values()]
+    images += [state for entry in _entries(canvas) for _, state in entry]
+    images += list(canvas.image._cache.values())
+    images += list(canvas._render._tiles.values())
+    images += list(canvas._shape_cache._tiles.values())
+    for image in images:
+        if isinstance(image, QImage):
+            seen[image.cacheKey()] = image.sizeInBytes()
+    return sum(seen.values())
+
+
+def can_evict(canvas):
+    # Jangan evict dokumen yang sedang diedit
+    return (not canvas.history.is_open() and canvas.selected_image is None
+            and not canvas.drawing)
+
+
+def evict(canvas):
+    # Kompres tile layer + history ke SpillFile baru, return file tersebut
+    stack = canvas.image
+    spill = SpillFile()
+    packed = {}  # cacheKey -> PackedTile
+    fresh = {}  # cacheKey -> QImage yang perlu ditulis
+    states = [state for layer in stack.layers for state in layer.image._tiles.values()]
+    states += [state for entry in _entries(canvas) for _, state in entry]
+    for state in states:
+        if not isinstance(state, QImage):
+            continue
+        key = state.cacheKey()
+        if key in packed or key in fresh:
+            continue
+        # Tile yang isinya sama dengan chunk file project cukup dirujuk
+        ref = stack.source.pack(state) if stack.source is not None else None
+        if ref is not None:
+            packed[key] = ref
+        else:
+            fresh[key] = state
+    for key, blob in zip(fresh, _executor().map(encode_tile, fresh.values())):
+        packed[key] = PackedTile(spill, spill.append(blob), len(blob))
+
+    def pack(state):
+        return packed[state.cacheKey()] if isinstance(state, QImage) else state
+
+    for layer in stack.layers:
+        store = layer.image
+        for key, state in list(store._tiles.items()):
+            if isinstance(state, QImage):
+                store.set_tile_state(key, pack(state))
+    for entry in _entries(canvas):
+        entry[:] = [(key, pack(state)) for key, state in entry]
+    canvas.drop_caches()
+    return spill
+
+
+def restore(canvas, spill):
+    # Kebalikan evict: decode semua tile dari spill (paralel, zlib melepas GIL)
+    def spilled(state):
+        return isinstance(state, PackedTile) and state.source is spill
+
+    refs = {}
+    for layer in canvas.image.layers:
+        for state in layer.image._tiles.values():
+            if spilled(state):
+                refs[state.offset] = state
+    for entry in _entries(canvas):
+        for _, state in entry:
+            if spilled(state):
+                refs[state.offset] = state
+    tiles = dict(zip(refs, _executor().map(
+        lambda ref: spill.load(ref.offset, ref.length), refs.values())))
+
+    def unpack(state):
+        # QImage(tile): layer dan history kembali berbagi pixel yang sama
+        return QImage(tiles[state.offset]) if spilled(state) else state
+
+    for layer in canvas.image.layers:
+        store = layer.image
+        for key, state in list(store._tiles.items()):
+            if spilled(state):
+                store.set_tile_state(key, unpack(state))
+    for entry in _entries(canvas):
+        entry[:] = [(key, unpack(state)) for key, state in entry]
+
+
+class Documents:
+    # Daftar dokumen urut LRU (terakhir = paling baru dipakai)
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self._docs = OrderedDict()  # canvas -> SpillFile kalau di-evict, selain itu None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __iter__(self):
+        return iter(self._docs)
+
+    def add(self, canvas):
+        self._docs[canvas] = None
+        self._docs.move_to_end(canvas, last=False)
+
+    def remove(self, canvas):
+        self._docs.pop(canvas, None)
+
+    def is_evicted(self, canvas):
+        return self._docs.get(canvas) is not None
+
+    def activate(self, canvas):
+        # Dokumen jadi yang paling baru dipakai, di-restore kalau perlu
+        spill = self._docs.get(canvas)
+        if spill is not None:
+            restore(canvas, spill)
+        self._docs[canvas] = None
+        self._docs.move_to_end(canvas)
+        self.enforce()
+
+    def nbytes(self):
+        return sum(document_bytes(canvas) for canvas, spill in self._docs.items()
+                   if spill is None)
+
+    def enforce(self):
+        # Evict dokumen paling lama tidak dipakai sampai total <= budget.
+        # Dokumen aktif (paling baru) tidak pernah di-evict.
+        sizes = {canvas: document_bytes(canvas)
+                 for canvas, spill in self._docs.items() if spill is None}
+        total = sum(sizes.values())
+        evicted = []
+        for canvas in list(self._docs)[:-1]:
+            if total <= self.budget:
+                break
+            if canvas in sizes and sizes[canvas] and can_evict(canvas):
+                self._docs[canvas] = evict(canvas)
+                total -= sizes[canvas]
+                evicted.append(canvas)
+        return evicted
@@ -0,0 +1,137 @@
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, QRect, pyqtSignal
+from PyQt5.QtGui import QImage, QImageWriter, QPainter
+
+from tiles import write_png
+
+# Save/export di background: image di-snapshot (copy-on-write) di thread
+# GUI, encode dan tulis file di thread pool sehingga menggambar tetap
+# jalan. Beberapa export boleh berjalan paralel, masing-masing bisa
+# di-cancel. File ditulis ke <path>.part lalu di-rename saat selesai.
+
+# format -> (opsi, min, max, default); opsi None = tanpa pengaturan
+FORMATS = {
+    'png': ('compression', 0, 9, 6),
+    'jpg': ('quality', 0, 100, 90),
+    'jpeg': ('quality', 0, 100, 90),
+    'webp': ('quality', 0, 100, 90),
+    'tif': ('compression', 0, 1, 1),
+    'tiff': ('compression', 0, 1, 1),
+    'bmp': (None, 0, 0, 0),
+    'ppm': (None, 0, 0, 0),
+}
+
+_BAND = 512
+
+
+def supported_formats():
+    available = {bytes(f).decode() for f in QImageWriter.supportedImageFormats()}
+    return [fmt for fmt in FORMATS if fmt in available]
+
+
+def format_of(path, fmt=None):
+    return (fmt or os.path.splitext(path)[1][1:] or 'png').lower()
+
+
+def encode(store, path, fmt=None, level=None, progress=None, cancelled=None):
+    # store: QImage atau TiledImage, return False kalau di-cancel
+    fmt = format_of(path, fmt)
+    option, _, _, default = FORMATS.get(fmt, (None, 0, 0, 0))
+    level = default if level is None else level
+    if fmt == 'png':
+        return write_png(path, store, level, progress, cancelled)
+    # Format lain butuh image utuh: rakit per pita (50%), lalu tulis (50%)
+    width, height = store.width(), store.height()
+    if isinstance(store, QImage):
+        image = store
+    else:
+        image = QImage(width, height, QImage.Format_ARGB32)
+        painter = QPainter(image)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        try:
+            for y in range(0, height, _BAND):
+                if cancelled is not None and cancelled():
+                    return False
+                h = min(_BAND, height - y)
+                painter.drawImage(0, y, store.copy(QRect(0, y, width, h)))
+                if progress is not None:
+                    progress(0.5 * (y + h) / height)
+        finally:
+            painter.end()
+    if cancelled is not None and cancelled():
+        return False
+    writer = QImageWriter(path, fmt.encode())
+    if option == 'quality':
+        writer.setQuality(level)
+    elif option == 'compression':
+        writer.setCompression(level)
+    if not writer.write(image):
+        raise OSError(writer.errorString())
+    if progress is not None:
+        progress(1.0)
+    return True
+
+
+class Exporter(QObject):
+    # Sinyal dipancarkan dari thread pool, Qt meneruskannya ke thread GUI
+    progress = pyqtSignal(int, float)  # job, 0..1
+    finished = pyqtSignal(int, str, str)  # job, path, error ('' = sukses)
+
+    CANCELLED = 'cancelled'
+
+    def __init__(self, max_workers=2, parent=None):
+        super().__init__(parent)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers,
+                                        thread_name_prefix='export')
+        self._ids = itertools.count(1)
+        self._jobs = {}  # job -> threading.Event (cancel)
+        self._lock = threading.Lock()
+
+    def export(self, image, path, fmt=None, level=None):
+        store = image.snapshot() if hasattr(image, 'snapshot') else QImage(image)
+        job = next(self._ids)
+        cancel = threading.Event()
+        with self._lock:
+            self._jobs[job] = cancel
+        self._pool.submit(self._run, job, store, path, fmt, level, cancel)
+        return job
+
+    def cancel(self, job=None):
+        # None = cancel semua
+        with self._lock:
+            events = list(self._jobs.values()) if job is None else [self._jobs.get(job)]
+        for event in events:
+            if event is not None:
+                event.set()
+
+    def active(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def shutdown(self, cancel=False):
+        if cancel:
+            self.cancel()
+        self._pool.shutdown(wait=True)
+
+    def _run(self, job, store, path, fmt, level, cancel):
+        part = path + '.part'
+        error = ''
+        try:
+            done = encode(store, part, format_of(path, fmt), level,
+                          lambda value: self.progress.emit(job, value), cancel.is_set)
+            if done:
+                os.replace(part, path)
+            else:
+                error = self.CANCELLED
+        except Exception as e:  # laporkan ke GUI, jangan matikan worker
+            error = str(e) or type(e).__name__
+        finally:
+            if error and os.path.exists(part):
+                os.remove(part)
+            with self._lock:
+                self._jobs.pop(job, None)
+        self.finished.emit(job, path, error)
@@ -0,0 +1,91 @@
+from PyQt5.QtCore import QRect
+
+from imagebuf import image_array, channels
+from startup import lazy_module
+
+np = lazy_module('numpy')
+
+# Scanline flood fill di atas view NumPy dari buffer QImage.
+# Satu span (run horizontal) diproses sekaligus, bukan per pixel.
+
+
+def _row_match(row, target, tolerance):
+    if tolerance <= 0:
+        return row == target
+    # Toleransi = selisih maksimum per channel (A, R, G, B)
+    t = np.array([target], np.uint32)
+    diff = np.abs(channels(row).astype(np.int16) - channels(t).astype(np.int16))
+    return diff.max(axis=-1) <= tolerance
+
+
+def _runs(mask):
+    # Index awal tiap run True di mask 1D
+    if not mask.any():
+        return []
+    starts = (np.flatnonzero(mask[1:] & ~mask[:-1]) + 1).tolist()
+    if mask[0]:
+        starts.insert(0, 0)
+    return starts
+
+
+def scan_fill(arr, x, y, connectivity=4, tolerance=0):
+    # Cari semua span yang terhubung dengan (x, y) tanpa menulis ke arr.
+    # arr cukup punya .shape dan arr[row] (array 2D atau TiledImage.rows()).
+    # Return (spans, rect) dengan span = (y, x0, x1) setengah terbuka.
+    h, w = arr.shape
+    if x < 0 or y < 0 or x >= w or y >= h:
+        return [], QRect()
+    target = arr[y][x]
+    grow = 1 if connectivity == 8 else 0
+    # Mask "masih boleh diisi" per baris, dihitung saat baris pertama disentuh
+    free = {}
+
+    def row(r):
+        m = free.get(r)
+        if m is None:
+            m = free[r] = _row_match(arr[r], target, tolerance)
+        return m
+
+    spans = []
+    left, top, right, bottom = w, h, -1, -1
+    stack = [(x, y)]
+    while stack:
+        sx, sy = stack.pop()
+        m = row(sy)
+        if not m[sx]:
+            continue
+        # Lebarkan span ke kiri dan kanan sampai batas
+        stop = np.flatnonzero(~m[:sx])
+        x0 = int(stop[-1]) + 1 if stop.size else 0
+        stop = np.flatnonzero(~m[sx:])
+        x1 = sx + int(stop[0]) if stop.size else w
+        m[x0:x1] = False
+        spans.append((sy, x0, x1))
+        left, right = min(left, x0), max(right, x1 - 1)
+        top, bottom = min(top, sy), max(bottom, sy)
+        lo, hi = max(0, x0 - grow), min(w, x1 + grow)
+        for ny in (sy - 1, sy + 1):
+            if 0 <= ny < h:
+                seg = row(ny)[lo:hi]
+                for start in _runs(seg):
+                    stack.append((lo + start, ny))
+    if not spans:
+        return [], QRect()
+    return spans, QRect(left, top, right - left + 1, bottom - top + 1)
+
+
+def paint_spans(arr, spans, rgba):
+    value = np.uint32(rgba)
+    for sy, x0, x1 in spans:
+        arr[sy, x0:x1] = value
+
+
+def flood_fill(image, x, y, rgba, connectivity=4, tolerance=0):
+    # Isi region di image, return bounding rect yang berubah (kosong jika tidak ada)
+    arr = image_array(image)
+    if 0 <= x < arr.shape[1] and 0 <= y < arr.shape[0]:
+        if tolerance <= 0 and arr[y, x] == rgba:
+            return QRect()
+    spans, rect = scan_fill(arr, x, y, connectivity, tolerance)
+    paint_spans(arr, spans, rgba)
+    return rect
@@ -0,0 +1,302 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QRect, Qt
+from PyQt5.QtGui import QColor, QImage
+
+from imagebuf import image_array, channels
+from startup import lazy_module
+
+np = lazy_module('numpy')
+
+# Filter gambar (blur, sharpen, brightness/contrast, grayscale, invert,
+# kernel bebas) di atas view NumPy dari bits QImage. Area dibagi per tile,
+# tiap tile (plus halo selebar radius filter) dikerjakan di thread pool;
+# operasi array NumPy melepas GIL jadi tile berjalan paralel.
+# Filter ketetanggaan dihitung di format premultiplied supaya pixel
+# transparan tidak "bocor" warnanya ke sekitarnya.
+
+_pool = None
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+    return _pool
+
+
+class Filter:
+    # params: [(nama, min, max, default, step)], spatial: param dalam pixel
+    # (diskalakan untuk preview), margin(params) -> lebar halo
+    def __init__(self, run, params=(), spatial=(), margin=None, premultiplied=False):
+        self.run = run
+        self.params = list(params)
+        self.spatial = spatial
+        self.margin = margin or (lambda params: 0)
+        self.premultiplied = premultiplied
+
+    def defaults(self):
+        return {name: default for name, _, _, default, _ in self.params}
+
+
+# Kernel: block uint8 (h + 2m, w + 2m, 4) -> hasil (h, w, 4)
+
+def _gaussian_taps(sigma):
+    radius = max(1, int(3 * sigma + 0.5))
+    x = np.arange(-radius, radius + 1, dtype=np.float32)
+    taps = np.exp(-x * x / (2 * sigma * sigma))
+    return taps / taps.sum()
+
+
+def _separable(block, taps):
+    # Konvolusi horizontal lalu vertikal, float32 (buffer dipakai ulang)
+    m = len(taps) // 2
+    src = block.astype(np.float32)
+    h, w = src.shape[0] - 2 * m, src.shape[1] - 2 * m
+    tmp = src[:, m:m + w] * taps[m]
+    scratch = np.empty_like(tmp)
+    for i, t in enumerate(taps):
+        if i != m:
+            tmp += np.multiply(src[:, i:i + w], t, out=scratch)
+    out = tmp[m:m + h] * taps[m]
+    scratch = scratch[:h]
+    for i, t in enumerate(taps):
+        if i != m:
+            out += np.multiply(tmp[i:i + h], t, out=scratch)
+    return out
+
+
+def _to_uint8(values):
+    return np.clip(values + 0.5, 0, 255).astype(np.uint8)
+
+
+def gaussian_blur(block, m, radius):
+    return _to_uint8(_separable(block, _gaussian_taps(radius / 3.0)))
+
+
+def _box_sum(src, r, axis):
+    # Jumlah jendela 2r+1 sepanjang axis (0 atau 1) lewat cumsum
+    c = np.cumsum(src, axis=axis, dtype=np.float32)
+    n = src.shape[axis] - 2 * r
+    if axis == 0:
+        out = c[2 * r:2 * r + n].copy()
+        out[1:] -= c[:n - 1]
+    else:
+        out = c[:, 2 * r:2 * r + n].copy()
+        out[:, 1:] -= c[:, :n - 1]
+    return out
+
+
+def box_blur(block, m, radius):
+    radius = int(radius)
+    rows = _box_sum(block, radius, 1)
+    return _to_uint8(_box_sum(rows, radius, 0) / float((2 * radius + 1) ** 2))
+
+
+def sharpen(block, m, amount, radius):
+    # Unsharp mask: src + amount * (src - blur)
+    blurred = _separable(block, _gaussian_taps(radius / 3.0))
+    src = block[m:block.shape[0] - m, m:block.shape[1] - m].astype(np.float32)
+    out = src + amount * (src - blurred)
+    # Premultiplied: warna tidak boleh melebihi alpha
+    out[..., :3] = np.minimum(out[..., :3], out[..., 3:])
+    return _to_uint8(out)
+
+
+def brightness_contrast(block, m, brightness, contrast):
+    contrast = min(contrast, 99)
+    factor = (100.0 + contrast) / (100.0 - contrast)
+    lut = np.arange(256, dtype=np.float32)
+    lut = _to_uint8((lut - 127.5) * factor + 127.5 + brightness * 2.55)
+    out = block.copy()
+    out[..., :3] = lut[block[..., :3]]
+    return out
+
+
+def grayscale(block, m):
+    # BGRA di memori: luma dari R, G, B
+    luma = block[..., 2] * 0.299 + block[..., 1] * 0.587 + block[..., 0] * 0.114
+    out = block.copy()
+    out[..., :3] = _to_uint8(luma)[..., None]
+    return out
+
+
+def invert(block, m):
+    out = block.copy()
+    np.subtract(255, block[..., :3], out=out[..., :3])
+    return out
+
+
+def convolve(block, m, kernel):
+    # Kernel bebas (list baris, ukuran ganjil), dinormalisasi kalau jumlahnya != 0
+    k = np.asarray(kernel, np.float32)
+    total = k.sum()
+    if total != 0:
+        k = k / total
+    src = block.astype(np.float32)
+    kh, kw = k.shape
+    h, w = src.shape[0] - (kh - 1), src.shape[1] - (kw - 1)
+    out = np.zeros((h, w, 4), np.float32)
+    for y in range(kh):
+        for x in range(kw):
+            if k[y, x]:
+                out += k[y, x] * src[y:y + h, x:x + w]
+    out[..., 3] = src[kh // 2:kh // 2 + h, kw // 2:kw // 2 + w, 3]
+    out[..., :3] = np.minimum(out[..., :3], out[..., 3:])
+    return _to_uint8(out)
+
+
+def _kernel_margin(params):
+    k = np.asarray(params['kernel'])
+    if k.ndim != 2 or k.shape[0] % 2 == 0 or k.shape[1] % 2 == 0:
+        raise ValueError('kernel must be a 2D list with odd width and height')
+    if k.shape[0] != k.shape[1]:
+        raise ValueError('kernel must be square')
+    return k.shape[0] // 2
+
+
+FILTERS = OrderedDict([
+    ('gaussian_blur', Filter(gaussian_blur, [('radius', 1, 100, 4, 1)], ('radius',),
+                             lambda p: max(1, int(p['radius'] + 0.5)), True)),
+    ('box_blur', Filter(box_blur, [('radius', 1, 100, 3, 1)], ('radius',),
+                        lambda p: int(p['radius']), True)),
+    ('sharpen', Filter(sharpen, [('amount', 0, 5, 1.0, 0.1), ('radius', 1, 20, 2, 1)],
+                       ('radius',), lambda p: max(1, int(p['radius'] + 0.5)), True)),
+    ('brightness_contrast', Filter(brightness_contrast,
+                                   [('brightness', -100, 100, 0, 1),
+                                    ('contrast', -100, 100, 0, 1)])),
+    ('grayscale', Filter(grayscale)),
+    ('invert', Filter(invert)),
+    ('convolve', Filter(convolve, margin=_kernel_margin, premultiplied=True)),
+])
+
+KERNELS = OrderedDict([
+    ('sharpen', [[0, -1, 0], [-1, 5, -1], [0, -1, 0]]),
+    ('edge', [[-1, -1, -1], [-1, 8, -1], [-1, -1, -1]]),
+    ('emboss', [[-2, -1, 0], [-1, 1, 1], [0, 1, 2]]),
+    ('smooth', [[1, 2, 1], [2, 4, 2], [1, 2, 1]]),
+])
+
+
+def get(name):
+    try:
+        return FILTERS[name]
+    except KeyError:
+        raise ValueError(f'unknown filter: {name}') from None
+
+
+def apply(image, name, params, rect=None, tile_size=128, parallel_pixels=256 * 256):
+    # Hasil filter untuk area rect dari image (TiledImage/LayerStack/QImage,
+    # cukup punya rect() dan copy(rect)), sebagai QImage seukuran rect.
+    # Pixel di luar rect dipakai sebagai halo, tepi image diulang.
+    f = get(name)
+    params = {**f.defaults(), **params}
+    bounds = image.rect()
+    rect = bounds if rect is None else rect.normalized().intersected(bounds)
+    fmt = QImage.Format_ARGB32_Premultiplied if f.premultiplied else QImage.Format_ARGB32
+    if rect.isEmpty():
+        return QImage(0, 0, fmt)
+    m = f.margin(params)
+    read = _reader(image, rect.adjusted(-m, -m, m, m).intersected(bounds), fmt)
+    out = QImage(rect.width(), rect.height(), fmt)
+    _process(f, params, m, read, bounds, rect, out, tile_size, parallel_pixels)
+    return out
+
+
+def _reader(image, rect, fmt):
+    # read(top, left, bottom, right) -> array uint8 (h, w, 4) pixel image
+    # (koordinat image, di dalam rect) dalam format fmt. Bits QImage / tile
+    # yang formatnya sudah fmt dibaca lewat view NumPy tanpa copy, tile
+    # seragam jadi view broadcast satu pixel; hanya block yang melintasi
+    # batas tile dirakit. Tile diambil di thread pemanggil (tile_state bisa
+    # memuat tile dari spill/project), worker hanya membaca view.
+    if not hasattr(image, 'tile_keys'):
+        ox = oy = 0
+        if image.format() != fmt:
+            image, ox, oy = image.copy(rect).convertToFormat(fmt), rect.x(), rect.y()
+        s = channels(image_array(image, readonly=True))
+
+        def read(top, left, bottom, right, image=image):  # image dipegang selama view dipakai
+            return s[top - oy:bottom - oy, left - ox:right - ox]
+        return read
+    views = {}  # key -> (tile rect, QImage yang dipegang view, view)
+    for key, tile_rect in image.tile_keys(rect):
+        tile = image.tile_state(key)
+        if isinstance(tile, int):
+            pixel = QImage(1, 1, QImage.Format_ARGB32)
+            pixel.fill(QColor.fromRgba(tile))
+            tile = pixel.convertToFormat(fmt)
+            view = np.broadcast_to(channels(image_array(tile, readonly=True)),
+                                   (tile_rect.height(), tile_rect.width(), 4))
+        else:
+            if tile.format() != fmt:
+                tile = tile.convertToFormat(fmt)
+            view = channels(image_array(tile, readonly=True))
+        views[key] = (tile_rect, tile, view)
+    ts = image.tile_size
+
+    def read(top, left, bottom, right):
+        keys = [(tx, ty) for ty in range(top // ts, (bottom - 1) // ts + 1)
+                for tx in range(left // ts, (right - 1) // ts + 1)]
+        if len(keys) == 1:
+            r, _, view = views[keys[0]]
+            return view[top - r.y():bottom - r.y(), left - r.x():right - r.x()]
+        block = np.empty((bottom - top, right - left, 4), np.uint8)
+        for key in keys:
+            r, _, view = views[key]
+            y0, y1 = max(top, r.y()), min(bottom, r.y() + r.height())
+            x0, x1 = max(left, r.x()), min(right, r.x() + r.width())
+            block[y0 - top:y1 - top, x0 - left:x1 - left] = \
+                view[y0 - r.y():y1 - r.y(), x0 - r.x():x1 - r.x()]
+        return block
+    return read
+
+
+def _process(f, params, m, read, bounds, rect, out, tile_size, parallel_pixels):
+    # Tile kecil (plus halo) supaya buffer float tiap tile muat di cache CPU
+    d = channels(image_array(out))
+    h, w = out.height(), out.width()
+    ox, oy = rect.x(), rect.y()
+    bw, bh = bounds.width(), bounds.height()
+
+    def tile(pos):
+        x0, y0 = pos
+        x1, y1 = min(x0 + tile_size, w), min(y0 + tile_size, h)
+        top, bottom = oy + y0 - m, oy + y1 + m
+        left, right = ox + x0 - m, ox + x1 + m
+        lo, hi = max(top, 0), min(bottom, bh)
+        l2, r2 = max(left, 0), min(right, bw)
+        block = read(lo, l2, hi, r2)
+        pad = ((lo - top, bottom - hi), (l2 - left, right - r2), (0, 0))
+        if any(a or b for a, b in pad):
+            block = np.pad(block, pad, mode='edge')
+        d[y0:y1, x0:x1] = f.run(block, m, **params)
+
+    tiles = [(x, y) for y in range(0, h, tile_size) for x in range(0, w, tile_size)]
+    if w * h >= parallel_pixels and len(tiles) > 1:
+        list(_executor().map(tile, tiles))
+    else:
+        for pos in tiles:
+            tile(pos)
+
+
+def preview(image, name, params, rect=None, max_size=512):
+    # Preview resolusi rendah: area diperkecil sampai sisi terpanjang
+    # <= max_size, param spasial ikut diperkecil. Return QImage kecil yang
+    # digambar ulang seukuran rect oleh pemanggil.
+    f = get(name)
+    params = {**f.defaults(), **params}
+    rect = image.rect() if rect is None else rect.normalized().intersected(image.rect())
+    if rect.isEmpty():
+        return QImage()
+    factor = min(1.0, max_size / max(rect.width(), rect.height()))
+    small = image.copy(rect)
+    if factor < 1.0:
+        small = small.scaled(max(1, int(rect.width() * factor)),
+                             max(1, int(rect.height() * factor)),
+                             Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        for key in f.spatial:
+            params[key] = max(1, params[key] * factor)
+    return apply(small, name, params, QRect(small.rect()))
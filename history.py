@@ -0,0 +1,120 @@
+from collections import deque
+
+from PyQt5.QtCore import QRect
+
+# Undo/redo berbasis tile: tiap entry hanya menyimpan state tile yang
+# berubah (lihat TiledImage.tile_state), dan total memori history dibatasi
+# dalam byte. Tile QImage di-share dengan image (copy-on-write), jadi
+# pixel baru benar-benar disalin saat tile itu ditulis.
+
+
+class History:
+    def __init__(self, budget=64 * 1024 * 1024):
+        self.budget = budget
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.nbytes = 0
+        self._pending = None
+        # Key yang berubah lewat commit/undo/redo/rollback, urut, dikosongkan
+        # oleh pemakainya (session.py mengirim state terbaru key-key ini)
+        self.changed = {}
+
+    def begin(self):
+        # Mulai operasi baru; kalau masih ada yang terbuka, lanjutkan yang itu
+        if self._pending is None:
+            self._pending = {}
+
+    def is_open(self):
+        return self._pending is not None
+
+    def touch(self, image, rect):
+        # Simpan state tile sebelum area rect ditulis
+        self.touch_keys(image, (key for key, _ in image.tile_keys(rect)))
+
+    def touch_keys(self, image, keys):
+        if self._pending is None:
+            self.begin()
+        for key in keys:
+            if key not in self._pending:
+                self._pending[key] = image.tile_snapshot(key)
+
+    def commit(self, image):
+        pending, self._pending = self._pending, None
+        if not pending:
+            return
+        # Buang tile yang ternyata tidak berubah
+        tiles = [(key, before) for key, before in pending.items()
+                 if not _same(image.tile_state(key), before)]
+        if not tiles:
+            return
+        self.changed.update(dict.fromkeys(key for key, _ in tiles))
+        self._clear_redo()
+        self._push(self.undo_stack, tiles, image)
+        while self.nbytes > self.budget and len(self.undo_stack) > 1:
+            self.nbytes -= self.undo_stack.popleft()[1]
+
+    def rollback(self, image):
+        # Batalkan operasi yang sedang terbuka, kembalikan state tile lama
+        pending, self._pending = self._pending, None
+        if not pending:
+            return QRect()
+        self.changed.update(dict.fromkeys(pending))
+        return self._restore(image, list(pending.items()))[1]
+
+    def undo(self, image):
+        return self._swap(self.undo_stack, self.redo_stack, image)
+
+    def redo(self, image):
+        return self._swap(self.redo_stack, self.undo_stack, image)
+
+    def load(self, undo, redo, image):
+        # Isi ulang stack dari daftar entry [(key, state), ...] (lihat journal)
+        self.clear()
+        for tiles in undo:
+            self._push(self.undo_stack, tiles, image)
+        for tiles in redo:
+            self._push(self.redo_stack, tiles, image)
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.nbytes = 0
+        self._pending = None
+
+    def _swap(self, src, dst, image):
+        if not src:
+            return QRect()
+        tiles, size = src.pop()
+        self.nbytes -= size
+        self.changed.update(dict.fromkeys(key for key, _ in tiles))
+        swapped, dirty = self._restore(image, tiles)
+        self._push(dst, swapped, image)
+        return dirty
+
+    def _restore(self, image, tiles):
+        # Pasang state tile lama, return (state tile saat ini, dirty rect)
+        current = []
+        dirty = QRect()
+        for key, state in tiles:
+            current.append((key, image.tile_snapshot(key)))
+            # Sebelum dan sesudah: area item non-tile (shape) bisa berubah
+            dirty = dirty.united(image.tile_rect(key))
+            image.set_tile_state(key, state)
+            dirty = dirty.united(image.tile_rect(key))
+        return current, dirty
+
+    def _push(self, stack, tiles, image):
+        size = sum(image.tile_bytes(state) for _, state in tiles)
+        stack.append((tiles, size))
+        self.nbytes += size
+
+    def _clear_redo(self):
+        for _, size in self.redo_stack:
+            self.nbytes -= size
+        self.redo_stack.clear()
+
+
+def _same(a, b):
+    if isinstance(a, int) or isinstance(b, int):
+        return isinstance(a, int) and isinstance(b, int) and a == b
+    return a == b
@@ -0,0 +1,30 @@
+from PyQt5.QtGui import QImage
+
+from startup import lazy_module
+
+np = lazy_module('numpy')  # di-import saat pertama dipakai (startup.py)
+
+# Akses langsung ke buffer QImage sebagai array NumPy (tanpa copy)
+
+
+def image_array(image, readonly=False):
+    # View (h, w) uint32 di atas bits ARGB32 milik image. Nilai tiap elemen
+    # sama dengan QColor.rgba() (0xAARRGGBB). View hanya valid selama image
+    # hidup dan tidak di-detach, jadi jangan disimpan lama-lama.
+    # readonly=True memakai constBits() supaya image yang di-share tidak di-detach.
+    if image.format() not in (QImage.Format_ARGB32, QImage.Format_RGB32,
+                              QImage.Format_ARGB32_Premultiplied,
+                              QImage.Format_RGBA8888):
+        raise ValueError('image must be a 32-bit QImage')
+    ptr = image.constBits() if readonly else image.bits()
+    ptr.setsize(image.sizeInBytes())
+    arr = np.frombuffer(ptr, np.uint32)
+    if readonly:
+        arr.flags.writeable = False
+    arr = arr.reshape(image.height(), image.bytesPerLine() // 4)
+    return arr[:, :image.width()]
+
+
+def channels(arr):
+    # View (..., 4) uint8 per channel (urutan memori BGRA di little-endian)
+    return arr.view(np.uint8).reshape(arr.shape + (4,))
@@ -0,0 +1,228 @@
+import glob
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from PyQt5.QtGui import QImage
+
+import project
+from tiles import PackedTile, decode_tile, encode_tile
+
+# Journal operasi append-only + snapshot terkompresi untuk autosave dan
+# crash recovery. Isi direktori:
+#   journal-<base>.jsonl   operasi dengan seq > base, satu per baris
+#   snapshot-<seq>.mps     semua layer + history pada seq tersebut
+# Recovery = snapshot terbaru + replay operasi setelahnya, jadi waktunya
+# hanya bergantung pada jumlah operasi sejak snapshot terakhir. File yang
+# rusak dipindah ke <nama>.corrupt (snapshot: coba yang lebih lama, lalu
+# dokumen kosong; segment: bagian yang masih utuh dipertahankan), journal
+# tetap aktif setelahnya.
+
+MAGIC = b'MPSNAP1\n'
+# Error yang berarti isi file / op rusak, bukan bug
+CORRUPT = (OSError, ValueError, KeyError, TypeError, IndexError, struct.error, zlib.error)
+
+
+def default_directory():
+    return os.path.join(os.path.expanduser('~'), '.minipaint', 'session')
+
+
+class Journal:
+    def __init__(self, canvas, directory=None, snapshot_every=200, snapshot_interval=60.0):
+        self.canvas = canvas
+        self.directory = directory or default_directory()
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval = snapshot_interval
+        os.makedirs(self.directory, exist_ok=True)
+        self.seq = 0
+        self._since_snapshot = 0
+        self._last_snapshot = time.monotonic()
+        self._segment = None
+        self._replaying = False
+        self.corrupt = []  # file yang dipindah ke .corrupt saat recover
+        self._jobs = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name='journal-snapshot', daemon=True)
+        self._worker.start()
+
+    def recover(self):
+        # Pulihkan canvas dari isi direktori, return jumlah op yang di-replay.
+        # Apa pun hasilnya, operasi berikutnya dicatat ke segment baru.
+        import ops
+        base = 0
+        replayed = 0
+        try:
+            for seq, path in sorted(_seq_files(self.directory, 'snapshot-', '.mps'), reverse=True):
+                try:
+                    image, history = decode(path)
+                except CORRUPT:
+                    self._set_aside(path)
+                    continue
+                self.canvas.set_document(image, history)
+                base = seq
+                break
+            self._replaying = True
+            broken = False
+            for seg_base, path in sorted(_seq_files(self.directory, 'journal-', '.jsonl')):
+                if seg_base < base and not broken:
+                    continue
+                if broken:
+                    self._set_aside(path)
+                    continue
+                good = []  # baris yang sudah diterapkan / sudah ada di snapshot
+                for line, entry in _read_lines(path):
+                    try:
+                        seq = entry['seq'] if entry is not None else None
+                        if seq is not None and seq <= base:
+                            good.append(line)
+                            continue
+                        # Op harus lanjutan langsung dari state sekarang
+                        if seq != base + 1:
+                            raise ValueError(f'journal gap at seq {base + 1}')
+                        ops.apply(self.canvas, entry['op'])
+                    except CORRUPT:
+                        broken = True
+                        break
+                    good.append(line)
+                    base = seq
+                    replayed += 1
+                if broken:
+                    self._set_aside(path, good)
+        finally:
+            self._replaying = False
+            self.seq = base
+            self._since_snapshot = replayed
+            self._open_segment()
+            self.canvas.operation.connect(self.append)
+        return replayed
+
+    def _set_aside(self, path, keep=None):
+        # Pindah ke .corrupt; keep = baris yang masih utuh ditulis ulang
+        os.replace(path, path + '.corrupt')
+        self.corrupt.append(path + '.corrupt')
+        if keep:
+            with open(path, 'w') as f:
+                f.writelines(keep)
+
+    def append(self, op):
+        if self._replaying:
+            return
+        self.seq += 1
+        self._segment.write(json.dumps({'seq': self.seq, 'op': op}) + '\n')
+        self._segment.flush()
+        self._since_snapshot += 1
+        if (self._since_snapshot >= self.snapshot_every
+                or time.monotonic() - self._last_snapshot >= self.snapshot_interval):
+            self.snapshot()
+
+    def snapshot(self, wait=False):
+        # Ambil state (murah, copy-on-write) di thread GUI, encode di background
+        canvas = self.canvas
+        if canvas.history.is_open() or canvas.selected_image is not None or self._since_snapshot == 0:
+            return
+        state = project.document_state(canvas.image, canvas.history)
+        self._since_snapshot = 0
+        self._last_snapshot = time.monotonic()
+        self._open_segment()
+        self._jobs.put((self.seq, state))
+        if wait:
+            self._jobs.join()
+
+    def close(self):
+        self.snapshot(wait=True)
+        self._jobs.put(None)
+        self._worker.join()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _open_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+        path = os.path.join(self.directory, f'journal-{self.seq:012d}.jsonl')
+        self._segment = open(path, 'a')
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            try:
+                if job is None:
+                    return
+                seq, state = job
+                encode(state, os.path.join(self.directory, f'snapshot-{seq:012d}.mps'))
+                # Snapshot baru sudah aman di disk, file lama boleh dibuang
+                for old_seq, path in _seq_files(self.directory, 'snapshot-', '.mps'):
+                    if old_seq < seq:
+                        os.remove(path)
+                for base, path in _seq_files(self.directory, 'journal-', '.jsonl'):
+                    if base < seq:
+                        os.remove(path)
+            finally:
+                self._jobs.task_done()
+
+
+def encode(state, path):
+    # state dari project.document_state; tile disimpan sebagai blob di
+    # belakang header, tile yang di-share cukup sekali
+    blobs = []
+    refs = {}
+
+    def ref(value):
+        if isinstance(value, PackedTile):
+            key = (id(value.source), value.offset)
+            if key not in refs:
+                blobs.append(value.source.read(value.offset, value.length))
+                refs[key] = len(blobs) - 1
+            return {'blob': refs[key]}
+        key = value.cacheKey()
+        if key not in refs:
+            blobs.append(encode_tile(value))
+            refs[key] = len(blobs) - 1
+        return {'blob': refs[key]}
+
+    data = json.dumps(project.to_index(state, ref)).encode()
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<II', len(data), len(blobs)))
+        f.write(data)
+        for blob in blobs:
+            f.write(struct.pack('<I', len(blob)))
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def decode(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'not a MiniPaint snapshot: {path}')
+        header_len, count = struct.unpack('<II', f.read(8))
+        header = json.loads(f.read(header_len))
+        blobs = []
+        for _ in range(count):
+            (size,) = struct.unpack('<I', f.read(4))
+            blobs.append(decode_tile(f.read(size)))
+    return project.from_index(header, lambda ref: QImage(blobs[ref['blob']]))
+
+
+def _seq_files(directory, prefix, suffix):
+    for path in glob.glob(os.path.join(directory, prefix + '*' + suffix)):
+        name = os.path.basename(path)[len(prefix):-len(suffix)]
+        if name.isdigit():
+            yield int(name), path
+
+
+def _read_lines(path):
+    # (baris, entry); entry None kalau baris rusak (mis. terpotong saat crash)
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = None
+            yield line, entry if isinstance(entry, dict) and line.endswith('\n') else None
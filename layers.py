@@ -0,0 +1,317 @@
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QRect, QSize
+from PyQt5.QtGui import QColor, QImage, QPainter
+
+from tiles import TiledImage, write_png
+from vector import ShapeLayer
+
+# Layer stack: tiap layer sebuah TiledImage dengan opacity dan blend mode.
+# Hasil gabungan disimpan per tile (composite cache) dan hanya tile yang
+# disentuh edit yang digabung ulang, jadi biaya per frame tidak naik
+# dengan jumlah layer. Floating selection jadi layer sementara tepat di
+# atas layer aktif (memakai opacity dan blend mode layer aktif).
+#
+# Untuk History, LayerStack punya API tile yang sama dengan TiledImage,
+# dengan key (layer id, tx, ty) untuk tile layer aktif dan ('shape', id)
+# untuk shape vektor.
+#
+# Shape vektor (vector.ShapeLayer) adalah overlay milik dokumen, bukan
+# milik salah satu layer: selalu digambar di atas semua layer, dengan
+# opacity penuh dan blend normal, dan tidak ikut urutan, opacity, blend
+# mode, maupun visible layer mana pun. Overlay tidak masuk composite cache:
+# copy() (juga export dan save) menggambarnya per permintaan, sedangkan
+# Canvas pada zoom >= 1 memakai RasterView lalu merasterisasi shape pada
+# zoom tersebut (vector.ShapeCache) supaya tetap tajam. Hasilnya sama di
+# layar dan di file.
+
+BLEND_MODES = OrderedDict([
+    ('normal', QPainter.CompositionMode_SourceOver),
+    ('multiply', QPainter.CompositionMode_Multiply),
+    ('screen', QPainter.CompositionMode_Screen),
+    ('overlay', QPainter.CompositionMode_Overlay),
+    ('darken', QPainter.CompositionMode_Darken),
+    ('lighten', QPainter.CompositionMode_Lighten),
+    ('add', QPainter.CompositionMode_Plus),
+    ('difference', QPainter.CompositionMode_Difference),
+])
+
+
+class Layer:
+    def __init__(self, id, name, image, opacity=1.0, blend='normal', visible=True):
+        self.id = id
+        self.name = name
+        self.image = image
+        self.opacity = opacity
+        self.blend = blend
+        self.visible = visible
+
+    def is_plain(self):
+        return self.visible and self.opacity >= 1.0 and self.blend == 'normal'
+
+
+class LayerStack:
+    def __init__(self, width, height, fill=Qt.white, tile_size=128,
+                 spill=False, max_cached=2048):
+        self._width = width
+        self._height = height
+        self.tile_size = tile_size
+        self.spill = spill
+        self.max_cached = max_cached
+        self.layers = []  # bawah -> atas
+        self.active = 0
+        self.next_id = 1
+        self.floating = None  # (QImage, QPoint) selama ada floating selection
+        self._cache = OrderedDict()  # (tx, ty) -> int | QImage hasil gabungan
+        self.source = None  # file project asal (lihat TiledImage.source)
+        self.shapes = ShapeLayer(self.rect())
+        if fill is not None:
+            self.add_layer('Background', fill)
+
+    # Struktur layer
+
+    @property
+    def current(self):
+        return self.layers[self.active]
+
+    def add_layer(self, name=None, fill=Qt.transparent, index=None):
+        image = TiledImage(self._width, self._height, fill, self.tile_size, self.spill)
+        image.source = self.source
+        layer = Layer(self.next_id, name or f'Layer {self.next_id}', image)
+        self.next_id += 1
+        index = len(self.layers) if index is None else index
+        self.layers.insert(index, layer)
+        self.active = index
+        self.invalidate()
+        return layer
+
+    def remove_layer(self, index):
+        if len(self.layers) <= 1:
+            return False
+        del self.layers[index]
+        # Layer aktif tetap sama kalau yang dihapus ada di bawahnya
+        if index < self.active:
+            self.active -= 1
+        self.active = min(self.active, len(self.layers) - 1)
+        self.invalidate()
+        return True
+
+    def move_layer(self, index, to):
+        to = max(0, min(to, len(self.layers) - 1))
+        layer = self.layers.pop(index)
+        self.layers.insert(to, layer)
+        if self.active == index:
+            self.active = to
+        elif index < self.active <= to:
+            self.active -= 1
+        elif to <= self.active < index:
+            self.active += 1
+        self.invalidate()
+
+    def set_layer(self, index, **props):
+        # name, opacity, blend, visible
+        layer = self.layers[index]
+        for name, value in props.items():
+            setattr(layer, name, value)
+        if set(props) - {'name'}:
+            self.invalidate()
+
+    def layer_by_id(self, id):
+        for layer in self.layers:
+            if layer.id == id:
+                return layer
+        return None
+
+    def set_floating(self, image, pos):
+        # Return rect yang berubah (posisi lama + baru)
+        dirty = self._floating_rect()
+        self.floating = (image, pos) if image is not None else None
+        dirty = dirty.united(self._floating_rect())
+        self.invalidate(dirty)
+        return dirty
+
+    def _floating_rect(self):
+        if self.floating is None:
+            return QRect()
+        image, pos = self.floating
+        return QRect(pos, image.size())
+
+    # API mirip QImage (hasil gabungan)
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def size(self):
+        return QSize(self._width, self._height)
+
+    def rect(self):
+        return QRect(0, 0, self._width, self._height)
+
+    def isNull(self):
+        return self._width <= 0 or self._height <= 0
+
+    def pixel(self, x, y):
+        ts = self.tile_size
+        state = self.composite((x // ts, y // ts))
+        if isinstance(state, int):
+            return state
+        return state.copy(x % ts, y % ts, 1, 1).convertToFormat(QImage.Format_ARGB32).pixel(0, 0)
+
+    def copy(self, rect=None, shapes=True):
+        rect = self.rect() if rect is None else rect.normalized()
+        out = QImage(rect.width(), rect.height(), QImage.Format_ARGB32)
+        out.fill(Qt.transparent)
+        painter = QPainter(out)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        for key, tile_rect in self.tile_keys_xy(rect):
+            state = self.composite(key)
+            target = tile_rect.translated(-rect.topLeft())
+            if isinstance(state, int):
+                if state:
+                    painter.fillRect(target, QColor.fromRgba(state))
+            else:
+                painter.drawImage(target.topLeft(), state)
+        if shapes and len(self.shapes):
+            painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+            painter.translate(-rect.left(), -rect.top())
+            self.shapes.draw(painter, rect)
+        painter.end()
+        return out
+
+    def save(self, path, fmt=None, quality=-1):
+        if (fmt or path.rsplit('.', 1)[-1]).lower() == 'png':
+            return write_png(path, self)
+        return self.copy().save(path, fmt, quality)
+
+    def snapshot(self):
+        # Salinan beku (copy-on-write) untuk dibaca thread lain
+        copy = LayerStack(self._width, self._height, None, self.tile_size)
+        copy.active = self.active
+        copy.next_id = self.next_id
+        for layer in self.layers:
+            copy.layers.append(Layer(layer.id, layer.name, layer.image.snapshot(),
+                                     layer.opacity, layer.blend, layer.visible))
+        if self.floating is not None:
+            copy.floating = (QImage(self.floating[0]), self.floating[1])
+        copy.shapes = self.shapes.copy()
+        return copy
+
+    # Composite cache
+
+    def invalidate(self, rect=None):
+        # Buang hasil gabungan tile di rect, None = semua
+        if rect is None:
+            self._cache.clear()
+            return
+        if self._cache:
+            for key, _ in self.tile_keys_xy(rect):
+                self._cache.pop(key, None)
+
+    def composite(self, key):
+        state = self._cache.get(key)
+        if state is not None:
+            self._cache.move_to_end(key)
+            return state
+        state, cacheable = self._composite(key)
+        if not cacheable:
+            return state
+        self._cache[key] = state
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return state
+
+    def _composite(self, key):
+        rect = self.tile_rect(key)
+        floating = self.floating is not None and self._floating_rect().intersects(rect)
+        visible = [layer for layer in self.layers if layer.visible and layer.opacity > 0]
+        if not floating and len(visible) == 1 and visible[0].is_plain():
+            # Satu layer biasa: tile layer dipakai langsung tanpa disalin
+            return visible[0].image.tile_state(key), False
+        if not visible:
+            return 0, False
+        out = QImage(rect.width(), rect.height(), QImage.Format_ARGB32_Premultiplied)
+        out.fill(Qt.transparent)
+        painter = QPainter(out)
+        current = self.current
+        for layer in visible:
+            painter.setOpacity(layer.opacity)
+            painter.setCompositionMode(BLEND_MODES[layer.blend])
+            state = layer.image.tile_state(key)
+            if isinstance(state, int):
+                painter.fillRect(out.rect(), QColor.fromRgba(state))
+            else:
+                painter.drawImage(0, 0, state)
+            if floating and layer is current:
+                image, pos = self.floating
+                painter.drawImage(pos - rect.topLeft(), image)
+        painter.end()
+        return out, True
+
+    # Akses per tile untuk History: key (layer id, tx, ty)
+
+    def tile_keys_xy(self, rect):
+        rect = rect.normalized().intersected(self.rect())
+        if rect.isEmpty():
+            return
+        ts = self.tile_size
+        for ty in range(rect.top() // ts, rect.bottom() // ts + 1):
+            for tx in range(rect.left() // ts, rect.right() // ts + 1):
+                yield (tx, ty), self.tile_rect((tx, ty))
+
+    def tile_keys(self, rect):
+        lid = self.current.id
+        for (tx, ty), tile_rect in self.current.image.tile_keys(rect):
+            yield (lid, tx, ty), tile_rect
+
+    def tile_rect(self, key):
+        if key[0] == 'shape':
+            shape = self.shapes.get(key[1])
+            return QRect() if shape is None else shape.bounds()
+        ts = self.tile_size
+        return QRect(key[-2] * ts, key[-1] * ts, ts, ts).intersected(self.rect())
+
+    def tile_state(self, key):
+        if key[0] == 'shape':
+            return self.shapes.get(key[1])
+        layer = self.layer_by_id(key[0])
+        return 0 if layer is None else layer.image.tile_state(key[1:])
+
+    def tile_snapshot(self, key):
+        if key[0] == 'shape':
+            return self.shapes.get(key[1])  # Shape tidak pernah diubah di tempat
+        layer = self.layer_by_id(key[0])
+        return 0 if layer is None else layer.image.tile_snapshot(key[1:])
+
+    def set_tile_state(self, key, state):
+        # Tile layer yang sudah dihapus diabaikan
+        if key[0] == 'shape':
+            self.shapes.put(key[1], state)
+            return
+        layer = self.layer_by_id(key[0])
+        if layer is not None:
+            layer.image.set_tile_state(key[1:], state)
+            self._cache.pop(key[1:], None)
+
+    def tile_bytes(self, state):
+        return state.sizeInBytes() if isinstance(state, QImage) else 64
+
+
+class RasterView:
+    # Hasil gabungan tanpa shape vektor, untuk RenderCache pada zoom >= 1
+    def __init__(self, stack):
+        self.stack = stack
+
+    def width(self):
+        return self.stack.width()
+
+    def height(self):
+        return self.stack.height()
+
+    def rect(self):
+        return self.stack.rect()
+
+    def copy(self, rect=None):
+        return self.stack.copy(rect, shapes=False)
@@ -1,9 +1,37 @@
+import startup
+startup.mark('start')  # sebelum import PyQt/NumPy, lihat bench.py --startup
+
+import os
 import sys
+import time
+
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QWidget, QLabel, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog, QToolBar, QAction, QMessageBox, QColorDialog, QSlider, QSpinBox, QDockWidget
+    QApplication, QMainWindow, QWidget, QLabel, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog, QToolBar, QAction, QMessageBox, QColorDialog, QSlider, QSpinBox, QDockWidget, QInputDialog, QProgressBar, QListWidget, QListWidgetItem, QComboBox, QCheckBox,
+    QDialog, QDialogButtonBox, QFormLayout, QLineEdit, QTabWidget, QTabBar
 )
-from PyQt5.QtGui import QPainter, QPen, QBrush, QColor, QImage, QPixmap, QMouseEvent, QKeySequence, QTransform
-from PyQt5.QtCore import Qt, QPoint, QRect
+from PyQt5.QtGui import QPainter, QPen, QBrush, QColor, QPixmap, QMouseEvent, QKeySequence
+from PyQt5.QtCore import Qt, QPoint, QRect, QRectF, QTimer, pyqtSignal
+
+import documents
+import export
+import fill
+import filters
+import perf
+import project
+import raster
+import selection
+from history import History
+from imagebuf import image_array
+from layers import BLEND_MODES, LayerStack, RasterView
+from vector import ShapeCache
+from journal import Journal
+from render import RenderCache
+from stroke import StrokeEngine
+from transform import TransformCache
+
+# Sesi bersama menarik asyncio/ssl, baru di-import saat host/join
+session = startup.lazy_module('session')
+startup.mark('imports')
 
 # Mode operasi canvas
 
@@ -15,6 +43,7 @@ class Mode:
     CIRCLE = 'circle'
     FILL = 'fill'
     SELECT = 'select'
+    WAND = 'wand'
     MOVE = 'move'
     ROTATE = 'rotate'
     SCALE = 'scale'
@@ -23,12 +52,17 @@ class Mode:
 
 
 class Canvas(QWidget):
+    # Setiap operasi yang di-commit, dalam bentuk dict yang bisa di-serialisasi (lihat ops.py)
+    operation = pyqtSignal(dict)
+    layers_changed = pyqtSignal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.base_size = (800, 600)
         self.setMinimumSize(*self.base_size)
-        self.image = QImage(*self.base_size, QImage.Format_ARGB32)
-        self.image.fill(Qt.white)
+        # Stack layer, tiap layer disimpan per tile (lihat layers.py).
+        # self.image = hasil gabungan, gambar masuk ke layer aktif
+        self.image = LayerStack(*self.base_size)
         self.drawing = False
         self.last_point = QPoint()
         self.start_point = QPoint()
@@ -37,12 +71,29 @@ class Canvas(QWidget):
         self.brush_color = Qt.black
         self.brush_size = 3
         self.stroke_size = 3
-        self.undo_stack = []
-        self.redo_stack = []
+        self.history = History()
+        self._render = RenderCache()
         self.selection_rect = QRect()
         self.selected_image = None
+        # Selection non-persegi: mask bool seukuran selection_rect (None =
+        # seluruh rect), plus langkah-langkah pembentuknya untuk operasi
+        self.selection_mask = None
+        self.selection_combine = selection.REPLACE
+        self._selection_steps = []
+        self._selection_base = (None, [])  # (region, steps) saat drag select gabungan
+        self._select_combine = selection.REPLACE
+        self._mask_image = None  # mask sebagai QImage, untuk membersihkan area
+        self._outline = None  # QImage tepi mask untuk ditampilkan
         self.transforming = False
         self.flood_fill_type = 4
+        self.fill_tolerance = 0
+        self.vector_shapes = False  # LINE/RECT/CIRCLE disimpan sebagai shape vektor
+        self.raster_backend = raster.QPAINTER  # rasterizer LINE/RECT/CIRCLE/BRUSH
+        self.selected_shape = None
+        self._shape_drag = None  # (shape asli, posisi awal) saat shape digeser
+        self._shape_cache = ShapeCache()
+        self._filter_preview = None  # (rect image, QImage resolusi rendah)
+        self.project_file = None  # project.Chunks dokumen yang terakhir di-save/open
         self.zoom = 1.0
         self.setMouseTracking(True)
         self.setFocusPolicy(Qt.StrongFocus)
@@ -54,62 +105,446 @@ class Canvas(QWidget):
         self._pan_start = QPoint()
         self._pan_origin = QPoint()
         self._move_offset = QPoint(0, 0)  # Offset untuk move
+        self._transform_cache = TransformCache()
+        self._mask_cache = TransformCache()
+        # Brush: event mouse dikumpulkan lalu digambar sekali per frame
+        self._stroke = StrokeEngine()
+        self._stroke_timer = QTimer(self)
+        self._stroke_timer.setInterval(16)
+        self._stroke_timer.timeout.connect(self._flush_stroke)
+        self.perf = perf.Profiler()
+        self._hud_timer = QTimer(self)
+        self._hud_timer.setInterval(250)  # HUD di luar dirty rect tetap segar
+        self._hud_timer.timeout.connect(lambda: self.update(self.perf.hud_rect))
 
     def set_mode(self, mode):
-        self.mode = mode
-        if mode != Mode.SELECT:
+        self._end_stroke()
+        # Floating selection tetap hidup di mode transform, selain itu di-commit
+        if mode not in [Mode.SELECT, Mode.WAND, Mode.MOVE, Mode.ROTATE, Mode.SCALE]:
+            self.apply_transform()
             self.selection_rect = QRect()
             self.selected_image = None
             self.transforming = False
+            self._sync_floating()
+        self.mode = mode
         self.update()
 
     def set_brush_color(self, color):
         self.brush_color = color
-        self.update()
+        self._update_image_rect(self._preview_rect())
 
     def set_brush_size(self, size):
+        old = self._preview_rect()
         self.brush_size = size
         self.stroke_size = size
-        self.update()
+        self._update_image_rect(old, self._preview_rect())
+
+    def set_brush_spacing(self, spacing):
+        self._stroke.spacing = spacing
+
+    def set_brush_smoothing(self, smoothing):
+        self._stroke.smoothing = smoothing
 
     def set_stroke_size(self, size):
+        old = self._preview_rect()
         self.stroke_size = size
-        self.update()
+        self._update_image_rect(old, self._preview_rect())
 
     def set_flood_fill_type(self, t):
         self.flood_fill_type = t
 
+    def set_selection_combine(self, combine):
+        # Cara selection baru digabung dengan yang lama (lihat selection.COMBINE)
+        self.selection_combine = combine
+
+    def set_fill_tolerance(self, tolerance):
+        self.fill_tolerance = tolerance
+
+    def set_raster_backend(self, name):
+        raster.get(name)  # ValueError kalau tidak dikenal
+        self.raster_backend = name
+
+    def set_vector_shapes(self, enabled):
+        self.vector_shapes = enabled
+
+    def tool_state(self):
+        # Setelan tool (bukan dokumen), dibawa saat pindah tab
+        return {'mode': self.mode, 'color': _color_name(self.brush_color),
+                'brush_size': self.brush_size, 'stroke_size': self.stroke_size,
+                'spacing': self._stroke.spacing, 'smoothing': self._stroke.smoothing,
+                'fill_type': self.flood_fill_type, 'tolerance': self.fill_tolerance,
+                'vector': self.vector_shapes, 'raster': self.raster_backend,
+                'combine': self.selection_combine}
+
+    def set_tool_state(self, state):
+        self.set_mode(state['mode'])
+        self.brush_color = QColor(state['color'])
+        self.brush_size, self.stroke_size = state['brush_size'], state['stroke_size']
+        self._stroke.spacing, self._stroke.smoothing = state['spacing'], state['smoothing']
+        self.flood_fill_type, self.fill_tolerance = state['fill_type'], state['tolerance']
+        self.vector_shapes = state['vector']
+        self.set_raster_backend(state['raster'])
+        self.selection_combine = state['combine']
+
+    def drop_caches(self):
+        # Buang cache yang bisa dibangun ulang (composite, mip, shape)
+        self.image.invalidate()
+        self._render.invalidate()
+        self._shape_cache.invalidate()
+
+    def set_perf_hud(self, enabled):
+        self.perf.hud = enabled
+        if enabled:
+            self._hud_timer.start()
+        else:
+            self._hud_timer.stop()
+        self.update()
+
     def set_zoom(self, zoom):
         self.zoom = max(0.1, min(zoom, 16.0))
         self.update()
 
+    def view_state(self):
+        # Zoom/pan, disimpan di project dan state sesi (startup.py)
+        return {'zoom': self.zoom, 'pan': [self._pan.x(), self._pan.y()]}
+
+    def set_view_state(self, view):
+        self.set_zoom(view.get('zoom', 1.0))
+        self._pan = QPoint(*view.get('pan', (0, 0)))
+
     def clear(self):
-        self._push_undo()
-        self.image.fill(Qt.white)
+        self._end_stroke()
+        # Floating selection ikut hilang, satu entry undo dengan clear
+        self.selected_image = None
+        self.selection_rect = QRect()
+        self.transforming = False
+        self._sync_floating()
+        # Kosongkan layer aktif ke warna dasarnya (background putih, lainnya transparan)
+        layer = self.layer_image
+        self._touch(self.image.rect())
+        layer.fill(QColor.fromRgba(layer.default))
+        self._commit()
         self.update()
+        self._record({'op': 'clear'})
 
-    def save_image(self, path):
-        self.image.save(path)
+    def new_document(self, width, height):
+        # Dokumen besar (> 64 Mpx) boleh memindah tile dingin ke file
+        self.set_document(LayerStack(width, height,
+                                     spill=width * height > 64 * 1024 * 1024))
+        self._record({'op': 'new', 'size': [width, height]})
+
+    def set_document(self, image, history=None, project_file=None):
+        # Ganti image (dan history) tanpa merekam operasi, dipakai juga oleh recovery
+        self._end_stroke()
+        self.project_file = project_file
+        self.selected_image = None
+        self.selection_rect = QRect()
+        self.transforming = False
+        self.image = image
+        if history is None:
+            self.history.clear()
+        else:
+            self.history = history
+        self._filter_preview = None
+        self._render.invalidate()
+        self._shape_cache.invalidate()
+        self.update()
+        self.layers_changed.emit()
+
+    @property
+    def layer_image(self):
+        # TiledImage layer aktif, tujuan semua operasi gambar
+        return self.image.current.image
+
+    # Layer: perubahan struktur dicatat sebagai operasi, tapi tidak masuk undo
+
+    def add_layer(self, name=None):
+        self._layer_op({'op': 'layer', 'action': 'add', 'name': name},
+                       lambda: self.image.add_layer(name, index=self.image.active + 1))
+
+    def remove_layer(self, index=None):
+        index = self.image.active if index is None else index
+        self._layer_op({'op': 'layer', 'action': 'remove', 'index': index},
+                       lambda: self.image.remove_layer(index))
+
+    def select_layer(self, index):
+        if index == self.image.active:
+            return
+        self._layer_op({'op': 'layer', 'action': 'select', 'index': index},
+                       lambda: setattr(self.image, 'active', index))
+
+    def move_layer(self, index, to):
+        self._layer_op({'op': 'layer', 'action': 'move', 'index': index, 'to': to},
+                       lambda: self.image.move_layer(index, to))
+
+    def set_layer(self, index, **props):
+        # name, opacity (0..1), blend (lihat layers.BLEND_MODES), visible
+        self._layer_op({'op': 'layer', 'action': 'set', 'index': index, **props},
+                       lambda: self.image.set_layer(index, **props))
+
+    def _layer_op(self, op, apply):
+        self._end_stroke()
+        # Floating selection milik layer aktif, commit dulu
+        self.apply_transform()
+        apply()
+        self._render.invalidate()
+        self.update()
+        self.layers_changed.emit()
+        self._record(op)
+
+    def save_project(self, path):
+        # Dokumen native (.mpp). Save ulang ke file yang sama hanya menulis
+        # tile yang berubah sejak save terakhir.
+        self._end_stroke()
+        self.apply_transform()
+        with self.perf.span('project.save'):
+            self.project_file = project.save(path, self.image, self.history,
+                                             self.view_state(), self.project_file)
+
+    def open_project(self, path):
+        # Hanya index yang dibaca, tile di-decode saat pertama terlihat
+        with self.perf.span('project.open'):
+            image, history, view, chunks = project.load(path)
+        self.set_document(image, history, chunks)
+        self.set_view_state(view)
+        self._record({'op': 'open', 'path': os.path.abspath(path)})
+
+    def save_image(self, path, fmt=None, level=None):
+        # Sinkron (dipakai batch); UI memakai export.Exporter
+        export.encode(self.image, path, fmt, level)
 
     def undo(self):
-        if self.undo_stack:
-            self.redo_stack.append(self.image.copy())
-            self.image = self.undo_stack.pop()
+        self._end_stroke()
+        if self.selected_image is not None:
+            # Undo saat ada floating selection = batalkan selection
+            self.selected_image = None
+            self.selection_rect = QRect()
+            self.transforming = False
+            self._render.invalidate(self.history.rollback(self.image))
+            self._sync_floating()
             self.update()
+        elif self.history.undo_stack:
+            # Stack kosong: tidak ada yang dibatalkan, op tidak dicatat
+            with self.perf.span('undo'):
+                dirty = self.history.undo(self.image)
+            self._shape_changed(dirty)  # dirty bisa memuat shape
+            self._record({'op': 'undo'})
 
     def redo(self):
-        if self.redo_stack:
-            self.undo_stack.append(self.image.copy())
-            self.image = self.redo_stack.pop()
-            self.update()
+        self._end_stroke()
+        if self.selected_image is None and self.history.redo_stack:
+            with self.perf.span('redo'):
+                dirty = self.history.redo(self.image)
+            self._shape_changed(dirty)  # dirty bisa memuat shape
+            self._record({'op': 'redo'})
+
+    def _touch(self, rect):
+        # Area rect akan ditulis: catat ke history dan buang cache render-nya
+        with self.perf.span('history.touch'):
+            self.history.touch(self.image, rect)
+        self.image.invalidate(rect)
+        self._render.invalidate(rect)
+
+    def _commit(self):
+        with self.perf.span('history.commit'):
+            self.history.commit(self.image)
+        self.perf.counter('undo MB', self.history.nbytes / 2 ** 20)
+
+    def _begin_paint(self, rect):
+        # Painter di koordinat image, hasilnya baru masuk ke tile saat end()
+        self._touch(rect)
+        return self.layer_image.painter(rect)
+
+    def _record(self, op):
+        self.operation.emit(op)
+
+    def _flush_stroke(self, engine=None):
+        # Gambar semua event brush yang terkumpul sejak frame terakhir
+        engine = engine or self._stroke
+        if not engine.is_active():
+            return
+        with self.perf.span('brush'):
+            rect = engine.prepare()
+            if not rect.isEmpty():
+                self._touch(rect)
+                raster.get(engine.backend).dabs(self.layer_image, rect, engine.take_dabs(),
+                                                engine.size, engine.color.rgba())
+        if not rect.isEmpty():
+            self._update_image_rect(rect)
+
+    def _end_stroke(self, engine=None):
+        engine = engine or self._stroke
+        if engine.is_active():
+            self._flush_stroke(engine)
+            engine.end()
+            if engine is self._stroke:
+                self._stroke_timer.stop()
+            self._commit()
+            op = {'op': 'brush',
+                  'points': [[p.x(), p.y()] for p in engine.points],
+                  'color': _color_name(engine.color),
+                  'size': engine.size,
+                  'spacing': engine.spacing,
+                  'smoothing': engine.smoothing}
+            if engine.backend != raster.QPAINTER:
+                op['raster'] = engine.backend
+            self._record(op)
+
+    def brush_stroke(self, points, color=None, size=None, spacing=None, smoothing=None,
+                     backend=None):
+        # Satu stroke brush lengkap sekaligus (dipakai replay/batch).
+        # Tanpa titik tidak ada yang digambar dan tidak ada yang dicatat.
+        if not points:
+            return
+        engine = StrokeEngine(self._stroke.spacing if spacing is None else spacing,
+                              self._stroke.smoothing if smoothing is None else smoothing)
+        self.history.begin()
+        engine.begin(points[0], self.brush_color if color is None else color,
+                     self.brush_size if size is None else size,
+                     self.raster_backend if backend is None else backend)
+        for p in points[1:]:
+            engine.add_point(p)
+        self._end_stroke(engine)
+
+    def draw_shape(self, kind, start, end, color=None, width=None, vector=None, backend=None):
+        # LINE / RECT / CIRCLE dari start ke end di koordinat image
+        color = self.brush_color if color is None else color
+        width = self.stroke_size if width is None else width
+        if self.vector_shapes if vector is None else vector:
+            self._add_shape(kind, start, end, color, width)
+            return
+        backend = self.raster_backend if backend is None else backend
+        rect = self._pen_rect(start, end, width)
+        self.history.begin()
+        with self.perf.span('draw_shape'):
+            self._touch(rect)
+            raster.get(backend).shapes(self.layer_image, rect, kind,
+                                       [(start.x(), start.y(), end.x(), end.y())],
+                                       QColor(color).rgba(), width)
+        self._commit()
+        self._update_image_rect(rect)
+        op = {'op': kind, 'start': [start.x(), start.y()],
+              'end': [end.x(), end.y()],
+              'color': _color_name(color), 'width': width}
+        if backend != raster.QPAINTER:
+            op['raster'] = backend
+        self._record(op)
+
+    # Shape vektor: satu entry undo per operasi, key ('shape', id) di History
+
+    def _add_shape(self, kind, start, end, color, width):
+        shapes = self.image.shapes
+        self.history.touch_keys(self.image, [('shape', shapes.next_id)])
+        shape = shapes.create(kind, start, end, color, width)
+        self._commit()
+        self._shape_changed(shape.bounds())
+        self._record({'op': kind, 'start': [start.x(), start.y()],
+                      'end': [end.x(), end.y()],
+                      'color': _color_name(color), 'width': width, 'vector': True})
+
+    def move_shape(self, id, dx, dy):
+        shape = self.image.shapes.get(id)
+        if shape is None or (dx == 0 and dy == 0):
+            return
+        self.history.touch_keys(self.image, [('shape', id)])
+        self._shape_changed(self.image.shapes.put(id, shape.moved(dx, dy)))
+        self._commit()
+        self._record({'op': 'shape', 'action': 'move', 'id': id, 'move': [dx, dy]})
+
+    def delete_shape(self, id):
+        if self.image.shapes.get(id) is None:
+            return
+        self.history.touch_keys(self.image, [('shape', id)])
+        self._shape_changed(self.image.shapes.put(id, None))
+        self._commit()
+        if self.selected_shape == id:
+            self.selected_shape = None
+        self._record({'op': 'shape', 'action': 'delete', 'id': id})
+
+    def apply_tiles(self, tiles):
+        # State tile dari luar (delta sesi bersama, lihat session.py),
+        # tidak masuk undo
+        dirty = QRect()
+        cells = []
+        for key, state in tiles:
+            if key[0] == 'shape':
+                dirty = dirty.united(self.image.tile_rect(key))
+            else:
+                cells.append(key[1:])
+            self.image.set_tile_state(key, state)
+            if key[0] == 'shape':
+                dirty = dirty.united(self.image.tile_rect(key))
+        if cells:
+            # Bounding box semua tile sekaligus, bukan union per tile
+            ts = self.image.tile_size
+            xs, ys = [x for x, _ in cells], [y for _, y in cells]
+            dirty = dirty.united(QRect(min(xs) * ts, min(ys) * ts,
+                                       (max(xs) - min(xs) + 1) * ts, (max(ys) - min(ys) + 1) * ts))
+        self._shape_changed(dirty)
 
-    def _push_undo(self):
-        self.undo_stack.append(self.image.copy())
-        if len(self.undo_stack) > 50:
-            self.undo_stack.pop(0)
-        self.redo_stack.clear()
+    def _shape_changed(self, rect):
+        self._render.invalidate(rect)
+        self._shape_cache.invalidate(rect)
+        self._update_image_rect(rect)
+
+    def _pen_rect(self, p1, p2, width):
+        # Bounding rect (image space) dari p1..p2 ditambah lebar pen
+        pad = width // 2 + 2
+        return QRect(p1, p2).normalized().adjusted(-pad, -pad, pad, pad)
+
+    def _update_image_rect(self, *rects):
+        # Repaint hanya area widget yang menutupi rect-rect image ini
+        dirty = QRect()
+        for rect in rects:
+            if not rect.isEmpty():
+                dirty = dirty.united(self._to_widget_rect(rect.normalized()))
+        if not dirty.isEmpty():
+            # Pembulatan int di _to_widget_rect + border 2px selection
+            self.update(dirty.adjusted(-3, -3, 3, 3))
+
+    def _preview_rect(self):
+        # Area image yang ditempati preview rubber-band tool saat ini
+        if self.drawing and self.mode in [Mode.LINE, Mode.RECT, Mode.CIRCLE]:
+            return self._pen_rect(self.start_point, self.end_point, self.stroke_size)
+        if self.drawing and self.mode == Mode.SELECT:
+            return self.selection_rect
+        return QRect()
+
+    def _floating_rect(self, mode=None):
+        # Area image yang ditempati floating selection (setelah transformasi)
+        if self.selected_image is None or not self.selection_rect.isValid():
+            return QRect()
+        sel_rect = self.selection_rect.translated(self._move_offset)
+        size = self._transformed_selection(mode=mode).size()
+        return sel_rect.united(QRect(sel_rect.topLeft(), size))
+
+    def _selected_shape_rect(self):
+        shape = self.image.shapes.get(self.selected_shape) if self.selected_shape else None
+        return QRect() if shape is None else shape.bounds()
+
+    def _sync_floating(self):
+        # Samakan layer sementara di stack dengan floating selection saat ini
+        image = pos = None
+        if self.selected_image is not None and self.selection_rect.isValid():
+            image = self._transformed_selection()
+            pos = self.selection_rect.translated(self._move_offset).topLeft()
+        current = self.image.floating
+        if current is None and image is None:
+            return
+        if current is not None and current[0] is image and current[1] == pos:
+            return
+        self._render.invalidate(self.image.set_floating(image, pos))
+
+    def _transformed_selection(self, smooth=None, mode=None):
+        # Preview cepat selama drag, hasil halus di-cache setelah dilepas
+        if smooth is None:
+            smooth = not self.transforming
+        return self._transform_cache.get(self.selected_image, mode or self.mode,
+                                         self._rot_angle, self._scale_factor,
+                                         smooth)
 
     def mousePressEvent(self, event):
+        self.perf.input()
         img_pos = self._to_image_pos(event.pos())
         if event.button() == Qt.MiddleButton:
             self._panning = True
@@ -118,32 +553,62 @@ class Canvas(QWidget):
             self.setCursor(Qt.ClosedHandCursor)
         elif event.button() == Qt.LeftButton:
             if self.mode == Mode.SELECT:
-                # Mulai select baru
+                # Mulai select baru: selection lama di-commit dulu, atau
+                # dijadikan dasar kalau digabung (Shift/Alt)
+                self._select_combine = self._combine_for(event.modifiers())
+                self._update_image_rect(self._floating_rect())
+                self._selection_base = self._begin_selection(self._select_combine)
                 self.selection_rect = QRect(img_pos, img_pos)
-                self.selected_image = None
                 self.drawing = True
+                self.start_point = img_pos
                 self._select_committed = False
+            elif self.mode == Mode.WAND:
+                self.magic_wand(img_pos, self._combine_for(event.modifiers()))
             elif self.mode in [Mode.MOVE, Mode.ROTATE, Mode.SCALE]:
                 # Hanya bisa transform jika ada selected_image
                 if self.selected_image is not None:
                     self.transforming = True
                     self.last_point = img_pos
+                elif self.mode == Mode.MOVE:
+                    # Tanpa floating selection, MOVE memilih dan menggeser shape vektor
+                    old = self._selected_shape_rect()
+                    shape = self.image.shapes.hit_test(img_pos, max(2.0, 4.0 / self.zoom))
+                    self.selected_shape = shape.id if shape is not None else None
+                    self._shape_drag = (shape, img_pos) if shape is not None else None
+                    self._update_image_rect(old, self._selected_shape_rect())
             elif self.mode == Mode.LINE:
-                self._push_undo()
                 self.drawing = True
                 self.start_point = img_pos
                 self.end_point = img_pos
             else:
-                self._push_undo()
                 self.drawing = True
                 self.last_point = img_pos
                 self.start_point = img_pos
+                self.end_point = img_pos
                 if self.mode == Mode.FILL:
                     self.flood_fill(img_pos)
                     self.drawing = False
-            self.update()
+                elif self.mode == Mode.BRUSH:
+                    self.history.begin()
+                    self._stroke.begin(img_pos, self.brush_color,
+                                       self.brush_size, self.raster_backend)
+                    self._flush_stroke()
+                    self._stroke_timer.start()
+
+    def _combine_for(self, modifiers):
+        # Shift = tambah, Alt = kurangi, Shift+Alt = irisan, selain itu pilihan sidebar
+        shift = bool(modifiers & Qt.ShiftModifier)
+        alt = bool(modifiers & Qt.AltModifier)
+        if shift and alt:
+            return selection.INTERSECT
+        if shift:
+            return selection.ADD
+        if alt:
+            return selection.SUBTRACT
+        return self.selection_combine
 
     def mouseMoveEvent(self, event):
+        self.perf.input()
         if self._panning:
             delta = event.pos() - self._pan_start
             self._pan = self._pan_origin + delta
@@ -151,42 +616,45 @@ class Canvas(QWidget):
             return
         img_pos = self._to_image_pos(event.pos())
         if self.mode == Mode.BRUSH and self.drawing:
-            painter = QPainter(self.image)
-            pen = QPen(self.brush_color, self.brush_size,
-                       Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-            painter.setPen(pen)
-            painter.drawLine(self.last_point, img_pos)
+            # Cukup antrikan, digambar oleh _flush_stroke per frame
+            self._stroke.add_point(img_pos)
             self.last_point = img_pos
-            self.update()
-        elif self.mode == Mode.LINE and self.drawing:
-            self.end_point = img_pos
-            self.update()
-        elif self.mode in [Mode.RECT, Mode.CIRCLE] and self.drawing:
+        elif self.mode in [Mode.LINE, Mode.RECT, Mode.CIRCLE] and self.drawing:
+            old = self._preview_rect()
             self.end_point = img_pos
-            self.update()
+            self._update_image_rect(old, self._preview_rect())
         elif self.mode == Mode.SELECT and self.drawing:
+            old = self._preview_rect()
             self.end_point = img_pos
             self.selection_rect = QRect(
                 self.start_point, self.end_point).normalized()
-            self.update()
+            self._update_image_rect(old, self._preview_rect())
+        elif self.mode == Mode.MOVE and self._shape_drag is not None:
+            # Preview geser shape, History dan operasi dicatat saat dilepas
+            shape, origin = self._shape_drag
+            delta = img_pos - origin
+            self._shape_changed(self.image.shapes.put(shape.id, shape.moved(delta.x(), delta.y())))
         elif self.mode == Mode.MOVE and self.transforming and self.selected_image is not None:
+            old = self._floating_rect()
             delta = img_pos - self.last_point
             self._move_offset += delta
             self.last_point = img_pos
-            self.update()
+            self._update_image_rect(old, self._floating_rect())
         elif self.mode == Mode.ROTATE and self.transforming and self.selected_image is not None:
+            old = self._floating_rect()
             center = self.selection_rect.center()
             dx = img_pos.x() - center.x()
             dy = img_pos.y() - center.y()
             self._rot_angle = (dx + dy) % 360
-            self.update()
+            self._update_image_rect(old, self._floating_rect())
         elif self.mode == Mode.SCALE and self.transforming and self.selected_image is not None:
+            old = self._floating_rect()
             rect = self.selection_rect
             width = max(1, img_pos.x() - rect.left())
             height = max(1, img_pos.y() - rect.top())
             self._scale_factor = min(
                 width / rect.width(), height / rect.height())
-            self.update()
+            self._update_image_rect(old, self._floating_rect())
 
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.MiddleButton:
@@ -196,49 +664,29 @@ class Canvas(QWidget):
         if event.button() == Qt.LeftButton:
             if self.mode == Mode.BRUSH:
                 self.drawing = False
-            elif self.mode == Mode.LINE and self.drawing:
-                painter = QPainter(self.image)
-                pen = QPen(self.brush_color, self.stroke_size,
-                           Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-                painter.setPen(pen)
-                painter.drawLine(self.start_point, img_pos)
-                self.drawing = False
-                self.update()
-            elif self.mode == Mode.RECT and self.drawing:
-                painter = QPainter(self.image)
-                pen = QPen(self.brush_color, self.stroke_size)
-                painter.setPen(pen)
-                painter.drawRect(QRect(self.start_point, img_pos))
-                self.drawing = False
-                self.update()
-            elif self.mode == Mode.CIRCLE and self.drawing:
-                painter = QPainter(self.image)
-                pen = QPen(self.brush_color, self.stroke_size)
-                painter.setPen(pen)
-                painter.drawEllipse(QRect(self.start_point, img_pos))
+                self._end_stroke()
+            elif self.mode in [Mode.LINE, Mode.RECT, Mode.CIRCLE] and self.drawing:
+                self._update_image_rect(self._preview_rect())
                 self.drawing = False
-                self.update()
+                self.draw_shape(self.mode, self.start_point, img_pos)
             elif self.mode == Mode.SELECT and self.drawing:
+                self._update_image_rect(self._preview_rect())
                 self.drawing = False
-                self.selection_rect = self.selection_rect.normalized()
-                if self.selection_rect.isValid() and self.selection_rect.width() > 0 and self.selection_rect.height() > 0:
-                    # Simpan snapshot area, kosongkan area aslinya (seperti cut/floating selection)
-                    self.selected_image = self.image.copy(self.selection_rect)
-                    # Kosongkan area asli (floating selection)
-                    painter = QPainter(self.image)
-                    painter.setCompositionMode(QPainter.CompositionMode_Source)
-                    painter.fillRect(self.selection_rect, Qt.transparent)
-                    painter.setCompositionMode(
-                        QPainter.CompositionMode_SourceOver)
-                    self._move_offset = QPoint(0, 0)
-                    self._rot_angle = 0
-                    self._scale_factor = 1.0
-                    self._select_committed = False
+                rect = self.selection_rect
+                step = {'combine': self._select_combine,
+                        'rect': [rect.x(), rect.y(), rect.width(), rect.height()]}
+                if self._select(step, self._selection_base):
                     self.set_mode(Mode.MOVE)  # Otomatis masuk mode move
-                self.update()
+                    self._update_image_rect(self._floating_rect())
             elif self.mode in [Mode.MOVE, Mode.ROTATE, Mode.SCALE] and self.transforming:
                 self.transforming = False
-                self.update()
+                self._update_image_rect(self._floating_rect())
+            elif self.mode == Mode.MOVE and self._shape_drag is not None:
+                shape, origin = self._shape_drag
+                self._shape_drag = None
+                delta = img_pos - origin
+                self._shape_changed(self.image.shapes.put(shape.id, shape))
+                self.move_shape(shape.id, delta.x(), delta.y())
 
     def wheelEvent(self, event):
         # Zoom with scrollwheel, centered at mouse
@@ -258,11 +706,30 @@ class Canvas(QWidget):
         self.update()
 
     def paintEvent(self, event):
+        start = time.perf_counter_ns()
         painter = QPainter(self)
         offset = self._canvas_offset() + self._pan
-        scaled = self.image.scaled(
-            self.zoomed_size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        painter.drawImage(offset, scaled)
+        painter.setClipRect(event.rect())
+        self._sync_floating()
+        # Hanya area image di dalam rect yang di-repaint yang di-resample
+        shapes = self.image.shapes
+        if self.zoom >= 1.0 and len(shapes):
+            # Shape vektor digambar langsung di koordinat widget supaya tajam.
+            # Shape adalah overlay di atas semua layer (sama dengan
+            # LayerStack.copy), properti layer tidak berlaku untuknya.
+            self._render.draw(painter, RasterView(self.image), self.zoom, offset, event.rect())
+            self._shape_cache.draw(painter, shapes, self.zoom, offset, event.rect(),
+                                   self.image.rect())
+        else:
+            self._render.draw(painter, self.image, self.zoom, offset, event.rect())
+        if self._filter_preview is not None:
+            rect, image = self._filter_preview
+            painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+            painter.drawImage(QRectF(self._to_widget_rect(rect)), image)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, False)
+        if self.mode == Mode.MOVE and self.selected_shape is not None:
+            painter.setPen(QPen(Qt.blue, 1, Qt.DashLine))
+            painter.drawRect(self._to_widget_rect(self._selected_shape_rect()))
         # Draw temp shapes (rect/circle/line/selection) in widget coordinates
         if self.drawing and self.mode in [Mode.RECT, Mode.CIRCLE, Mode.LINE]:
             pen = QPen(self.brush_color, self.stroke_size *
@@ -278,94 +745,270 @@ class Canvas(QWidget):
                     painter.drawRect(widget_rect)
                 elif self.mode == Mode.CIRCLE:
                     painter.drawEllipse(widget_rect)
-        # Draw floating selection
+        elif self.drawing and self.mode == Mode.SELECT:
+            painter.setPen(QPen(Qt.blue, 2, Qt.DashLine))
+            painter.drawRect(self._to_widget_rect(self.selection_rect))
+        # Floating selection sudah ikut di composite (layer sementara), cukup border
         if self.selected_image is not None and self.selection_rect.isValid():
             sel_rect = self.selection_rect.translated(self._move_offset)
             widget_rect = self._to_widget_rect(sel_rect)
-            img = self.selected_image
-            if self.mode == Mode.ROTATE:
-                transform = QTransform()
-                center = img.rect().center()
-                transform.translate(center.x(), center.y())
-                transform.rotate(self._rot_angle)
-                transform.translate(-center.x(), -center.y())
-                img = img.transformed(transform, Qt.SmoothTransformation)
-            elif self.mode == Mode.SCALE:
-                w = int(img.width() * self._scale_factor)
-                h = int(img.height() * self._scale_factor)
-                img = img.scaled(w, h, Qt.KeepAspectRatio,
-                                 Qt.SmoothTransformation)
-            painter.drawImage(widget_rect.topLeft(), img)
-            # Draw selection border
-            pen = QPen(Qt.blue, 2, Qt.DashLine)
-            painter.setPen(pen)
-            painter.drawRect(widget_rect)
+            if self._outline is not None and self._rot_angle == 0 and self._scale_factor == 1.0:
+                # Selection mask: tepi mask, bukan kotak
+                painter.drawImage(QRectF(widget_rect), self._outline)
+            else:
+                # Draw selection border
+                pen = QPen(Qt.blue, 2, Qt.DashLine)
+                painter.setPen(pen)
+                painter.drawRect(widget_rect)
+        self.perf.frame(start, time.perf_counter_ns())
+        if self.perf.hud:
+            self.perf.draw_hud(painter, self.rect())
+        if 'paint' not in startup.MARKS:
+            startup.first_paint()
+
+    def select_region(self, rect, combine=None):
+        # Jadikan rect floating selection (digabung dengan selection saat
+        # ini sesuai combine), return False kalau hasilnya kosong
+        rect = rect.normalized()
+        return self._select({'combine': combine or selection.REPLACE,
+                             'rect': [rect.x(), rect.y(), rect.width(), rect.height()]})
+
+    def magic_wand(self, pos, combine=None, connectivity=None, tolerance=None):
+        # Pilih area terhubung yang warnanya mirip pixel pos di layer aktif
+        # (connectivity/tolerance sama dengan flood fill)
+        step = {'combine': combine or self.selection_combine, 'wand': [pos.x(), pos.y()],
+                'connectivity': self.flood_fill_type if connectivity is None else connectivity,
+                'tolerance': self.fill_tolerance if tolerance is None else tolerance}
+        return self._select(step)
+
+    def _begin_selection(self, combine):
+        # Dasar untuk selection baru: (region, steps). Floating selection
+        # yang belum ditransformasi dikembalikan ke layer supaya bisa
+        # digabung, selain itu di-commit dan selection mulai dari kosong.
+        floating = (self.selected_image is not None and self.selection_rect.isValid()
+                    and self._move_offset.isNull() and self._rot_angle == 0
+                    and self._scale_factor == 1.0)
+        if combine == selection.REPLACE or not floating:
+            self.apply_transform()
+            return None, []
+        base = (QRect(self.selection_rect), self.selection_mask), self._selection_steps
+        self.selected_image = None
+        self._render.invalidate(self.history.rollback(self.image))
+        self._sync_floating()
+        return base
+
+    def _select(self, step, base=None):
+        self._end_stroke()
+        region, steps = self._begin_selection(step['combine']) if base is None else base
+        self._selection_base = (None, [])
+        with self.perf.span('selection'):
+            region = selection.combine(region, self._selection_region(step), step['combine'])
+        return self._lift(region, steps + [step])
+
+    def _selection_region(self, step):
+        # (rect, mask) satu langkah selection di layer aktif, None kalau kosong
+        if 'wand' in step:
+            x, y = step['wand']
+            if not self.image.rect().contains(x, y):
+                return None
+            # Pita baris dibaca langsung dari tile, hanya yang dicapai area
+            return selection.magic_wand(self.layer_image.rows(), x, y,
+                                        step.get('connectivity', 4), step.get('tolerance', 0))
+        rect = QRect(*step['rect']).normalized().intersected(self.image.rect())
+        return selection.crop(rect, None)
+
+    def _build_selection(self, steps):
+        region = None
+        for step in steps:
+            region = selection.combine(region, self._selection_region(step), step['combine'])
+        return region
+
+    def _lift(self, region, steps):
+        # Angkat region jadi floating selection, return False kalau kosong
+        if region is None:
+            self.selection_rect = QRect()
+            self.selected_image = None
+            self._sync_floating()
+            self.update()
+            return False
+        rect, mask = region
+        self.selection_rect = rect
+        self.selection_mask = mask
+        self._selection_steps = steps
+        # Simpan snapshot area, kosongkan area aslinya (seperti cut/floating selection)
+        self.selected_image = self.layer_image.copy(rect)
+        if mask is not None:
+            # Pixel di luar mask tidak ikut terangkat
+            image_array(self.selected_image)[~mask] = 0
+            self._mask_image = selection.mask_image(mask)
+            self._outline = selection.outline_image(mask)
+        else:
+            self._mask_image = self._outline = None
+        # Kosongkan area asli (floating selection). Operasi undo
+        # tetap terbuka sampai apply_transform
+        self.history.begin()
+        painter = self._begin_paint(rect)
+        if mask is None:
+            painter.setCompositionMode(QPainter.CompositionMode_Source)
+            painter.fillRect(rect, Qt.transparent)
+        else:
+            painter.setCompositionMode(QPainter.CompositionMode_DestinationOut)
+            painter.drawImage(rect.topLeft(), self._mask_image)
+        painter.end()
+        self._move_offset = QPoint(0, 0)
+        self._rot_angle = 0
+        self._scale_factor = 1.0
+        self._select_committed = False
+        self._sync_floating()
+        self._update_image_rect(rect)
+        return True
 
     def apply_transform(self):
-        # Commit floating selection ke image
-        if self.selected_image is not None and self.selection_rect.isValid():
-            painter = QPainter(self.image)
-            img = self.selected_image
-            # Transformasi
-            if self.mode == Mode.ROTATE:
-                transform = QTransform()
-                center = img.rect().center()
-                transform.translate(center.x(), center.y())
-                transform.rotate(self._rot_angle)
-                transform.translate(-center.x(), -center.y())
-                img = img.transformed(transform, Qt.SmoothTransformation)
-            elif self.mode == Mode.SCALE:
-                w = int(img.width() * self._scale_factor)
-                h = int(img.height() * self._scale_factor)
-                img = img.scaled(w, h, Qt.KeepAspectRatio,
-                                 Qt.SmoothTransformation)
-            # Move offset
-            target_rect = self.selection_rect.translated(self._move_offset)
-            # Clear area
+        self._commit_selection(self.mode)
+
+    def transform_selection(self, rect, mode, move=(0, 0), angle=0, scale=1.0, selection=None):
+        # Select + move/rotate/scale + apply sekaligus (dipakai replay/batch).
+        # selection: langkah-langkah selection (lihat ops.py), default rect saja
+        self.apply_transform()
+        steps = selection or [{'combine': 'replace',
+                               'rect': [rect.x(), rect.y(), rect.width(), rect.height()]}]
+        if self._lift(self._build_selection(steps), steps):
+            self._move_offset = QPoint(*move)
+            self._rot_angle = angle
+            self._scale_factor = scale
+            self._commit_selection(mode)
+
+    def _paint_floating(self, painter, mode):
+        # Floating selection (hasil halus dari cache kalau sudah ada) ke
+        # painter berkoordinat image, persis seperti saat di-commit
+        img = self._transformed_selection(smooth=True, mode=mode)
+        target_rect = self.selection_rect.translated(self._move_offset)
+        # Clear area (selection mask: hanya pixel yang tertutup mask)
+        if self.selection_mask is None:
             painter.setCompositionMode(QPainter.CompositionMode_Source)
             painter.fillRect(target_rect, Qt.transparent)
-            painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
-            painter.drawImage(target_rect.topLeft(), img)
+        else:
+            painter.setCompositionMode(QPainter.CompositionMode_DestinationOut)
+            painter.drawImage(target_rect.topLeft(), self._mask_cache.get(
+                self._mask_image, mode, self._rot_angle, self._scale_factor, True))
+        painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+        painter.drawImage(target_rect.topLeft(), img)
+
+    def _commit_selection(self, mode):
+        # Commit floating selection ke image
+        if self.selected_image is not None and self.selection_rect.isValid():
+            dirty = self._floating_rect(mode)
+            with self.perf.span('apply_transform'):
+                painter = self._begin_paint(dirty)
+                self._paint_floating(painter, mode)
+                painter.end()
+            self._commit()
+            rect = self.selection_rect
+            op = {'op': 'transform', 'mode': mode,
+                  'rect': [rect.x(), rect.y(), rect.width(), rect.height()],
+                  'move': [self._move_offset.x(), self._move_offset.y()],
+                  'angle': self._rot_angle, 'scale': self._scale_factor}
+            steps = self._selection_steps
+            if len(steps) != 1 or 'rect' not in steps[0]:
+                op['selection'] = steps
             # Reset selection
             self.selected_image = None
             self.selection_rect = QRect()
+            self.selection_mask = self._mask_image = self._outline = None
+            self._selection_steps = []
             self._move_offset = QPoint(0, 0)
             self._rot_angle = 0
             self._scale_factor = 1.0
             self._select_committed = True
-            self.update()
+            self._transform_cache.reset()
+            self._mask_cache.reset()
+            self._sync_floating()
+            self._update_image_rect(dirty)
+            self._record(op)
 
-    def flood_fill(self, pos):
-        # Flood fill (4-connected or 8-connected)
+    def flood_fill(self, pos, color=None, connectivity=None, tolerance=None):
+        # Scanline flood fill (4-connected atau 8-connected) langsung di tile image
+        color = self.brush_color if color is None else color
+        connectivity = self.flood_fill_type if connectivity is None else connectivity
+        tolerance = self.fill_tolerance if tolerance is None else tolerance
         x, y = pos.x(), pos.y()
-        if x < 0 or y < 0 or x >= self.image.width() or y >= self.image.height():
-            return
-        target_color = QColor(self.image.pixel(x, y))
-        fill_color = QColor(self.brush_color)
-        if target_color == fill_color:
-            return
-        w, h = self.image.width(), self.image.height()
-        stack = [(x, y)]
-        visited = set()
-        while stack:
-            cx, cy = stack.pop()
-            if (cx, cy) in visited:
-                continue
-            if cx < 0 or cy < 0 or cx >= w or cy >= h:
-                continue
-            if QColor(self.image.pixel(cx, cy)) != target_color:
-                continue
-            self.image.setPixel(cx, cy, fill_color.rgb())
-            visited.add((cx, cy))
-            stack.extend(self._get_neighbors(cx, cy, self.flood_fill_type))
-        self.update()
+        if not self.image.rect().contains(x, y):
+            return QRect()
+        rgba = QColor(color).rgba()
+        layer = self.layer_image
+        if tolerance <= 0 and layer.pixel(x, y) == rgba:
+            return QRect()
+        with self.perf.span('flood_fill.scan'):
+            spans, rect = fill.scan_fill(layer.rows(), x, y,
+                                         connectivity, tolerance)
+        if not rect.isEmpty():
+            self.history.begin()
+            self._touch(rect)
+            with self.perf.span('flood_fill.paint'):
+                layer.fill_spans(spans, rgba)
+            self._commit()
+            self._update_image_rect(rect)
+            self._record({'op': 'fill', 'point': [x, y],
+                          'color': _color_name(color),
+                          'connectivity': connectivity, 'tolerance': tolerance})
+        return rect
+
+    # Filter: area = floating selection atau seluruh image. Floating
+    # selection baru di-commit saat apply, preview/cancel tidak mengubah dokumen.
+
+    def _filter_rect(self):
+        if self._filter_preview is not None:
+            return self._filter_preview[0]
+        rect = self.image.rect()
+        if self.selected_image is not None and self.selection_rect.isValid():
+            rect = self._floating_rect().intersected(rect)
+        return rect
+
+    def preview_filter(self, name, params):
+        # Preview resolusi rendah di atas canvas, belum mengubah image
+        self._end_stroke()
+        rect = self._filter_rect()
+        source, area = self.layer_image, rect
+        if self.selected_image is not None and self.selection_rect.isValid():
+            # Layer aktif seperti setelah floating selection di-commit
+            source = self.layer_image.copy(rect)
+            painter = QPainter(source)
+            painter.translate(-rect.topLeft())
+            self._paint_floating(painter, self.mode)
+            painter.end()
+            area = QRect(source.rect())
+        with self.perf.span('filter.preview'):
+            image = filters.preview(source, name, params, area)
+        self._filter_preview = (rect, image)
+        self._update_image_rect(rect)
 
-    def _get_neighbors(self, x, y, t):
-        # t: 4 or 8 connected
-        neighbors = [(x-1, y), (x+1, y), (x, y-1), (x, y+1)]
-        if t == 8:
-            neighbors += [(x-1, y-1), (x+1, y-1), (x-1, y+1), (x+1, y+1)]
-        return neighbors
+    def cancel_filter_preview(self):
+        if self._filter_preview is not None:
+            rect = self._filter_preview[0]
+            self._filter_preview = None
+            self._update_image_rect(rect)
+
+    def apply_filter(self, name, params=None, rect=None):
+        # Filter resolusi penuh ke layer aktif, satu entry undo
+        self._end_stroke()
+        params = dict(params or {})
+        rect = self._filter_rect() if rect is None else rect.normalized().intersected(self.image.rect())
+        self.cancel_filter_preview()
+        self.apply_transform()
+        if rect.isEmpty():
+            return QRect()
+        with self.perf.span('filter'):
+            image = filters.apply(self.layer_image, name, params, rect)
+        self.history.begin()
+        painter = self._begin_paint(rect)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        painter.drawImage(rect.topLeft(), image)
+        painter.end()
+        self._commit()
+        self._update_image_rect(rect)
+        self._record({'op': 'filter', 'name': name, 'params': params,
+                      'rect': [rect.x(), rect.y(), rect.width(), rect.height()]})
+        return rect
 
     def _to_image_pos(self, widget_pos):
         # Convert widget pos to image pos, considering pan and zoom
@@ -398,21 +1041,348 @@ class Canvas(QWidget):
     def zoomed_size(self):
         return self.image.size() * self.zoom
 
+def _color_name(color):
+    return QColor(color).name(QColor.HexArgb)
+
+
+class FilterDialog(QDialog):
+    # Pilih filter + parameter, preview resolusi rendah di canvas selama
+    # dialog terbuka; OK = apply resolusi penuh (masuk undo)
+    def __init__(self, canvas, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Filter')
+        self.canvas = canvas
+        self._inputs = {}
+        layout = QVBoxLayout(self)
+        self.name = QComboBox()
+        self.name.addItems(list(filters.FILTERS))
+        self.name.currentTextChanged.connect(self._build_params)
+        layout.addWidget(self.name)
+        self.form = QFormLayout()
+        layout.addLayout(self.form)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+        # Preview ditunda sedikit supaya geser slider tidak menghitung tiap nilai
+        self._preview_timer = QTimer(self)
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.setInterval(50)
+        self._preview_timer.timeout.connect(self._preview)
+        self._build_params(self.name.currentText())
+
+    def _build_params(self, name):
+        while self.form.rowCount():
+            self.form.removeRow(0)
+        self._inputs = {}
+        f = filters.FILTERS[name]
+        for param, low, high, default, step in f.params:
+            # Slider integer, param pecahan lewat step
+            slider = QSlider(Qt.Horizontal)
+            slider.setRange(int(round(low / step)), int(round(high / step)))
+            slider.setValue(int(round(default / step)))
+            slider.valueChanged.connect(self._preview_timer.start)
+            self._inputs[param] = (slider, step)
+            self.form.addRow(param, slider)
+        if name == 'convolve':
+            presets = QComboBox()
+            presets.addItems(list(filters.KERNELS))
+            self.kernel = QLineEdit()
+            presets.currentTextChanged.connect(
+                lambda preset: self.kernel.setText(_kernel_text(filters.KERNELS[preset])))
+            self.kernel.setText(_kernel_text(filters.KERNELS[presets.currentText()]))
+            self.kernel.textChanged.connect(self._preview_timer.start)
+            self.form.addRow('preset', presets)
+            self.form.addRow('kernel', self.kernel)
+        self._preview_timer.start()
+
+    def params(self):
+        params = {}
+        for param, (slider, step) in self._inputs.items():
+            value = slider.value() * step
+            params[param] = round(value, 3) if isinstance(step, float) else int(value)
+        if self.name.currentText() == 'convolve':
+            params['kernel'] = [[float(v) for v in row.split()]
+                                for row in self.kernel.text().split(';') if row.strip()]
+        return params
+
+    def _preview(self):
+        try:
+            self.canvas.preview_filter(self.name.currentText(), self.params())
+        except ValueError:
+            self.canvas.cancel_filter_preview()  # kernel belum valid
+
+    def accept(self):
+        self._preview_timer.stop()
+        try:
+            self.canvas.apply_filter(self.name.currentText(), self.params())
+        except ValueError as e:
+            QMessageBox.warning(self, 'Filter', str(e))
+            return
+        super().accept()
+
+    def reject(self):
+        self._preview_timer.stop()
+        self.canvas.cancel_filter_preview()
+        super().reject()
+
+
+def _kernel_text(kernel):
+    return '; '.join(' '.join(str(v) for v in row) for row in kernel)
+
 # Main Window
 
 
+def _add_button(layout, text, cb):
+    btn = QPushButton(text)
+    btn.clicked.connect(cb)
+    btn.setFixedWidth(80)
+    layout.addWidget(btn)
+    return btn
+
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle('MiniPaint')
-        self.canvas = Canvas(self)
-        self.setCentralWidget(self.canvas)
+        # Satu tab per dokumen, memori semua dokumen dibatasi bersama
+        # (documents.py). MINIPAINT_MEMORY_MB mengganti budget default.
+        budget = int(os.environ.get('MINIPAINT_MEMORY_MB', 0)) << 20
+        self.documents = documents.Documents(budget or documents.DEFAULT_BUDGET)
+        self.tabs = QTabWidget()
+        self.tabs.setDocumentMode(True)
+        self.tabs.setMovable(True)
+        self.tabs.setTabsClosable(True)
+        self.tabs.tabCloseRequested.connect(self.close_tab)
+        self.setCentralWidget(self.tabs)
+        self._untitled = 0
+        self._sessions = {}  # canvas -> session.SessionClient
+        self._server = None  # (SessionServer, LoopThread) kalau menjadi host
+        self.canvas = None  # Canvas tab aktif
+        self.layer_list = None  # panel layer dibuat setelah frame pertama
+        self.canvas = self.session = self.add_document()
+        # Tab sesi (journal) tidak bisa ditutup
+        for side in (QTabBar.LeftSide, QTabBar.RightSide):
+            self.tabs.tabBar().setTabButton(0, side, None)
+        # Budget dicek setelah operasi, dikumpulkan supaya tidak tiap event
+        self._budget_timer = QTimer(self)
+        self._budget_timer.setSingleShot(True)
+        self._budget_timer.setInterval(500)
+        self._budget_timer.timeout.connect(self._enforce_budget)
+        # Setelan sesi lalu (startup.py) dipasang sebelum sidebar dibuat
+        # supaya slider/checkbox langsung menunjukkan nilainya
+        state = startup.load_state() or {}
+        try:
+            self.session.set_tool_state(state['tool'])
+        except (KeyError, TypeError, ValueError):
+            pass
         self._create_sidebar()
+        startup.after_first_paint(self._create_layer_panel)
         self._create_shortcuts()
-        self.statusBar().showMessage('Ready')
+        self._create_status()
+        self.tabs.currentChanged.connect(self._tab_changed)
+        self.documents.activate(self.canvas)
+        # MINIPAINT_TRACE=file.json merekam trace seluruh sesi
+        self._trace_path = os.environ.get('MINIPAINT_TRACE')
+        if self._trace_path:
+            self.session.perf.start_trace()
+        # Autosave: operasi tab sesi dicatat ke journal, dipulihkan saat start
+        self.journal = Journal(self.session)
+        try:
+            replayed = self.journal.recover()
+        except (OSError, ValueError) as e:
+            self.statusBar().showMessage(f'Recovery failed: {e}')
+        else:
+            message = f'Recovered session ({replayed} operations replayed)' if replayed else 'Ready'
+            if self.journal.corrupt:
+                # Snapshot/segment rusak sudah dipindah ke *.corrupt
+                message += (f', {len(self.journal.corrupt)} damaged file(s) moved aside'
+                            f' in {self.journal.directory}')
+            self.statusBar().showMessage(message)
+        try:
+            self.session.set_view_state(state['view'])
+        except (KeyError, TypeError, ValueError):
+            pass
+        self._sync_zoom()
+        # Tab project dibuka lagi setelah frame pertama. State ditulis di
+        # thread background, dikumpulkan tiap 2 detik (hanya kalau berubah).
+        startup.after_first_paint(lambda: self._restore_documents(state))
+        startup.after_first_paint(lambda: startup.preload('numpy'))
+        self._state_writer = startup.StateWriter()
+        self._state_timer = QTimer(self)
+        self._state_timer.setInterval(2000)
+        self._state_timer.timeout.connect(
+            lambda: self._state_writer.write(self.session_state()))
+        self._state_timer.start()
+        startup.mark('window')
         self.showMaximized()
 
+    def _create_status(self):
+        self.exporter = None  # dibuat saat export pertama (_create_exporter)
+        self._export_jobs = {}  # job -> progress 0..1
+        self._export_level = {}  # format -> level terakhir
+        self._memory_label = QLabel()
+        self.statusBar().addPermanentWidget(self._memory_label)
+
+    def _create_exporter(self):
+        # Thread pool export + progress/tombol cancel di status bar (tampil
+        # saat ada job), tidak perlu ada sebelum export pertama
+        self.exporter = export.Exporter(parent=self)
+        self.exporter.progress.connect(self._export_progress)
+        self.exporter.finished.connect(self._export_finished)
+        self._export_bar = QProgressBar()
+        self._export_bar.setRange(0, 1000)
+        self._export_bar.setMaximumWidth(200)
+        self._export_cancel = QPushButton('Cancel')
+        self._export_cancel.clicked.connect(lambda: self.exporter.cancel())
+        for widget in (self._export_bar, self._export_cancel):
+            widget.hide()
+            self.statusBar().insertPermanentWidget(0, widget)
+
+    # Dokumen (tab)
+
+    def add_document(self, title=None):
+        canvas = Canvas(self)
+        canvas.layers_changed.connect(lambda: canvas is self.canvas and self._refresh_layers())
+        canvas.operation.connect(lambda op: self._budget_timer.start())
+        self.documents.add(canvas)
+        if title is None:
+            self._untitled += 1
+            title = f'Untitled {self._untitled}'
+        self.tabs.setCurrentIndex(self.tabs.addTab(canvas, title))
+        return canvas
+
+    def close_tab(self, index):
+        canvas = self.tabs.widget(index)
+        if canvas is self.session:
+            return
+        canvas._end_stroke()
+        if canvas in self._sessions:
+            self._sessions.pop(canvas).close()
+        self.tabs.removeTab(index)
+        self.documents.remove(canvas)
+        canvas.deleteLater()
+
+    # Sesi bersama (lihat session.py): tiap sesi di tab sendiri
+
+    def host_session(self):
+        if self._server is None:
+            image = self.canvas.image
+            try:
+                self._server = session.serve_in_thread(image.width(), image.height(),
+                                                       '127.0.0.1', session.PORT)
+            except OSError as e:
+                self.statusBar().showMessage(f'Cannot host session: {e}')
+                return
+        self._join('127.0.0.1', self._server[0].port)
+
+    def join_session(self):
+        address, ok = QInputDialog.getText(self, 'Join Session', 'Host:port',
+                                           text=f'127.0.0.1:{session.PORT}')
+        if ok and address:
+            host, _, port = address.rpartition(':')
+            self._join(host or '127.0.0.1', int(port))
+
+    def _join(self, host, port):
+        canvas = self.add_document(f'Session {host}:{port}')
+        try:
+            client = session.SessionClient(canvas, host, port)
+        except OSError as e:
+            self.close_tab(self.tabs.indexOf(canvas))
+            QMessageBox.warning(self, 'Join Session', f'Cannot join {host}:{port}: {e}')
+            return
+        client.closed.connect(lambda: self.statusBar().showMessage(
+            f'Session {host}:{port} disconnected'))
+        self._sessions[canvas] = client
+        self.statusBar().showMessage(f'Joined session {host}:{port}', 5000)
+
+    # State sesi (startup.py): setelan tool, zoom/pan, tab project terbuka
+
+    def session_state(self):
+        tabs = []
+        for index in range(self.tabs.count()):
+            canvas = self.tabs.widget(index)
+            # Tab sesi dipulihkan journal, tab sesi bersama tidak disimpan
+            if canvas is self.session or canvas in self._sessions or canvas.project_file is None:
+                continue
+            tabs.append({'path': canvas.project_file.path, 'view': canvas.view_state()})
+        active = self.canvas.project_file.path if self.canvas.project_file else None
+        return {'tool': self.canvas.tool_state(), 'view': self.session.view_state(),
+                'documents': tabs, 'active': active}
+
+    def _restore_documents(self, state):
+        # Hanya index project yang dibaca, tile di-decode saat terlihat
+        opened = {}
+        for doc in state.get('documents', []):
+            try:
+                path = doc['path']
+                canvas = self.add_document(os.path.basename(path))
+            except (KeyError, TypeError):
+                continue
+            try:
+                canvas.open_project(path)
+                canvas.set_view_state(doc.get('view', {}))
+            except (OSError, ValueError, TypeError) as e:
+                self.close_tab(self.tabs.indexOf(canvas))
+                self.statusBar().showMessage(f'Cannot reopen {path}: {e}', 5000)
+                continue
+            opened[path] = canvas
+        self.tabs.setCurrentWidget(opened.get(state.get('active'), self.session))
+        self._sync_zoom()
+        startup.mark('restore')
+
+    def _sync_zoom(self):
+        self.zoom_slider.blockSignals(True)
+        self.zoom_slider.setValue(int(self.canvas.zoom * 100))
+        self.zoom_slider.blockSignals(False)
+
+    def _tab_changed(self, index):
+        canvas = self.tabs.widget(index)
+        if canvas is None or canvas is self.canvas:
+            return
+        previous, self.canvas = self.canvas, canvas
+        # Setelan tool ikut pindah ke dokumen yang baru aktif
+        previous._end_stroke()
+        canvas.set_tool_state(previous.tool_state())
+        # Dokumen yang di-evict di-restore dulu sebelum digambar
+        with canvas.perf.span('documents.activate'):
+            self.documents.activate(canvas)
+        self._refresh_layers()
+        self._sync_zoom()
+        self._update_memory()
+        canvas.setFocus()
+
+    def _enforce_budget(self):
+        self.documents.enforce()
+        self._update_memory()
+
+    def _update_memory(self):
+        evicted = sum(self.documents.is_evicted(canvas) for canvas in self.documents)
+        self._memory_label.setText(
+            f'{self.documents.nbytes() >> 20} / {self.documents.budget >> 20} MB'
+            + (f', {evicted} on disk' if evicted else ''))
+
+    def closeEvent(self, event):
+        for canvas in self.documents:
+            canvas._end_stroke()
+        for client in self._sessions.values():
+            client.close()
+        if self._server is not None:
+            session.stop_server(*self._server)
+        if self._trace_path and self.session.perf.events is not None:
+            self.session.perf.stop_trace(self._trace_path)
+        if self.exporter is not None:
+            self.exporter.shutdown()
+        self._state_timer.stop()
+        self._state_writer.write(self.session_state())
+        self._state_writer.close()
+        self.journal.close()
+        super().closeEvent(event)
+
     def _create_sidebar(self):
+        # Tool dan setelan yang sering dipakai dibuat sebelum frame pertama,
+        # setelan lain menyusul setelahnya (_create_options) di tempat yang
+        # sudah disiapkan, jadi urutan sidebar tetap sama
         dock = QDockWidget('Tools', self)
         dock.setFeatures(QDockWidget.NoDockWidgetFeatures)
         dock.setTitleBarWidget(QWidget())
@@ -421,30 +1391,28 @@ class MainWindow(QMainWindow):
         layout.setContentsMargins(4, 4, 4, 4)
         layout.setSpacing(8)
         # Tool buttons
-
-        def add_btn(text, cb):
-            btn = QPushButton(text)
-            btn.clicked.connect(cb)
-            btn.setFixedWidth(80)
-            layout.addWidget(btn)
-            return btn
-        add_btn('Brush', lambda: self.set_mode(Mode.BRUSH))
-        add_btn('Line', lambda: self.set_mode(Mode.LINE))
-        add_btn('Rect', lambda: self.set_mode(Mode.RECT))
-        add_btn('Circle', lambda: self.set_mode(Mode.CIRCLE))
-        add_btn('Fill', lambda: self.set_mode(Mode.FILL))
-        add_btn('Select', lambda: self.set_mode(Mode.SELECT))
-        add_btn('Move', lambda: self.set_mode(Mode.MOVE))
-        add_btn('Rotate', lambda: self.set_mode(Mode.ROTATE))
-        add_btn('Scale', lambda: self.set_mode(Mode.SCALE))
-        add_btn('Undo', self.canvas.undo)
-        add_btn('Redo', self.canvas.redo)
-        add_btn('Clear', self.canvas.clear)
-        add_btn('Save', self.save_canvas)
-        # Fill type
-        add_btn('Fill 4', lambda: self.canvas.set_flood_fill_type(4))
-        add_btn('Fill 8', lambda: self.canvas.set_flood_fill_type(8))
-        add_btn('Apply', self.canvas.apply_transform)
+        for text, cb in [('Brush', lambda: self.set_mode(Mode.BRUSH)),
+                         ('Line', lambda: self.set_mode(Mode.LINE)),
+                         ('Rect', lambda: self.set_mode(Mode.RECT)),
+                         ('Circle', lambda: self.set_mode(Mode.CIRCLE)),
+                         ('Fill', lambda: self.set_mode(Mode.FILL)),
+                         ('Select', lambda: self.set_mode(Mode.SELECT)),
+                         ('Wand', lambda: self.set_mode(Mode.WAND)),
+                         ('Move', lambda: self.set_mode(Mode.MOVE)),
+                         ('Rotate', lambda: self.set_mode(Mode.ROTATE)),
+                         ('Scale', lambda: self.set_mode(Mode.SCALE)),
+                         ('Undo', lambda: self.canvas.undo()),
+                         ('Redo', lambda: self.canvas.redo()),
+                         ('Clear', lambda: self.canvas.clear()),
+                         ('New', self.new_canvas),
+                         ('Open', self.open_canvas),
+                         ('Save', self.save_canvas)]:
+            _add_button(layout, text, cb)
+        options = [QVBoxLayout(), QVBoxLayout()]
+        for section in options:
+            section.setContentsMargins(0, 0, 0, 0)
+            section.setSpacing(8)
+        layout.addLayout(options[0])
         # Color picker
         color_btn = QPushButton('Color')
         color_btn.clicked.connect(self.pick_color)
@@ -454,26 +1422,155 @@ class MainWindow(QMainWindow):
         brush_slider = QSlider(Qt.Horizontal)
         brush_slider.setRange(1, 50)
         brush_slider.setValue(self.canvas.brush_size)
-        brush_slider.valueChanged.connect(self.canvas.set_brush_size)
+        brush_slider.valueChanged.connect(lambda v: self.canvas.set_brush_size(v))
         layout.addWidget(brush_slider)
-        # Stroke size
-        layout.addWidget(QLabel('Stroke Size'))
-        stroke_slider = QSlider(Qt.Horizontal)
-        stroke_slider.setRange(1, 50)
-        stroke_slider.setValue(self.canvas.stroke_size)
-        stroke_slider.valueChanged.connect(self.canvas.set_stroke_size)
-        layout.addWidget(stroke_slider)
+        layout.addLayout(options[1])
         # Zoom
         layout.addWidget(QLabel('Zoom'))
-        zoom_slider = QSlider(Qt.Horizontal)
-        zoom_slider.setRange(1, 400)
-        zoom_slider.setValue(int(self.canvas.zoom * 100))
-        zoom_slider.valueChanged.connect(
+        self.zoom_slider = QSlider(Qt.Horizontal)
+        self.zoom_slider.setRange(1, 400)
+        self.zoom_slider.setValue(int(self.canvas.zoom * 100))
+        self.zoom_slider.valueChanged.connect(
             lambda v: self.canvas.set_zoom(v / 100))
-        layout.addWidget(zoom_slider)
+        layout.addWidget(self.zoom_slider)
         layout.addStretch(1)
         dock.setWidget(sidebar)
         self.addDockWidget(Qt.LeftDockWidgetArea, dock)
+        startup.after_first_paint(lambda: self._create_options(*options))
+
+    def _create_options(self, layout, brush_layout):
+        # Fill type
+        _add_button(layout, 'Fill 4', lambda: self.canvas.set_flood_fill_type(4))
+        _add_button(layout, 'Fill 8', lambda: self.canvas.set_flood_fill_type(8))
+        _add_button(layout, 'Apply', lambda: self.canvas.apply_transform())
+        _add_button(layout, 'Filter', self.open_filter)
+        _add_button(layout, 'Host', self.host_session)
+        _add_button(layout, 'Join', self.join_session)
+        # Line/Rect/Circle sebagai shape vektor (bisa digeser dengan Move, Delete untuk hapus)
+        vector_box = QCheckBox('Vector')
+        vector_box.setToolTip('Line/Rect/Circle become vector shapes, drawn above all layers')
+        vector_box.setChecked(self.canvas.vector_shapes)
+        vector_box.toggled.connect(lambda v: self.canvas.set_vector_shapes(v))
+        layout.addWidget(vector_box)
+        # Rasterizer Line/Rect/Circle/Brush (lihat raster.py); item data = nama
+        # backend, teks dan tooltip menandai backend yang tidak pixel-compatible
+        layout.addWidget(QLabel('Raster'))
+        raster_box = QComboBox()
+        for backend in raster.BACKENDS.values():
+            raster_box.addItem(backend.label, backend.name)
+            raster_box.setItemData(raster_box.count() - 1, backend.note, Qt.ToolTipRole)
+        raster_box.setCurrentIndex(raster_box.findData(self.canvas.raster_backend))
+        raster_box.currentIndexChanged.connect(
+            lambda i: self.canvas.set_raster_backend(raster_box.itemData(i)))
+        layout.addWidget(raster_box)
+        # Selection baru menggantikan / ditambah / dikurangi / diiris
+        # (juga lewat Shift, Alt, Shift+Alt saat select)
+        combine_box = QComboBox()
+        combine_box.addItems(selection.COMBINE)
+        combine_box.setCurrentText(self.canvas.selection_combine)
+        combine_box.currentTextChanged.connect(lambda v: self.canvas.set_selection_combine(v))
+        layout.addWidget(combine_box)
+        # Tolerance fill dan magic wand
+        layout.addWidget(QLabel('Fill/Wand Tolerance'))
+        tolerance_slider = QSlider(Qt.Horizontal)
+        tolerance_slider.setRange(0, 255)
+        tolerance_slider.setValue(self.canvas.fill_tolerance)
+        tolerance_slider.valueChanged.connect(lambda v: self.canvas.set_fill_tolerance(v))
+        layout.addWidget(tolerance_slider)
+        # Brush spacing & smoothing (dalam persen)
+        brush_layout.addWidget(QLabel('Brush Spacing'))
+        spacing_slider = QSlider(Qt.Horizontal)
+        spacing_slider.setRange(5, 100)
+        spacing_slider.setValue(int(self.canvas._stroke.spacing * 100))
+        spacing_slider.valueChanged.connect(
+            lambda v: self.canvas.set_brush_spacing(v / 100))
+        brush_layout.addWidget(spacing_slider)
+        brush_layout.addWidget(QLabel('Brush Smoothing'))
+        smoothing_slider = QSlider(Qt.Horizontal)
+        smoothing_slider.setRange(0, 90)
+        smoothing_slider.setValue(int(self.canvas._stroke.smoothing * 100))
+        smoothing_slider.valueChanged.connect(
+            lambda v: self.canvas.set_brush_smoothing(v / 100))
+        brush_layout.addWidget(smoothing_slider)
+        # Stroke size
+        brush_layout.addWidget(QLabel('Stroke Size'))
+        stroke_slider = QSlider(Qt.Horizontal)
+        stroke_slider.setRange(1, 50)
+        stroke_slider.setValue(self.canvas.stroke_size)
+        stroke_slider.valueChanged.connect(lambda v: self.canvas.set_stroke_size(v))
+        brush_layout.addWidget(stroke_slider)
+
+    def _create_layer_panel(self):
+        # Panel layer dibuat setelah frame pertama; sampai itu
+        # _refresh_layers tidak melakukan apa-apa
+        dock = QDockWidget('Layers', self)
+        dock.setFeatures(QDockWidget.NoDockWidgetFeatures)
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
+        layout.setContentsMargins(4, 4, 4, 4)
+        # List: baris atas = layer paling atas, checkbox = visible
+        layer_list = QListWidget()
+        layer_list.setFixedWidth(160)
+        layer_list.currentRowChanged.connect(
+            lambda row: row >= 0 and self.canvas.select_layer(self._layer_index(row)))
+        layer_list.itemChanged.connect(
+            lambda item: self.canvas.set_layer(
+                self._layer_index(self.layer_list.row(item)),
+                visible=item.checkState() == Qt.Checked))
+        layout.addWidget(layer_list)
+        buttons = QHBoxLayout()
+        for text, cb in [('+', lambda: self.canvas.add_layer()),
+                         ('-', lambda: self.canvas.remove_layer()),
+                         ('Up', lambda: self._move_layer(1)),
+                         ('Down', lambda: self._move_layer(-1))]:
+            btn = QPushButton(text)
+            btn.clicked.connect(cb)
+            buttons.addWidget(btn)
+        layout.addLayout(buttons)
+        layout.addWidget(QLabel('Opacity'))
+        self.layer_opacity = QSlider(Qt.Horizontal)
+        self.layer_opacity.setRange(0, 100)
+        # Hanya saat slider dilepas, supaya tidak merekam operasi per pixel geser
+        self.layer_opacity.sliderReleased.connect(
+            lambda: self.canvas.set_layer(self.canvas.image.active,
+                                          opacity=self.layer_opacity.value() / 100))
+        layout.addWidget(self.layer_opacity)
+        layout.addWidget(QLabel('Blend'))
+        self.layer_blend = QComboBox()
+        self.layer_blend.addItems(list(BLEND_MODES))
+        self.layer_blend.activated[str].connect(
+            lambda mode: self.canvas.set_layer(self.canvas.image.active, blend=mode))
+        layout.addWidget(self.layer_blend)
+        layout.addStretch(1)
+        dock.setWidget(panel)
+        self.addDockWidget(Qt.RightDockWidgetArea, dock)
+        self.layer_list = layer_list
+        self._refresh_layers()
+
+    def _layer_index(self, row):
+        return len(self.canvas.image.layers) - 1 - row
+
+    def _move_layer(self, step):
+        index = self.canvas.image.active
+        self.canvas.move_layer(index, index + step)
+
+    def _refresh_layers(self):
+        if self.layer_list is None:
+            return
+        stack = self.canvas.image
+        for widget in (self.layer_list, self.layer_opacity, self.layer_blend):
+            widget.blockSignals(True)
+        self.layer_list.clear()
+        for layer in reversed(stack.layers):
+            item = QListWidgetItem(layer.name)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if layer.visible else Qt.Unchecked)
+            self.layer_list.addItem(item)
+        self.layer_list.setCurrentRow(self._layer_index(stack.active))
+        self.layer_opacity.setValue(int(stack.current.opacity * 100))
+        self.layer_blend.setCurrentText(stack.current.blend)
+        for widget in (self.layer_list, self.layer_opacity, self.layer_blend):
+            widget.blockSignals(False)
 
     def _create_shortcuts(self):
         self.canvas.setFocusPolicy(Qt.StrongFocus)
@@ -483,6 +1580,7 @@ class MainWindow(QMainWindow):
             Qt.Key_C: Mode.CIRCLE,
             Qt.Key_F: Mode.FILL,
             Qt.Key_S: Mode.SELECT,
+            Qt.Key_W: Mode.WAND,
             Qt.Key_M: Mode.MOVE,
             Qt.Key_T: Mode.ROTATE,
             Qt.Key_E: Mode.SCALE,
@@ -490,15 +1588,19 @@ class MainWindow(QMainWindow):
             Qt.Key_Y: 'redo',
             Qt.Key_X: 'clear',
             Qt.Key_P: 'save',
+            Qt.Key_O: 'open',
             Qt.Key_Plus: 'zoom_in',
             Qt.Key_Minus: 'zoom_out',
+            Qt.Key_F3: 'hud',
+            Qt.Key_F4: 'trace',
+            Qt.Key_Delete: 'delete_shape',
         }
 
     def keyPressEvent(self, event):
         key = event.key()
         if key in self.shortcut_map:
             action = self.shortcut_map[key]
-            if action in [Mode.BRUSH, Mode.RECT, Mode.CIRCLE, Mode.FILL, Mode.SELECT, Mode.MOVE, Mode.ROTATE, Mode.SCALE]:
+            if action in [Mode.BRUSH, Mode.RECT, Mode.CIRCLE, Mode.FILL, Mode.SELECT, Mode.WAND, Mode.MOVE, Mode.ROTATE, Mode.SCALE]:
                 self.set_mode(action)
             elif action == 'undo':
                 self.canvas.undo()
@@ -508,21 +1610,129 @@ class MainWindow(QMainWindow):
                 self.canvas.clear()
             elif action == 'save':
                 self.save_canvas()
+            elif action == 'open':
+                self.open_canvas()
             elif action == 'zoom_in':
                 self.canvas.set_zoom(self.canvas.zoom * 1.1)
             elif action == 'zoom_out':
                 self.canvas.set_zoom(self.canvas.zoom / 1.1)
+            elif action == 'hud':
+                self.canvas.set_perf_hud(not self.canvas.perf.hud)
+            elif action == 'trace':
+                self.toggle_trace()
+            elif action == 'delete_shape' and self.canvas.selected_shape is not None:
+                self.canvas.delete_shape(self.canvas.selected_shape)
+
+    def toggle_trace(self):
+        # Mulai / hentikan rekaman Chrome trace (chrome://tracing, Perfetto)
+        profiler = self.canvas.perf
+        if profiler.events is None:
+            profiler.start_trace()
+            self.statusBar().showMessage('Tracing... press F4 again to save')
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, 'Save Trace', 'minipaint-trace.json', 'Trace Files (*.json)')
+        if path:
+            count = profiler.stop_trace(path)
+            self.statusBar().showMessage(f'Trace saved to {path} ({count} events)', 5000)
 
     def set_mode(self, mode):
         self.canvas.set_mode(mode)
         self.statusBar().showMessage(f'Mode: {mode}')
 
+    def open_canvas(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, 'Open Project', '', f'MiniPaint Project (*.{project.EXTENSION})')
+        if not path:
+            return
+        # Project dibuka di tab baru
+        canvas = self.add_document(os.path.basename(path))
+        try:
+            canvas.open_project(path)
+        except (OSError, ValueError) as e:
+            self.close_tab(self.tabs.indexOf(canvas))
+            QMessageBox.warning(self, 'Open Project', f'Cannot open {path}: {e}')
+            return
+        self.statusBar().showMessage(f'Opened {path}', 5000)
+
     def save_canvas(self):
-        path, _ = QFileDialog.getSaveFileName(
-            self, 'Save Image', '', 'PNG Files (*.png)')
-        if path:
-            self.canvas.save_image(path)
-            QMessageBox.information(self, 'Saved', f'Image saved to {path}')
+        formats = export.supported_formats()
+        name_filters = [f'MiniPaint Project (*.{project.EXTENSION})']
+        name_filters += [f'{fmt.upper()} Files (*.{fmt})' for fmt in formats]
+        current = self.canvas.project_file.path if self.canvas.project_file else ''
+        path, selected = QFileDialog.getSaveFileName(
+            self, 'Save Image', current, ';;'.join(name_filters))
+        if not path:
+            return
+        if project.is_project(path) or (selected == name_filters[0] and '.' not in os.path.basename(path)):
+            if not project.is_project(path):
+                path += '.' + project.EXTENSION
+            try:
+                self.canvas.save_project(path)
+            except OSError as e:
+                self.statusBar().showMessage(f'Save failed: {path}: {e}')
+            else:
+                if self.canvas is not self.session:
+                    self.tabs.setTabText(self.tabs.currentIndex(), os.path.basename(path))
+                self.statusBar().showMessage(f'Project saved to {path}', 5000)
+            return
+        fmt = export.format_of(path)
+        if fmt not in formats:
+            # Tanpa ekstensi yang dikenal: ikut filter yang dipilih
+            fmt = formats[name_filters.index(selected) - 1] if selected in name_filters[1:] else 'png'
+            path += '.' + fmt
+        option, low, high, default = export.FORMATS[fmt]
+        level = None
+        if option is not None:
+            level, ok = QInputDialog.getInt(
+                self, 'Save Image', f'{fmt.upper()} {option} ({low}-{high})',
+                self._export_level.get(fmt, default), low, high)
+            if not ok:
+                return
+            self._export_level[fmt] = level
+        self.canvas._end_stroke()
+        if self.exporter is None:
+            self._create_exporter()
+        job = self.exporter.export(self.canvas.image, path, fmt, level)
+        self._export_jobs[job] = 0.0
+        self._update_export_status()
+        self.statusBar().showMessage(f'Saving {path}...')
+
+    def _export_progress(self, job, value):
+        if job in self._export_jobs:
+            self._export_jobs[job] = value
+            self._update_export_status()
+
+    def _export_finished(self, job, path, error):
+        self._export_jobs.pop(job, None)
+        self._update_export_status()
+        if not error:
+            self.statusBar().showMessage(f'Image saved to {path}', 5000)
+        elif error == export.Exporter.CANCELLED:
+            self.statusBar().showMessage(f'Save cancelled: {path}', 5000)
+        else:
+            self.statusBar().showMessage(f'Save failed: {path}: {error}')
+
+    def _update_export_status(self):
+        jobs = self._export_jobs
+        for widget in (self._export_bar, self._export_cancel):
+            widget.setVisible(bool(jobs))
+        if jobs:
+            self._export_bar.setValue(int(1000 * sum(jobs.values()) / len(jobs)))
+            self._export_bar.setFormat(f'{len(jobs)} export(s) %p%')
+
+    def new_canvas(self):
+        w, ok = QInputDialog.getInt(self, 'New Image', 'Width',
+                                    self.canvas.image.width(), 1, 65536)
+        if not ok:
+            return
+        h, ok = QInputDialog.getInt(self, 'New Image', 'Height',
+                                    self.canvas.image.height(), 1, 65536)
+        if ok:
+            self.add_document().new_document(w, h)
+
+    def open_filter(self):
+        FilterDialog(self.canvas, self).exec_()
 
     def pick_color(self):
         color = QColorDialog.getColor(
@@ -533,6 +1743,8 @@ class MainWindow(QMainWindow):
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
-    window = MainWindow()
-    window.show()
+    window = MainWindow()  # sudah showMaximized
+    if os.environ.get('MINIPAINT_STARTUP_BENCH') == '1':
+        # Setelah frame pertama dan restore tab (bench.py --startup)
+        startup.after_first_paint(startup.exit_with_report)
     sys.exit(app.exec_())
@@ -0,0 +1,111 @@
+import json
+
+from PyQt5.QtCore import QPoint, QPointF, QRect
+from PyQt5.QtGui import QColor
+
+# Operasi canvas dalam bentuk dict JSON, sama dengan yang dipancarkan
+# Canvas.operation. Dipakai untuk batch render, journal, dan replay.
+#
+#   {"op": "brush", "points": [[x, y], ...], "color": "#ff000000", "size": 3,
+#    "spacing": 0.25, "smoothing": 0.0, "raster": "qpainter"}
+#   {"op": "line" | "rect" | "circle", "start": [x, y], "end": [x, y],
+#    "color": "#ff000000", "width": 3, "vector": false, "raster": "qpainter"}
+#   ("raster" = backend raster.py, hanya ditulis kalau bukan "qpainter")
+#   {"op": "shape", "action": "move", "id": 1, "move": [dx, dy]}
+#   {"op": "shape", "action": "delete", "id": 1}
+#   {"op": "fill", "point": [x, y], "color": "#ff000000",
+#    "connectivity": 4, "tolerance": 0}
+#   {"op": "transform", "rect": [x, y, w, h], "mode": "move" | "rotate" | "scale",
+#    "move": [dx, dy], "angle": 0, "scale": 1.0,
+#    "selection": [{"combine": "replace", "rect": [x, y, w, h]},
+#                  {"combine": "add" | "subtract" | "intersect", "wand": [x, y],
+#                   "connectivity": 4, "tolerance": 0}, ...]}
+#   ("selection" hanya ada kalau bukan satu rect; "rect" = bounding box-nya)
+#   {"op": "filter", "name": "gaussian_blur", "params": {"radius": 4},
+#    "rect": [x, y, w, h]}   (lihat filters.FILTERS)
+#   {"op": "clear"}, {"op": "undo"}, {"op": "redo"}, {"op": "new", "size": [w, h]}
+#   {"op": "open", "path": "/abs/doc.mpp"}   (dokumen native, lihat project.py)
+#   {"op": "layer", "action": "add", "name": null}
+#   {"op": "layer", "action": "remove" | "select", "index": 1}
+#   {"op": "layer", "action": "move", "index": 1, "to": 0}
+#   {"op": "layer", "action": "set", "index": 1, "opacity": 0.5, "blend": "multiply",
+#    "visible": true, "name": "Ink"}   (hanya field yang berubah)
+
+
+def load(path):
+    # File .json berisi {"size": [w, h], "ops": [...]} atau list op,
+    # file lain dibaca sebagai JSON lines (satu op per baris)
+    with open(path) as f:
+        if path.endswith('.json'):
+            doc = json.load(f)
+        else:
+            doc = [json.loads(line) for line in f if line.strip()]
+    if isinstance(doc, list):
+        doc = {'ops': doc}
+    return doc
+
+
+def apply(canvas, op):
+    kind = op['op']
+    if kind == 'brush':
+        canvas.brush_stroke([QPointF(*p) for p in op['points']],
+                            QColor(op['color']), op['size'],
+                            op.get('spacing'), op.get('smoothing'),
+                            op.get('raster', 'qpainter'))
+    elif kind in ('line', 'rect', 'circle'):
+        canvas.draw_shape(kind, QPoint(*op['start']), QPoint(*op['end']),
+                          QColor(op['color']), op['width'], op.get('vector', False),
+                          op.get('raster', 'qpainter'))
+    elif kind == 'fill':
+        canvas.flood_fill(QPoint(*op['point']), QColor(op['color']),
+                          op.get('connectivity', 4), op.get('tolerance', 0))
+    elif kind == 'transform':
+        canvas.transform_selection(QRect(*op['rect']), op.get('mode', 'move'),
+                                   op.get('move', (0, 0)), op.get('angle', 0),
+                                   op.get('scale', 1.0), op.get('selection'))
+    elif kind == 'filter':
+        canvas.apply_filter(op['name'], op.get('params', {}),
+                            QRect(*op['rect']) if 'rect' in op else None)
+    elif kind == 'clear':
+        canvas.clear()
+    elif kind == 'undo':
+        canvas.undo()
+    elif kind == 'redo':
+        canvas.redo()
+    elif kind == 'new':
+        canvas.new_document(*op['size'])
+    elif kind == 'open':
+        canvas.open_project(op['path'])
+    elif kind == 'layer':
+        _apply_layer(canvas, op)
+    elif kind == 'shape':
+        if op['action'] == 'move':
+            canvas.move_shape(op['id'], *op['move'])
+        elif op['action'] == 'delete':
+            canvas.delete_shape(op['id'])
+        else:
+            raise ValueError(f"unknown shape action: {op['action']}")
+    else:
+        raise ValueError(f'unknown op: {kind}')
+
+
+def _apply_layer(canvas, op):
+    action = op['action']
+    if action == 'add':
+        canvas.add_layer(op.get('name'))
+    elif action == 'remove':
+        canvas.remove_layer(op['index'])
+    elif action == 'select':
+        canvas.select_layer(op['index'])
+    elif action == 'move':
+        canvas.move_layer(op['index'], op['to'])
+    elif action == 'set':
+        props = {k: op[k] for k in ('name', 'opacity', 'blend', 'visible') if k in op}
+        canvas.set_layer(op['index'], **props)
+    else:
+        raise ValueError(f'unknown layer action: {action}')
+
+
+def replay(canvas, ops):
+    for op in ops:
+        apply(canvas, op)
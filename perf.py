@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QRect
+from PyQt5.QtGui import QColor, QFont
+
+# Profiler ringan untuk Canvas: durasi per operasi, frame time, latency
+# input -> paint, dan counter (memori history). Tampil sebagai HUD di atas
+# canvas dan/atau direkam sebagai Chrome trace (buka di chrome://tracing
+# atau ui.perfetto.dev). Kalau HUD dan trace mati, span() hampir gratis.
+
+MAX_EVENTS = 1000000  # batas event trace di memori
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'cat', 'start')
+
+    def __init__(self, profiler, name, cat):
+        self.profiler = profiler
+        self.name = name
+        self.cat = cat
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._finish(self.name, self.cat, self.start, time.perf_counter_ns())
+        return False
+
+
+class Stat:
+    __slots__ = ('last', 'avg', 'max', 'count')
+
+    def __init__(self):
+        self.last = self.avg = self.max = 0.0
+        self.count = 0
+
+    def add(self, ms):
+        self.last = ms
+        self.avg = ms if self.count == 0 else self.avg * 0.9 + ms * 0.1
+        self.max = max(self.max, ms)
+        self.count += 1
+
+
+class Profiler:
+    def __init__(self):
+        self.hud = False
+        self.hud_rect = QRect()
+        self.stats = OrderedDict()  # nama -> Stat (ms)
+        self.counters = {}
+        self.events = None  # list event trace selama merekam
+        self._epoch = time.perf_counter_ns()
+        self._input = None  # waktu input pertama yang belum tergambar
+        self._last_frame = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.hud or self.events is not None
+
+    def span(self, name, cat='canvas'):
+        if not self.enabled:
+            return _NULL
+        return _Span(self, name, cat)
+
+    def input(self):
+        # Dipanggil di event mouse; latency diukur sampai paint berikutnya selesai
+        if self.enabled and self._input is None:
+            self._input = time.perf_counter_ns()
+
+    def frame(self, start, end):
+        # Satu paintEvent selesai: catat frame time, interval dan latency
+        if not self.enabled:
+            return
+        self._record('frame', (end - start) / 1e6)
+        if self._last_frame is not None:
+            self._record('frame interval', (start - self._last_frame) / 1e6)
+        self._last_frame = start
+        if self._input is not None:
+            latency = (end - self._input) / 1e6
+            self._record('input latency', latency)
+            self._trace({'name': 'input latency', 'cat': 'input', 'ph': 'X',
+                         'ts': self._us(self._input), 'dur': latency * 1000})
+            self._input = None
+
+    def counter(self, name, value):
+        self.counters[name] = value
+        if self.events is not None:
+            self._trace({'name': name, 'ph': 'C', 'ts': self._us(time.perf_counter_ns()),
+                         'args': {name: value}})
+
+    def start_trace(self):
+        with self._lock:
+            self.events = []
+        self._trace({'name': 'thread_name', 'ph': 'M', 'args': {'name': 'gui'}})
+
+    def stop_trace(self, path):
+        # Tulis file Chrome trace dan berhenti merekam, return jumlah event
+        with self._lock:
+            events, self.events = self.events, None
+        if events is None:
+            return 0
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(events)
+
+    def _finish(self, name, cat, start, end):
+        self._record(name, (end - start) / 1e6)
+        self._trace({'name': name, 'cat': cat, 'ph': 'X',
+                     'ts': self._us(start), 'dur': (end - start) / 1000})
+
+    def _record(self, name, ms):
+        stat = self.stats.get(name)
+        if stat is None:
+            stat = self.stats[name] = Stat()
+        stat.add(ms)
+
+    def _trace(self, event):
+        events = self.events
+        if events is not None and len(events) < MAX_EVENTS:
+            event.setdefault('pid', os.getpid())
+            event.setdefault('tid', threading.get_ident())
+            with self._lock:
+                events.append(event)
+
+    def _us(self, ns):
+        return (ns - self._epoch) / 1000
+
+    def draw_hud(self, painter, rect):
+        lines = []
+        frame = self.stats.get('frame')
+        interval = self.stats.get('frame interval')
+        if frame is not None:
+            fps = 1000.0 / interval.avg if interval is not None and interval.avg > 0 else 0
+            lines.append(f'frame {frame.last:6.2f} ms  avg {frame.avg:6.2f}  {fps:5.1f} fps')
+        latency = self.stats.get('input latency')
+        if latency is not None:
+            lines.append(f'input->paint {latency.last:6.2f} ms  max {latency.max:6.2f}')
+        for name, stat in self.stats.items():
+            if name not in ('frame', 'frame interval', 'input latency'):
+                lines.append(f'{name:<16} {stat.last:7.2f} ms  avg {stat.avg:7.2f}  n={stat.count}')
+        for name, value in self.counters.items():
+            lines.append(f'{name:<16} {value:7.2f}')
+        if self.events is not None:
+            lines.append(f'tracing: {len(self.events)} events')
+        painter.save()
+        font = QFont('monospace', 9)
+        font.setStyleHint(QFont.Monospace)
+        painter.setFont(font)
+        height = painter.fontMetrics().height()
+        box = QRect(rect.left() + 8, rect.top() + 8,
+                    painter.fontMetrics().width('m') * 52, height * len(lines) + 8)
+        self.hud_rect = box
+        painter.fillRect(box, QColor(0, 0, 0, 170))
+        painter.setPen(Qt.white)
+        for i, line in enumerate(lines):
+            painter.drawText(box.left() + 6, box.top() + 4 + height * (i + 1) - 3, line)
+        painter.restore()
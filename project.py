@@ -0,0 +1,289 @@
+import json
+import mmap
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtGui import QColor, QImage
+
+from history import History
+from layers import LayerStack
+from tiles import PackedTile, decode_tile, encode_tile
+from vector import Shape
+
+# Format dokumen native (.mpp):
+#   MAGIC, header (offset, panjang index), chunk..., index
+# Chunk = satu tile terkompresi (tiles.encode_tile, sama dengan blob
+# journal). Index = JSON berisi ukuran, layer, shape, history dan view
+# (zoom, pan) dengan referensi tile {"chunk": [offset, panjang]}.
+#
+# Save incremental hanya menambah chunk untuk tile yang berubah sejak
+# save terakhir lalu index baru di akhir file; header baru ditulis paling
+# akhir, jadi crash di tengah save menyisakan dokumen lama yang utuh.
+# Kalau sampah (chunk/index lama) lebih dari separuh file, save berikutnya
+# menulis ulang file penuh. Open hanya membaca index: tile jadi PackedTile
+# yang di-decode dari mmap saat pertama dipakai.
+
+MAGIC = b'MPPROJ1\n'
+HEADER = struct.Struct('<QQ')
+EXTENSION = 'mpp'
+
+_pool = None
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+    return _pool
+
+
+class Chunks:
+    # File project yang di-mmap read-only
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = None
+        self.known = {}  # QImage.cacheKey() -> (offset, panjang) chunk berisi pixel sama
+        self.compact = False  # save berikutnya tulis ulang penuh
+        self.last_index = None  # index terakhir yang ditulis/dibaca
+        self.remap()
+
+    def remap(self):
+        # Setelah file diperpanjang save incremental. Map lama tidak ditutup
+        # eksplisit, bisa masih dibaca thread lain (export).
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def index(self):
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'not a MiniPaint project: {self.path}')
+        offset, length = HEADER.unpack_from(self._map, len(MAGIC))
+        self.last_index = self._map[offset:offset + length]
+        return json.loads(self.last_index)
+
+    def read(self, offset, length):
+        return self._map[offset:offset + length]
+
+    def load(self, offset, length):
+        tile = decode_tile(self.read(offset, length))
+        self.known[tile.cacheKey()] = (offset, length)
+        return tile
+
+    def pack(self, tile):
+        # PackedTile kalau pixel tile ini sudah ada di file, selain itu None
+        ref = self.known.get(tile.cacheKey())
+        return None if ref is None else PackedTile(self, *ref)
+
+    def close(self):
+        self._map = None
+        self._file.close()
+
+
+def is_project(path):
+    return path.rsplit('.', 1)[-1].lower() == EXTENSION
+
+
+def save(path, image, history=None, view=None, chunks=None):
+    # Tulis dokumen ke path, return Chunks untuk save/open berikutnya.
+    # chunks = hasil save/open sebelumnya dari file yang sama -> incremental.
+    incremental = (chunks is not None and not chunks.compact
+                   and os.path.abspath(chunks.path) == os.path.abspath(path)
+                   and os.path.exists(path))
+    state = document_state(image, history)
+
+    # Tile baru (belum ada di file) dikompres paralel, zlib melepas GIL
+    fresh = {}
+    for entries in [layer['tiles'] for layer in state['layers']] + state['undo'] + state['redo']:
+        for _, value in entries:
+            if isinstance(value, QImage):
+                key = value.cacheKey()
+                if not (incremental and key in chunks.known):
+                    fresh[key] = value
+
+    target = path if incremental else path + '.tmp'
+    written = {}  # cacheKey / (id source, offset) -> [offset, panjang]
+    live = [0]
+    with open(target, 'r+b' if incremental else 'w+b') as f:
+        if incremental:
+            f.seek(0, os.SEEK_END)
+        else:
+            f.write(MAGIC + HEADER.pack(0, 0))
+
+        def write(key, blob):
+            written[key] = [f.tell(), len(blob)]
+            live[0] += len(blob)
+            f.write(blob)
+
+        for key, blob in zip(fresh, _executor().map(encode_tile, fresh.values())):
+            write(key, blob)
+
+        def ref(value):
+            if isinstance(value, PackedTile):
+                key = (id(value.source), value.offset)
+                if incremental and value.source is chunks:
+                    return _reuse(written, live, key, [value.offset, value.length])
+                if key not in written:
+                    write(key, value.source.read(value.offset, value.length))
+                return {'chunk': written[key]}
+            key = value.cacheKey()
+            if key not in written:
+                offset, length = chunks.known[key]
+                return _reuse(written, live, (id(chunks), offset), [offset, length])
+            return {'chunk': written[key]}
+
+        index = to_index(state, ref)
+        index['view'] = view or {}
+        data = json.dumps(index).encode()
+        if incremental and not fresh and data == chunks.last_index:
+            return chunks  # tidak ada yang berubah
+        offset = f.tell()
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        # Header terakhir: sampai titik ini index lama masih berlaku
+        f.seek(len(MAGIC))
+        f.write(HEADER.pack(offset, len(data)))
+        f.flush()
+        os.fsync(f.fileno())
+        size = offset + len(data)
+
+    if incremental:
+        chunks.remap()
+        result = chunks
+    else:
+        os.replace(target, path)
+        result = Chunks(path)
+        _rebind(image, history, written, result)
+    # Tile yang barusan ditulis dikenal sebagai "bersih" untuk save berikutnya
+    for key in fresh:
+        result.known[key] = tuple(written[key])
+    result.last_index = data
+    result.compact = size > 2 * live[0] + (16 << 20)
+    return result
+
+
+def _reuse(written, live, key, ref):
+    # Chunk lama di file yang sama, dihitung sekali sebagai data hidup
+    if key not in written:
+        written[key] = ref
+        live[0] += ref[1]
+    return {'chunk': ref}
+
+
+def _rebind(image, history, written, chunks):
+    # Setelah tulis ulang penuh: PackedTile ke file lama diarahkan ke chunk
+    # di file baru, supaya save incremental berikutnya tidak menyalinnya lagi
+    def rebind(state):
+        if isinstance(state, PackedTile):
+            ref = written.get((id(state.source), state.offset))
+            if ref is not None:
+                return PackedTile(chunks, *ref)
+        return state
+
+    for layer in image.layers:
+        store = layer.image
+        for key, state in store._tiles.items():
+            if isinstance(state, PackedTile):
+                store._tiles[key] = rebind(state)
+        store.source = chunks
+    image.source = chunks
+    if history is not None:
+        for stack in (history.undo_stack, history.redo_stack):
+            for entry, _ in stack:
+                entry[:] = [(key, rebind(state)) for key, state in entry]
+
+
+def load(path):
+    # Buka dokumen tanpa decode tile, return (image, history, view, chunks)
+    chunks = Chunks(path)
+    index = chunks.index()
+    image, history = from_index(index, lambda ref: PackedTile(chunks, *ref['chunk']), chunks)
+    return image, history, index.get('view', {}), chunks
+
+
+# Pemetaan dokumen <-> index JSON, dipakai file project dan snapshot journal.
+# Keduanya hanya berbeda di referensi tile ({"chunk": ...} / {"blob": ...}).
+
+def document_state(image, history=None):
+    # Salinan dangkal state tile semua layer dan history (boleh di-encode di
+    # thread lain). Tile yang masih terkompresi di file project tidak di-decode.
+    layers = []
+    for layer in image.layers:
+        store = layer.image
+        tiles = []
+        for key, state in list(store._tiles.items()):
+            if not isinstance(state, PackedTile):
+                state = store.tile_snapshot(key)
+            tiles.append((key, state))
+        layers.append({
+            'id': layer.id, 'name': layer.name, 'opacity': layer.opacity,
+            'blend': layer.blend, 'visible': layer.visible, 'default': store.default,
+            'tiles': tiles,
+        })
+    return {
+        'width': image.width(), 'height': image.height(),
+        'tile_size': image.tile_size, 'active': image.active,
+        'next_id': image.next_id, 'layers': layers,
+        'shapes': [shape.to_dict() for shape in image.shapes.shapes.values()],
+        'shape_next_id': image.shapes.next_id,
+        'undo': [list(entry) for entry, _ in history.undo_stack] if history is not None else [],
+        'redo': [list(entry) for entry, _ in history.redo_stack] if history is not None else [],
+    }
+
+
+def to_index(state, ref):
+    # Index JSON dari document_state; ref(tile) -> referensi tile QImage/PackedTile
+    def value(state):
+        if state is None:
+            return {'none': True}
+        if isinstance(state, Shape):
+            return {'shape': state.to_dict()}
+        if isinstance(state, int):
+            return {'color': state}
+        return ref(state)
+
+    def tiles(entries):
+        return [[*key, value(state)] for key, state in entries]
+
+    index = {key: state[key] for key in ('width', 'height', 'tile_size', 'active', 'next_id')}
+    index['layers'] = [{**layer, 'tiles': tiles(layer['tiles'])} for layer in state['layers']]
+    index['shapes'] = state['shapes']
+    index['shape_next_id'] = state['shape_next_id']
+    index['undo'] = [tiles(entry) for entry in state['undo']]
+    index['redo'] = [tiles(entry) for entry in state['redo']]
+    return index
+
+
+def from_index(index, tile, source=None):
+    # Kebalikan to_index, return (image, history); tile(ref) -> state tile
+    def state(ref):
+        if 'none' in ref:
+            return None
+        if 'shape' in ref:
+            return Shape.from_dict(ref['shape'])
+        if 'color' in ref:
+            return ref['color']
+        return tile(ref)
+
+    def tiles(entries):
+        return [(tuple(entry[:-1]), state(entry[-1])) for entry in entries]
+
+    width, height = index['width'], index['height']
+    image = LayerStack(width, height, None, index['tile_size'],
+                       spill=width * height > 64 * 1024 * 1024)
+    image.source = source
+    for info in index['layers']:
+        layer = image.add_layer(info['name'], QColor.fromRgba(info['default']))
+        layer.id = info['id']
+        layer.opacity, layer.blend, layer.visible = info['opacity'], info['blend'], info['visible']
+        for key, value in tiles(info['tiles']):
+            layer.image.set_tile_state(key, value)
+    image.active = index['active']
+    image.next_id = index['next_id']
+    for data in index['shapes']:
+        image.shapes.put(data['id'], Shape.from_dict(data))
+    image.shapes.next_id = index['shape_next_id']
+    history = History()
+    history.load([tiles(entry) for entry in index['undo']],
+                 [tiles(entry) for entry in index['redo']], image)
+    return image, history
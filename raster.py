@@ -0,0 +1,386 @@
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QPoint, QPointF, QRect
+from PyQt5.QtGui import QColor, QPen
+
+from startup import lazy_module
+from stroke import brush_stamp
+from vector import LINE, RECT, CIRCLE
+
+np = lazy_module('numpy')
+
+# Backend rasterisasi untuk LINE / RECT / CIRCLE dan dab BRUSH.
+#   qpainter: QPainter (default, sama dengan sebelumnya)
+#   numpy   : algoritma raster klasik yang divektorkan, banyak primitive
+#             sekaligus: Bresenham (garis 1px), midpoint ellipse (outline
+#             1px), scanline fill polygon/rect/ellipse/disc (pen tebal).
+# Backend numpy menghasilkan span (ys, x0, x1) setengah terbuka lalu
+# menulisnya sekali ke tile (TiledImage.paint_spans), tanpa antialiasing.
+#
+# Garis 1px, rect dan ellipse 1px meniru aturan QPainter aliased (stroker
+# kosmetik dan drawEllipse_midpoint_i di paint engine raster); hanya
+# ellipse yang sangat pipih (sisi <= ~3 px) masih beda beberapa pixel.
+# Pen tebal dan dab memakai geometri: pen setebal w menutup pixel yang
+# jaraknya < w/2 dari garis geometri (koordinat tepi pixel, jadi digeser
+# setengah pixel). Dab QPainter antialiased sedangkan di sini tidak, jadi
+# backend numpy tidak pixel-compatible dan ditandai eksperimental di UI.
+
+QPAINTER = 'qpainter'
+NUMPY = 'numpy'
+
+
+def _ranges(lo, hi):
+    # Semua int [lo_i, hi_i) per item: (index item, nilai)
+    count = np.maximum(hi - lo, 0)
+    owner = np.repeat(np.arange(len(lo)), count)
+    start = np.cumsum(count) - count
+    return owner, lo[owner] + (np.arange(int(count.sum())) - start[owner])
+
+
+def _spans(*parts):
+    parts = [p for p in parts if len(p[0])]
+    if not parts:
+        empty = np.zeros(0, np.int64)
+        return empty, empty, empty
+    return tuple(np.concatenate([p[i] for p in parts]).astype(np.int64) for i in range(3))
+
+
+def _points(xs, ys):
+    return ys, xs, xs + 1
+
+
+# Primitive. Semua argumen array (satu elemen per primitive).
+
+def bresenham(x0, y0, x1, y1):
+    # Garis 1px seperti pen kosmetik QPainter aliased: melangkah per pixel
+    # sumbu mayor dari ujung kiri/atas (kedua ujung ikut), sumbu minor =
+    # floor posisi garis di tengah pixel (kemiringan positif) atau di tepi
+    # pixel (negatif). Kemiringan fixed-point 16.16 dipotong ke nol dan
+    # dimulai dari tutup setengah pixel seperti Qt, supaya seri sama persis.
+    steep = np.abs(y1 - y0) > np.abs(x1 - x0)
+    u0, v0 = np.where(steep, y0, x0), np.where(steep, x0, y0)
+    u1, v1 = np.where(steep, y1, x1), np.where(steep, x1, y1)
+    flip = u0 > u1
+    u0, u1 = np.where(flip, u1, u0), np.where(flip, u0, u1)
+    v0, v1 = np.where(flip, v1, v0), np.where(flip, v0, v1)
+    du, dv = u1 - u0, v1 - v0
+    inc = np.sign(dv) * ((np.abs(dv) << 16) // np.maximum(du, 1))
+    owner, i = _ranges(np.zeros_like(du), du + 1)
+    inc = inc[owner]
+    off = np.where(inc > 0, (i + 1) * inc - (inc >> 1), i * inc)
+    us, vs = u0[owner] + i, v0[owner] + (off >> 16)
+    steep = steep[owner]
+    return _points(np.where(steep, vs, us), np.where(steep, us, vs))
+
+
+_X_BITS = 21
+_X_OFFSET = 1 << (_X_BITS - 1)
+
+
+def polygons(xs, ys, counts):
+    # Scanline fill even-odd. xs/ys: vertex semua polygon berurutan,
+    # counts: jumlah vertex tiap polygon. Baris y diisi kalau ymin <= y < ymax
+    # pada edge-nya, pixel x kalau xl <= x < xr (aturan kiri-atas).
+    xs, ys = np.asarray(xs, np.float64), np.asarray(ys, np.float64)
+    counts = np.asarray(counts)
+    poly = np.repeat(np.arange(len(counts)), counts)
+    first = np.cumsum(counts) - counts
+    nxt = np.arange(len(xs)) + 1
+    last = first + counts - 1
+    nxt[last] = first
+    xa, ya, xb, yb = xs, ys, xs[nxt], ys[nxt]
+    edge = ya != yb
+    xa, ya, xb, yb, poly = xa[edge], ya[edge], xb[edge], yb[edge], poly[edge]
+    lo = np.ceil(np.minimum(ya, yb)).astype(np.int64)
+    hi = np.ceil(np.maximum(ya, yb)).astype(np.int64)
+    owner, y = _ranges(lo, hi)
+    if len(y) == 0:
+        return y, y, y
+    x = xa[owner] + (y - ya[owner]) * (xb[owner] - xa[owner]) / (yb[owner] - ya[owner])
+    # Urutkan per (polygon, baris, x) lewat satu key int64: x cukup
+    # dibandingkan setelah dibulatkan ke pixel
+    x = np.clip(np.ceil(x), -_X_OFFSET, _X_OFFSET - 1).astype(np.int64) + _X_OFFSET
+    top = int(y.min())
+    rows = int(y.max()) - top + 1
+    key = np.sort(((poly[owner] * rows + (y - top)) << _X_BITS) | x)
+    y = (key >> _X_BITS) % rows + top
+    x = (key & (2 * _X_OFFSET - 1)) - _X_OFFSET
+    # Tiap (polygon, baris) punya jumlah potongan genap: pasangkan berurutan
+    return y[0::2], x[0::2], x[1::2]
+
+
+def ellipse_fill(cx, cy, a, b):
+    # Isi ellipse pusat (cx, cy) radius (a, b), float
+    lo = np.floor(cy - b).astype(np.int64) + 1
+    hi = np.ceil(cy + b).astype(np.int64)
+    owner, y = _ranges(lo, hi)
+    t = (y - cy[owner]) / b[owner]
+    half = a[owner] * np.sqrt(np.maximum(1 - t * t, 0))
+    return (y, np.ceil(cx[owner] - half).astype(np.int64),
+            np.ceil(cx[owner] + half).astype(np.int64))
+
+
+def ellipse_ring(cx, cy, a, b, h):
+    # Outline ellipse setebal 2h: ellipse (a+h, b+h) dikurangi (a-h, b-h)
+    lo = np.floor(cy - b - h).astype(np.int64) + 1
+    hi = np.ceil(cy + b + h).astype(np.int64)
+    owner, y = _ranges(lo, hi)
+    cx, dy = cx[owner], y - cy[owner]
+    ao, bo = a[owner] + h[owner], b[owner] + h[owner]
+    ai, bi = a[owner] - h[owner], b[owner] - h[owner]
+    outer = ao * np.sqrt(np.maximum(1 - (dy / bo) ** 2, 0))
+    inside = (ai > 0) & (bi > 0) & (np.abs(dy) < bi)
+    inner = np.zeros_like(outer)
+    inner[inside] = ai[inside] * np.sqrt(1 - (dy[inside] / bi[inside]) ** 2)
+    left = np.ceil(cx - outer).astype(np.int64)
+    right = np.ceil(cx + outer).astype(np.int64)
+    il = np.ceil(cx - inner).astype(np.int64)
+    ir = np.ceil(cx + inner).astype(np.int64)
+    # Baris tanpa lubang: satu span penuh, selain itu dua span
+    solid = ~inside
+    return _spans((y[solid], left[solid], right[solid]),
+                  (y[inside], left[inside], il[inside]),
+                  (y[inside], ir[inside], right[inside]))
+
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+
+def _isqrt_ceil(n):
+    # Int terkecil r >= 0 dengan r * r >= n (sqrt float lalu dikoreksi)
+    n = np.maximum(n, 0)
+    r = np.ceil(np.sqrt(n.astype(np.float64))).astype(np.int64)
+    r = np.where((r > 0) & ((r - 1) * (r - 1) >= n), r - 1, r)
+    return np.where(r * r < n, r + 1, r)
+
+
+def _running(ufunc, values, owner):
+    # ufunc.accumulate (np.maximum / np.minimum) per item, owner berurutan:
+    # tiap item digeser cukup jauh supaya tidak terbawa nilai item lain
+    if len(values) == 0:
+        return values
+    span = int(values.max() - values.min()) + 1
+    shift = owner * span if ufunc is np.maximum else -owner * span
+    return ufunc.accumulate(values + shift) - shift
+
+
+def midpoint_ellipse(left, top, w, h):
+    # Outline 1px persis seperti fast path QPainter aliased
+    # (drawEllipse_midpoint_i): satu kuadran dijalankan dengan algoritma
+    # midpoint (a = w/2, b = h/2) dari puncak, lalu dicerminkan sesuai
+    # paritas w/h. Nilai keputusan d selalu polinom int (dikali 16), jadi
+    # langkah berurutannya bisa dihitung sekaligus: region 1 per baris
+    # (akhir span tidak pernah mundur: cummax), region 2 per baris (x naik
+    # paling banyak 1: cummin).
+    ww, hh = w * w, h * h
+    y0 = (h + 1) // 2
+    owner, k = _ranges(np.zeros_like(y0), y0 + 1)
+    y = y0[owner] - k
+    wo, ho = ww[owner], hh[owner]
+    # Region 1: span baris berakhir di x pertama dengan d >= 0. d awal Qt
+    # memakai b, bukan y0, jadi untuk h ganjil ada konstanta geser.
+    shift = wo * ((h[owner] - 1) ** 2 - (2 * y0[owner] - 1) ** 2)
+    r = _isqrt_ceil(wo * ho - wo * (2 * y - 1) ** 2 - shift)
+    first = np.maximum(_ceil_div(r, 2 * h[owner]) - 1, 0)
+    end = _running(np.maximum, first - k, owner) + k
+    start = np.zeros_like(end)
+    start[1:] = end[:-1] + 1
+    start[k == 0] = 0
+    # Region 1 selesai di x pertama yang tidak lagi a²(2y - 1) > 2b²(x + 1)
+    limit = _ceil_div(wo * (2 * y - 1), 2 * ho) - 1
+    rows = np.cumsum(y0 + 1) - (y0 + 1)
+    last = np.minimum.reduceat(np.where(limit <= end, k, k.max() + 1), rows)
+    stop = k == last[owner]
+    end = np.where(stop, np.maximum(start, limit), end)
+    keep = k <= last[owner]
+    x_end, y_end = end[stop], y[stop]
+    # Region 2: tiap baris ke bawah x naik satu kalau titik tengah
+    # (x + 1/2, y) masih di dalam ellipse
+    owner2, j = _ranges(np.ones_like(y_end), np.maximum(y_end - (h & 1), 0) + 1)
+    v = y_end[owner2] - j
+    r = _isqrt_ceil(ww[owner2] * (hh[owner2] - 4 * v * v))
+    target = np.maximum(_ceil_div(r, h[owner2]) // 2, x_end[owner2])
+    x = np.minimum(_running(np.minimum, target - j, owner2), x_end[owner2]) + j
+    owner = np.concatenate((owner[keep], owner2))
+    y = np.concatenate((y[keep], v))
+    x0 = np.concatenate((start[keep], x))
+    length = np.concatenate((end[keep] + 1 - start[keep], np.ones_like(x)))
+    # Cermin seperti drawEllipsePoints
+    w, h = w[owner], h[owner]
+    mid_x = left[owner] + (w + 1) // 2
+    mid_y = top[owner] + (h + 1) // 2
+    xr = x0 + mid_x
+    xl = 2 * mid_x - xr - (length - 1) - (w & 1)
+    xl_end = np.minimum(xl + length, xr)
+    yt = mid_y - y
+    yb = 2 * mid_y - yt - (h & 1)
+    return _spans((yt, xl, xl_end), (yt, xr, xr + length),
+                  (yb, xl, xl_end), (yb, xr, xr + length))
+
+
+def discs(cx, cy, diameter):
+    # Lingkaran penuh (dab brush), semua dengan diameter sama
+    r = np.full(len(cx), diameter / 2.0)
+    return ellipse_fill(cx, cy, r, r)
+
+
+def capsules(x0, y0, x1, y1, h):
+    # Garis tebal RoundCap: pixel yang jaraknya < h dari segmen. Kapsul
+    # konveks, jadi tiap baris cukup satu span: gabungan interval badan
+    # (persegi panjang miring) dan dua tutup bulat, tanpa sort.
+    lo = np.floor(np.minimum(y0, y1) - h).astype(np.int64) + 1
+    hi = np.ceil(np.maximum(y0, y1) + h).astype(np.int64)
+    owner, y = _ranges(lo, hi)
+    ax, ay, bx, by = x0[owner], y0[owner], x1[owner], y1[owner]
+    left = np.full(len(y), np.inf)
+    right = np.full(len(y), -np.inf)
+    for cx, cy in ((ax, ay), (bx, by)):
+        r2 = h * h - (y - cy) ** 2
+        s = np.sqrt(np.maximum(r2, 0))
+        inside = r2 > 0
+        left = np.where(inside, np.minimum(left, cx - s), left)
+        right = np.where(inside, np.maximum(right, cx + s), right)
+    # Badan: |n.(p - a)| < h dan 0 <= u.(p - a) <= L, keduanya linear di x
+    length = np.hypot(bx - ax, by - ay)
+    safe = np.maximum(length, 1e-12)
+    ux, uy = (bx - ax) / safe, (by - ay) / safe
+    ey = y - ay
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n1, n2 = (ux * ey - h) / uy, (ux * ey + h) / uy
+        a1, a2 = -uy * ey / ux, (length - uy * ey) / ux
+    flat_n = np.abs(uy) < 1e-12  # segmen horizontal: syarat normal hanya di y
+    open_n = flat_n & (np.abs(ux * ey) < h)
+    n_lo = np.where(flat_n, np.where(open_n, -np.inf, np.inf), np.minimum(n1, n2))
+    n_hi = np.where(flat_n, np.where(open_n, np.inf, -np.inf), np.maximum(n1, n2))
+    flat_a = np.abs(ux) < 1e-12  # segmen vertikal: syarat sumbu hanya di y
+    open_a = flat_a & (uy * ey >= 0) & (uy * ey <= length)
+    a_lo = np.where(flat_a, np.where(open_a, -np.inf, np.inf), np.minimum(a1, a2))
+    a_hi = np.where(flat_a, np.where(open_a, np.inf, -np.inf), np.maximum(a1, a2))
+    body_lo, body_hi = np.maximum(n_lo, a_lo) + ax, np.minimum(n_hi, a_hi) + ax
+    body = (body_lo < body_hi) & (length > 0)
+    left = np.where(body, np.minimum(left, body_lo), left)
+    right = np.where(body, np.maximum(right, body_hi), right)
+    keep = left < right
+    return (y[keep], np.ceil(left[keep]).astype(np.int64),
+            np.ceil(right[keep]).astype(np.int64))
+
+
+# Bentuk tool canvas (koordinat geometri int seperti Canvas.draw_shape)
+
+def lines(x0, y0, x1, y1, width=1):
+    # Garis dengan RoundCap: Bresenham untuk 1px, selain itu kapsul
+    if width <= 1:
+        return bresenham(x0, y0, x1, y1)
+    return capsules(x0 - 0.5, y0 - 0.5, x1 - 0.5, y1 - 0.5, width / 2.0)
+
+
+def _boxes(x0, y0, x1, y1):
+    # Rect geometri seperti QPainter.drawRect(QRect(start, end)): tepi di
+    # x0 dan x1 + 1 (lebar QRect = x1 - x0 + 1, tidak dinormalisasi)
+    left, right = np.minimum(x0, x1 + 1), np.maximum(x0, x1 + 1)
+    top, bottom = np.minimum(y0, y1 + 1), np.maximum(y0, y1 + 1)
+    return left, top, right, bottom
+
+
+def rects(x0, y0, x1, y1, width=1):
+    # Outline rect setebal width: pita atas/bawah penuh, kiri/kanan di antaranya
+    left, top, right, bottom = _boxes(x0, y0, x1, y1)
+    h = max(width, 1) / 2.0
+    ol, ot = np.ceil(left - h).astype(np.int64), np.ceil(top - h).astype(np.int64)
+    orr, ob = np.ceil(right + h).astype(np.int64), np.ceil(bottom + h).astype(np.int64)
+    il, it = np.ceil(left + h).astype(np.int64), np.ceil(top + h).astype(np.int64)
+    ir, ib = np.ceil(right - h).astype(np.int64), np.ceil(bottom - h).astype(np.int64)
+    hollow = (ir > il) & (ib > it)
+    # Rect yang terlalu kecil untuk punya lubang: isi penuh
+    it, ib = np.where(hollow, it, ob), np.where(hollow, ib, ob)
+    owner, y = _ranges(ot, it)
+    top_band = (y, ol[owner], orr[owner])
+    owner, y = _ranges(ib, ob)
+    bottom_band = (y, ol[owner], orr[owner])
+    owner, y = _ranges(it, ib)
+    return _spans(top_band, bottom_band, (y, ol[owner], il[owner]), (y, ir[owner], orr[owner]))
+
+
+def ellipses(x0, y0, x1, y1, width=1):
+    # Ellipse di dalam QRect(start, end) yang dinormalisasi (drawEllipse
+    # menormalisasi rect, drawRect tidak)
+    left, right = np.minimum(x0, x1), np.maximum(x0, x1) + 1
+    top, bottom = np.minimum(y0, y1), np.maximum(y0, y1) + 1
+    if width <= 1:
+        return midpoint_ellipse(left, top, right - left, bottom - top)
+    cx, cy = (left + right) / 2.0, (top + bottom) / 2.0
+    a, b = (right - left) / 2.0, (bottom - top) / 2.0
+    return ellipse_ring(cx - 0.5, cy - 0.5, a, b, np.full(len(cx), width / 2.0))
+
+
+SHAPES = {LINE: lines, RECT: rects, CIRCLE: ellipses}
+
+
+class QPainterBackend:
+    name = QPAINTER
+    label = 'qpainter'
+    note = 'QPainter (default)'
+
+    def shapes(self, image, rect, kind, coords, rgba, width):
+        # coords: [(x0, y0, x1, y1), ...]; image: TiledImage, rect: area tulis
+        painter = image.painter(rect)
+        color = QColor.fromRgba(rgba)
+        if kind == LINE:
+            painter.setPen(QPen(color, width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
+        else:
+            painter.setPen(QPen(color, width))
+        for x0, y0, x1, y1 in coords:
+            start, end = QPoint(int(x0), int(y0)), QPoint(int(x1), int(y1))
+            if kind == LINE:
+                painter.drawLine(start, end)
+            elif kind == RECT:
+                painter.drawRect(QRect(start, end))
+            elif kind == CIRCLE:
+                painter.drawEllipse(QRect(start, end))
+        painter.end()
+
+    def dabs(self, image, rect, points, size, rgba):
+        # points: [(x, y), ...] posisi tengah dab (float)
+        stamp = brush_stamp(size, rgba)
+        r = stamp.width() / 2.0
+        painter = image.painter(rect)
+        for x, y in points:
+            painter.drawImage(QPointF(x - r, y - r), stamp)
+        painter.end()
+
+
+def _paint(image, rect, spans, rgba):
+    # Tulis span, dipotong ke rect (area yang sudah dicatat History)
+    ys, x0, x1 = spans
+    keep = (ys >= rect.top()) & (ys <= rect.bottom())
+    image.paint_spans(ys[keep], np.maximum(x0[keep], rect.left()),
+                      np.minimum(x1[keep], rect.right() + 1), rgba)
+
+
+class NumpyBackend:
+    name = NUMPY
+    label = 'numpy (experimental)'
+    note = ('Not pixel-compatible with QPainter: brush dabs have no antialiasing, '
+            'thick lines and ellipses may differ at the edges')
+
+    def shapes(self, image, rect, kind, coords, rgba, width):
+        coords = np.asarray(coords, np.int64).reshape(-1, 4)
+        _paint(image, rect, SHAPES[kind](*coords.T, width=width), rgba)
+
+    def dabs(self, image, rect, points, size, rgba):
+        # Dab brush QPainter berpusat di (x, y) pada koordinat tepi pixel,
+        # di sini pusat pixel: geser setengah pixel
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        _paint(image, rect, discs(points[:, 0] - 0.5, points[:, 1] - 0.5, size), rgba)
+
+
+BACKENDS = OrderedDict((b.name, b) for b in (QPainterBackend(), NumpyBackend()))
+
+
+def get(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f'unknown raster backend: {name}') from None
+
@@ -0,0 +1,112 @@
+import math
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QRect, QRectF, QPointF
+from PyQt5.QtGui import QImage, QPainter
+
+# Render cache untuk paintEvent: hanya area yang terlihat yang di-resample.
+# Zoom < 1 memakai mip pyramid berbasis tile (level L = 1/2^L), zoom >= 1
+# menggambar langsung dari image, nearest-neighbour mulai NEAREST_ZOOM.
+
+NEAREST_ZOOM = 2.0
+
+
+class RenderCache:
+    def __init__(self, tile_size=256, max_tiles=256):
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()  # (level, tx, ty) -> QImage
+
+    def invalidate(self, rect=None):
+        # Buang tile mip yang menutupi rect (koordinat image), None = semua
+        if rect is None:
+            self._tiles.clear()
+            return
+        rect = rect.normalized()
+        if rect.isEmpty() or not self._tiles:
+            return
+        for level in {key[0] for key in self._tiles}:
+            span = self.tile_size << level
+            for ty in range(rect.top() // span, rect.bottom() // span + 1):
+                for tx in range(rect.left() // span, rect.right() // span + 1):
+                    self._tiles.pop((level, tx, ty), None)
+
+    def draw(self, painter, image, zoom, origin, clip):
+        # origin: posisi widget dari pixel (0, 0) image, clip: rect widget yang digambar
+        src = self.visible_rect(image, zoom, origin, clip)
+        if src.isEmpty():
+            return
+        level = self._level(zoom, image)
+        if level == 0:
+            painter.setRenderHint(QPainter.SmoothPixmapTransform,
+                                  zoom < NEAREST_ZOOM)
+            painter.drawImage(self._target(src, zoom, origin), image.copy(src))
+            return
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+        span = self.tile_size << level
+        for ty in range(src.top() // span, src.bottom() // span + 1):
+            for tx in range(src.left() // span, src.right() // span + 1):
+                tile_src = self._source_rect(level, tx, ty, image)
+                tile = self._tile(level, tx, ty, image)
+                painter.drawImage(self._target(tile_src, zoom, origin), tile)
+
+    def visible_rect(self, image, zoom, origin, clip):
+        # Rect widget -> rect image yang terlihat (dibulatkan ke luar)
+        x0 = math.floor((clip.left() - origin.x()) / zoom)
+        y0 = math.floor((clip.top() - origin.y()) / zoom)
+        x1 = math.ceil((clip.right() + 1 - origin.x()) / zoom)
+        y1 = math.ceil((clip.bottom() + 1 - origin.y()) / zoom)
+        return QRect(x0, y0, x1 - x0, y1 - y0).intersected(image.rect())
+
+    def _target(self, src, zoom, origin):
+        return QRectF(QPointF(origin) + QPointF(src.topLeft()) * zoom,
+                      QPointF(origin) + QPointF(src.left() + src.width(),
+                                                src.top() + src.height()) * zoom)
+
+    def _level(self, zoom, image):
+        if zoom >= 1.0:
+            return 0
+        level = int(math.floor(math.log2(1.0 / zoom)))
+        # Jangan lebih kecil dari 1 pixel
+        max_level = max(0, int(math.log2(max(image.width(), image.height(), 1))))
+        return min(level, max_level)
+
+    def _source_rect(self, level, tx, ty, image):
+        span = self.tile_size << level
+        return QRect(tx * span, ty * span, span, span).intersected(image.rect())
+
+    def _tile(self, level, tx, ty, image):
+        key = (level, tx, ty)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+        src = self._source_rect(level, tx, ty, image)
+        scale = 1 << level
+        w = max(1, math.ceil(src.width() / scale))
+        h = max(1, math.ceil(src.height() / scale))
+        if level == 1:
+            parent = image.copy(src)
+        else:
+            # Gabungkan 4 tile level di bawahnya lalu perkecil 1/2
+            half = scale // 2
+            parent = QImage(math.ceil(src.width() / half),
+                            math.ceil(src.height() / half),
+                            QImage.Format_ARGB32_Premultiplied)
+            parent.fill(Qt.transparent)
+            painter = QPainter(parent)
+            painter.setCompositionMode(QPainter.CompositionMode_Source)
+            ts = self.tile_size
+            for j in range(2):
+                for i in range(2):
+                    child_src = self._source_rect(level - 1, tx * 2 + i, ty * 2 + j, image)
+                    if not child_src.isEmpty():
+                        painter.drawImage(i * ts, j * ts,
+                                          self._tile(level - 1, tx * 2 + i, ty * 2 + j, image))
+            painter.end()
+        tile = parent.scaled(w, h, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        tile = tile.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+        self._tiles[key] = tile
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return tile
@@ -0,0 +1,276 @@
+from PyQt5.QtCore import QRect
+from PyQt5.QtGui import QImage
+
+from imagebuf import image_array, channels
+from startup import lazy_module
+
+np = lazy_module('numpy')
+
+# Selection berbentuk mask: (rect, mask) dengan mask array bool seukuran
+# rect, atau None kalau seluruh rect terpilih. Magic wand memakai
+# connected-component labeling berbasis run (span horizontal) yang
+# seluruhnya vektor NumPy: run per baris -> pasangan run yang bersentuhan
+# antar baris -> union-find paralel (hook + pointer jumping). Labeling
+# dikerjakan per pita baris, hanya untuk pita yang dicapai dari seed:
+# komponen yang tercapai menjalar ke pita tetangga lewat baris tepinya.
+
+REPLACE = 'replace'
+ADD = 'add'
+SUBTRACT = 'subtract'
+INTERSECT = 'intersect'
+COMBINE = (REPLACE, ADD, SUBTRACT, INTERSECT)
+
+
+def color_mask(arr, rgba, tolerance=0):
+    # Pixel yang selisih per channel-nya (A, R, G, B) <= tolerance dari rgba
+    if tolerance <= 0:
+        return arr == np.uint32(rgba)
+    target = channels(np.array([rgba], np.uint32))[0].astype(np.int16)
+    lo = np.clip(target - tolerance, 0, 255).astype(np.uint8)
+    span = (np.clip(target + tolerance, 0, 255) - lo).astype(np.uint8)
+    # (c - lo) mod 256 <= span  <=>  lo <= c <= hi. Dikerjakan per baris
+    # sebagai array byte datar (lo/span diulang selebar baris) supaya
+    # NumPy memakai loop kontigu, bukan broadcast per channel.
+    h, w = arr.shape
+    rows = np.ascontiguousarray(arr).view(np.uint8).reshape(h, w * 4)
+    ok = np.subtract(rows, np.tile(lo, w), dtype=np.uint8) <= np.tile(span, w)
+    return ok.view(np.uint32) == 0x01010101
+
+
+def runs(mask):
+    # Run True per baris: (y, x0, x1) setengah terbuka, urut (y, x0).
+    # Tiap baris diberi satu kolom False di akhir supaya run tidak
+    # menyambung ke baris berikutnya, lalu dicari perubahan di array 1D.
+    h, w = mask.shape
+    padded = np.zeros((h, w + 1), bool)
+    padded[:, :w] = mask
+    flat = padded.reshape(-1)
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    if flat[0]:
+        change = np.concatenate(([0], change))
+    # Perubahan bergantian: awal run, akhir run, awal run, ...
+    starts, ends = change[0::2], change[1::2]
+    ys, x0 = np.divmod(starts, w + 1)
+    return ys, x0, ends - ys * (w + 1)
+
+
+def label_runs(mask, connectivity=4):
+    # Run mask (lihat runs) + label komponen tiap run (root = index run
+    # terkecil), return (ys, x0, x1, labels)
+    ys, x0, x1 = runs(mask)
+    n = len(ys)
+    labels = np.arange(n)
+    if n < 2:
+        return ys, x0, x1, labels
+    # Posisi awal/akhir run di array datar (baris diberi kolom kosong seperti
+    # di runs, jadi x1 eksklusif masih di baris yang sama), urut naik
+    stride = mask.shape[1] + 1
+    begin, end = ys * stride + x0, ys * stride + x1
+    # Run j di baris y + 1 menyentuh run baris y dengan index lo..hi-1 yang
+    # berurutan: yang berakhir setelah x0 dan mulai sebelum x1 (8-conn:
+    # termasuk yang bersentuhan diagonal).
+    below = np.flatnonzero(ys > 0)
+    diagonal = connectivity != 4
+    lo = np.searchsorted(end, begin[below] - stride + (not diagonal))
+    hi = np.searchsorted(begin, end[below] - stride + diagonal)
+    touch = hi > lo
+    below, lo, hi = below[touch], lo[touch], hi[touch]
+    # Pasangan: j dengan run pertama rentangnya, dan run bertetangga dalam
+    # satu rentang satu sama lain (rentang antar j tidak tumpang tindih)
+    cover = np.cumsum(np.bincount(lo, minlength=n + 1) - np.bincount(hi - 1, minlength=n + 1))
+    chain = np.flatnonzero(cover[:n - 1] > 0)
+    a = np.concatenate((below, chain))
+    b = np.concatenate((lo, chain + 1))
+    while True:
+        la, lb = labels[a], labels[b]
+        differ = la != lb
+        if not differ.any():
+            return ys, x0, x1, labels
+        # Pasangan yang sudah satu komponen tidak diperiksa lagi
+        a, b = a[differ], b[differ]
+        # Hook: root yang lebih besar menunjuk ke yang lebih kecil. Kalau
+        # satu root dapat beberapa tujuan, salah satu menang, sisanya
+        # tersambung di putaran berikutnya.
+        la, lb = la[differ], lb[differ]
+        labels[np.maximum(la, lb)] = np.minimum(la, lb)
+        # Pointer jumping sampai semua run menunjuk langsung ke root
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+
+
+def runs_mask(ys, x0, x1):
+    # (rect, mask) dari kumpulan run
+    top, bottom = int(ys.min()), int(ys.max()) + 1
+    left, right = int(x0.min()), int(x1.max())
+    w = right - left
+    # Run dalam satu baris tidak bersentuhan, jadi posisi awal/akhir unik;
+    # +1 di awal, -1 di akhir, lalu cumsum 1D
+    delta = np.zeros((bottom - top) * (w + 1), np.int8)
+    row = (ys - top) * (w + 1) - left
+    delta[row + x0] = 1
+    delta[row + x1] = -1
+    mask = np.cumsum(delta, dtype=np.int8).view(bool).reshape(bottom - top, w + 1)[:, :w]
+    return QRect(left, top, w, bottom - top), mask
+
+
+class _Band:
+    # Pita baris [top, top + tinggi) dari mask beserta run dan labelnya.
+    # reached ditandai per root: run terpilih = reached[labels].
+
+    def __init__(self, mask, top, connectivity):
+        self.top = top
+        self.mask = mask
+        self.height, self.width = mask.shape
+        self.ys, self.x0, self.x1, self.labels = label_runs(mask, connectivity)
+        self.rows = np.searchsorted(self.ys, np.arange(self.height + 1))
+        self.reached = np.zeros(len(self.ys), bool)
+        self.diagonal = connectivity != 4
+
+    def seed(self, x, y):
+        # Tandai komponen yang memuat pixel (x, y) lokal
+        start = self.rows[y]
+        run = start + np.searchsorted(self.x0[start:self.rows[y + 1]], x, side='right') - 1
+        self.reached[self.labels[run]] = True
+
+    def edge(self, y):
+        # Pixel terpilih di baris lokal y (diperlebar 1 untuk 8-conn),
+        # None kalau tidak ada
+        rows = slice(self.rows[y], self.rows[y + 1])
+        picked = self.reached[self.labels[rows]]
+        if not picked.any():
+            return None
+        delta = np.zeros(self.width + 1, np.int8)
+        delta[self.x0[rows][picked]] = 1
+        delta[self.x1[rows][picked]] = -1
+        line = np.cumsum(delta, dtype=np.int8)[:-1].view(bool)
+        if self.diagonal:
+            grown = line.copy()
+            grown[1:] |= line[:-1]
+            grown[:-1] |= line[1:]
+            return grown
+        return line
+
+    def reach(self, y, line):
+        # Tandai komponen run baris lokal y yang menyentuh line, True kalau
+        # ada komponen baru
+        rows = slice(self.rows[y], self.rows[y + 1])
+        total = np.concatenate(([0], np.cumsum(line, dtype=np.int32)))
+        roots = self.labels[rows][total[self.x1[rows]] > total[self.x0[rows]]]
+        roots = roots[~self.reached[roots]]
+        self.reached[roots] = True
+        return len(roots) > 0
+
+    def picked(self):
+        picked = self.reached[self.labels]
+        return self.ys[picked] + self.top, self.x0[picked], self.x1[picked]
+
+
+def magic_wand(arr, x, y, connectivity=4, tolerance=0, band=64):
+    # Area terhubung dengan (x, y) yang warnanya mirip, sebagai (rect, mask).
+    # arr cukup punya .shape dan arr[y0:y1] (array 2D atau TiledImage.rows()).
+    # Pixel, mask warna dan label pita dibaca saat pita pertama dicapai, jadi
+    # area kecil di gambar besar tidak memproses seluruh gambar.
+    h, w = arr.shape
+    if x < 0 or y < 0 or x >= w or y >= h:
+        return None
+    rgba = int(arr[y][x])
+    count = (h + band - 1) // band
+    bands = {}
+
+    def get(i):
+        if i not in bands:
+            rows = arr[i * band:(i + 1) * band]
+            bands[i] = _Band(color_mask(rows, rgba, tolerance), i * band, connectivity)
+        return bands[i]
+
+    get(y // band).seed(x, y % band)
+    queue = [y // band]
+    while queue:
+        i = queue.pop()
+        current = bands[i]
+        # Baris tepi pita ini -> baris tepi pita tetangga (hanya pita
+        # terakhir yang bisa lebih pendek dari band)
+        for j, src, dst in ((i - 1, 0, band - 1), (i + 1, current.height - 1, 0)):
+            if j < 0 or j >= count:
+                continue
+            line = current.edge(src)
+            if line is None:
+                continue
+            if get(j).reach(dst, line) and j not in queue:
+                queue.append(j)
+    if len(bands) == count and all(b.reached[b.labels].all() for b in bands.values()):
+        # Semua pixel yang mirip terhubung: mask = candidate itu sendiri
+        return crop(QRect(0, 0, w, h), np.concatenate([bands[i].mask for i in range(count)]))
+    ys, x0, x1 = (np.concatenate(part) for part in zip(*(b.picked() for b in bands.values())))
+    return runs_mask(ys, x0, x1)
+
+
+def _expand(selection, rect):
+    # Mask selection dalam koordinat rect (rect memuat selection)
+    sel_rect, mask = selection
+    out = np.zeros((rect.height(), rect.width()), bool)
+    part = sel_rect.intersected(rect)
+    if part.isEmpty():
+        return out
+    dst = out[part.top() - rect.top():part.bottom() + 1 - rect.top(),
+              part.left() - rect.left():part.right() + 1 - rect.left()]
+    if mask is None:
+        dst[:] = True
+    else:
+        dst[:] = mask[part.top() - sel_rect.top():part.bottom() + 1 - sel_rect.top(),
+                      part.left() - sel_rect.left():part.right() + 1 - sel_rect.left()]
+    return out
+
+
+def crop(rect, mask):
+    # Perkecil ke bounding box pixel terpilih, None kalau kosong
+    if mask is None:
+        return None if rect.isEmpty() else (rect, None)
+    rows = np.flatnonzero(mask.any(axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    mask = mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    rect = QRect(rect.left() + int(cols[0]), rect.top() + int(rows[0]),
+                 mask.shape[1], mask.shape[0])
+    return (rect, None) if mask.all() else (rect, mask)
+
+
+def combine(current, new, op=REPLACE):
+    # Gabungkan dua selection (rect, mask) / None
+    if op == REPLACE or current is None:
+        return new if op in (REPLACE, ADD) else None
+    if new is None:
+        return current if op in (ADD, SUBTRACT) else None
+    if op == ADD:
+        rect = current[0].united(new[0])
+        return crop(rect, _expand(current, rect) | _expand(new, rect))
+    if op == SUBTRACT:
+        rect = current[0]
+        return crop(rect, _expand(current, rect) & ~_expand(new, rect))
+    if op == INTERSECT:
+        rect = current[0].intersected(new[0])
+        if rect.isEmpty():
+            return None
+        return crop(rect, _expand(current, rect) & _expand(new, rect))
+    raise ValueError(f'unknown selection op: {op}')
+
+
+def mask_image(mask):
+    # QImage ARGB32 hitam opaque di pixel terpilih, transparan di luar
+    image = QImage(mask.shape[1], mask.shape[0], QImage.Format_ARGB32)
+    image_array(image)[:] = np.where(mask, np.uint32(0xff000000), np.uint32(0))
+    return image
+
+
+def outline_image(mask, rgba=0xff3070ff):
+    # Pixel tepi mask (terpilih tapi bertetangga dengan yang tidak)
+    padded = np.zeros((mask.shape[0] + 2, mask.shape[1] + 2), bool)
+    padded[1:-1, 1:-1] = mask
+    inner = (padded[:-2, 1:-1] & padded[2:, 1:-1] & padded[1:-1, :-2] & padded[1:-1, 2:])
+    image = QImage(mask.shape[1], mask.shape[0], QImage.Format_ARGB32)
+    image_array(image)[:] = np.where(mask & ~inner, np.uint32(rgba), np.uint32(0))
+    return image
@@ -0,0 +1,419 @@
+import argparse
+import asyncio
+import json
+import os
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import ops
+from layers import LayerStack
+from imagebuf import image_array
+from tiles import decode_tile, encode_tile
+from vector import Shape
+
+# Sesi gambar bersama (stand-in lokal). Server asyncio memberi nomor urut
+# global ke pesan dari semua client lalu meneruskannya ke semua client,
+# termasuk pengirimnya. Satu pesan = op (lihat ops.py) + delta tile: state
+# terbaru key yang berubah karena op itu (History.changed), tile pixel
+# dikompres dengan encode_tile. Client tidak me-replay op gambar, hanya
+# memasang delta sesuai urutan server, jadi semua canvas konvergen (per
+# tile, pesan terakhir yang menang). Op tanpa delta yang mengubah struktur
+# dokumen (new, layer) di-replay dengan ops.apply.
+#
+# Client yang bergabung belakangan menerima snapshot (struktur + tile per
+# key, hasil melipat pesan lama) lalu tail pesan setelah snapshot.
+#
+# Frame: FRAME (panjang header JSON, panjang payload) + header + payload.
+#   {"type": "snapshot", "client": 1, "size": [w, h], "seq": 0,
+#    "structure": [op, ...], "tiles": [[key..., ref], ...]}
+#   {"type": "op", "seq": 5, "client": 1, "local": 3, "op": {...},
+#    "tiles": [[key..., ref], ...]}
+#   ref = {"blob": [offset, panjang]} di payload | {"color": argb} |
+#         {"shape": {...}} | {"none": true}
+
+FRAME = struct.Struct('<II')
+PORT = 8765
+
+_pool = None
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+    return _pool
+
+
+def frame(header, payload=b''):
+    data = json.dumps(header).encode()
+    return FRAME.pack(len(data), len(payload)) + data + payload
+
+
+async def read_frame(reader):
+    header_len, payload_len = FRAME.unpack(await reader.readexactly(FRAME.size))
+    header = json.loads(await reader.readexactly(header_len))
+    payload = await reader.readexactly(payload_len) if payload_len else b''
+    return header, payload
+
+
+def _is_pixels(state):
+    return state is not None and not isinstance(state, (int, Shape))
+
+
+def _solid(state):
+    # Tile pixel yang semua pixelnya sama (mis. hasil fill) jadi warna saja,
+    # penerima tidak perlu mengalokasikan pixel
+    if not _is_pixels(state):
+        return state
+    arr = image_array(state, readonly=True)
+    value = arr[0, 0]
+    return int(value) if (arr == value).all() else state
+
+
+def encode_tiles(tiles):
+    # [(key, state)] -> (refs JSON, payload)
+    tiles = [(key, _solid(state)) for key, state in tiles]
+    pixels = [state for _, state in tiles if _is_pixels(state)]
+    blobs = iter(_executor().map(encode_tile, pixels) if len(pixels) > 4
+                 else map(encode_tile, pixels))
+    refs, payload, offset = [], [], 0
+    for key, state in tiles:
+        if state is None:
+            ref = {'none': True}
+        elif isinstance(state, Shape):
+            ref = {'shape': state.to_dict()}
+        elif isinstance(state, int):
+            ref = {'color': state}
+        else:
+            blob = next(blobs)
+            ref = {'blob': [offset, len(blob)]}
+            payload.append(blob)
+            offset += len(blob)
+        refs.append([*key, ref])
+    return refs, b''.join(payload)
+
+
+def decode_tiles(refs, payload):
+    tiles = []
+    for entry in refs:
+        ref = entry[-1]
+        if 'none' in ref:
+            state = None
+        elif 'shape' in ref:
+            state = Shape.from_dict(ref['shape'])
+        elif 'color' in ref:
+            state = ref['color']
+        else:
+            offset, length = ref['blob']
+            state = decode_tile(payload[offset:offset + length])
+        tiles.append((tuple(entry[:-1]), state))
+    return tiles
+
+
+def structural(op):
+    # Op yang direplay apa adanya (tidak punya delta tile). Pilih layer
+    # aktif urusan masing-masing client.
+    return op['op'] == 'new' or (op['op'] == 'layer' and op['action'] != 'select')
+
+
+class SessionServer:
+    # Tanpa Qt: tile disimpan sebagai blob terkompresi dari client
+    def __init__(self, width, height, snapshot_every=256):
+        self.size = [width, height]
+        self.snapshot_every = snapshot_every
+        self.seq = 0
+        self.base = 0  # seq terakhir yang sudah dilipat ke snapshot
+        self.structure = []  # op struktur sampai base
+        self.tiles = OrderedDict()  # key -> (ref, blob) sampai base
+        self.tail = []  # (header, payload, frame) setelah base
+        self.port = None
+        self._clients = {}  # id -> asyncio.Queue berisi frame keluar
+        self._connections = {}  # id -> (task handler, writer)
+        self._next_client = 1
+        self._server = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def close(self):
+        # Koneksi client ditutup supaya handler selesai sendiri (EOF), bukan
+        # di-cancel di tengah read
+        self._server.close()
+        handlers = []
+        for task, writer in list(self._connections.values()):
+            writer.close()
+            handlers.append(task)
+        await asyncio.gather(*handlers, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        client = self._next_client
+        self._next_client += 1
+        queue = asyncio.Queue()
+        # Snapshot + tail masuk antrean dan client didaftarkan tanpa await
+        # di antaranya: tidak ada pesan yang terlewat atau terkirim dua kali
+        queue.put_nowait(self._snapshot(client))
+        for _, _, data in self.tail:
+            queue.put_nowait(data)
+        self._clients[client] = queue
+        self._connections[client] = (asyncio.current_task(), writer)
+        sender = asyncio.ensure_future(self._send(writer, queue))
+        try:
+            while True:
+                header, payload = await read_frame(reader)
+                self._publish(client, header, payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self._clients[client]
+            del self._connections[client]
+            queue.put_nowait(None)
+            await sender
+            writer.close()
+
+    async def _send(self, writer, queue):
+        while True:
+            data = await queue.get()
+            if data is None:
+                return
+            writer.write(data)
+            # Frame yang sudah antre ikut ditulis sebelum drain
+            if queue.empty():
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    return
+
+    def _publish(self, client, header, payload):
+        self.seq += 1
+        header['seq'] = self.seq
+        header['client'] = client
+        data = frame(header, payload)
+        self.tail.append((header, payload, data))
+        for queue in self._clients.values():
+            queue.put_nowait(data)
+        if len(self.tail) >= self.snapshot_every:
+            self._fold()
+
+    def _fold(self):
+        # Lipat tail ke snapshot: struktur ditambah, tile per key ditimpa
+        for header, payload, _ in self.tail:
+            op = header.get('op')
+            if op is not None and op['op'] == 'new':
+                self.structure = []
+                self.tiles.clear()
+            if op is not None and structural(op):
+                self.structure.append(op)
+            for entry in header.get('tiles', ()):
+                ref = entry[-1]
+                blob = b''
+                if 'blob' in ref:
+                    offset, length = ref['blob']
+                    blob = payload[offset:offset + length]
+                key = tuple(entry[:-1])
+                self.tiles.pop(key, None)
+                self.tiles[key] = (ref, blob)
+        self.base = self.tail[-1][0]['seq']
+        self.tail = []
+
+    def _snapshot(self, client):
+        refs, payload, offset = [], [], 0
+        for key, (ref, blob) in self.tiles.items():
+            if blob:
+                ref = {'blob': [offset, len(blob)]}
+                payload.append(blob)
+                offset += len(blob)
+            refs.append([*key, ref])
+        return frame({'type': 'snapshot', 'client': client, 'size': self.size,
+                      'seq': self.base, 'structure': self.structure, 'tiles': refs},
+                     b''.join(payload))
+
+
+class LoopThread:
+    # Event loop asyncio di thread sendiri
+    def __init__(self, name='session'):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def call(self, coro, timeout=None):
+        # Jalankan coroutine di loop, tunggu hasilnya
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        # Task yang masih jalan dibatalkan dulu supaya loop bisa ditutup bersih
+        self.call(_cancel_tasks())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+async def _spawn(coro):
+    # Task di loop pemanggil (LoopThread.call), return task-nya
+    return asyncio.ensure_future(coro)
+
+
+async def _cancel_tasks():
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def serve_in_thread(width, height, host='127.0.0.1', port=0, **kwargs):
+    # Server lokal di thread sendiri (UI, test, bench), return (server, thread)
+    thread = LoopThread('session-server')
+    server = SessionServer(width, height, **kwargs)
+    thread.call(server.start(host, port))
+    return server, thread
+
+
+def stop_server(server, thread):
+    thread.call(server.close())
+    thread.stop()
+
+
+class SessionClient(QObject):
+    # Menghubungkan satu Canvas ke server. Jaringan, encode dan decode tile
+    # di thread asyncio sendiri; pesan masuk dipasang di thread GUI lewat
+    # signal (queued connection).
+    received = pyqtSignal(object, object)  # header, [(key, state)]
+    applied = pyqtSignal(dict)  # header pesan yang sudah dipasang
+    closed = pyqtSignal()
+
+    def __init__(self, canvas, host='127.0.0.1', port=PORT):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.client = None  # id dari server, diisi snapshot
+        self.seq = 0  # pesan terakhir yang dipasang
+        self._pending = OrderedDict()  # id lokal -> [tiles, ditimpa pesan lain]
+        self._next_local = 0
+        self._applying = False
+        self._thread = LoopThread('session-client')
+        try:
+            self._reader, self._writer = self._thread.call(asyncio.open_connection(host, port))
+        except OSError:
+            self._thread.stop()
+            raise
+        self.received.connect(self._apply)
+        canvas.operation.connect(self._local)
+        self._receiver = self._thread.call(_spawn(self._receive()))
+
+    def close(self):
+        self.canvas.operation.disconnect(self._local)
+        self._thread.call(self._disconnect())
+        self._thread.stop()
+
+    async def _disconnect(self):
+        # Task penerima dihentikan dulu, baru koneksi ditutup
+        self._receiver.cancel()
+        await asyncio.gather(self._receiver, return_exceptions=True)
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def _receive(self):
+        own = None
+        try:
+            while True:
+                header, payload = await read_frame(self._reader)
+                if header['type'] == 'snapshot':
+                    own = header['client']
+                # Pesan sendiri tidak perlu di-decode (tile lokal masih ada)
+                tiles = [] if header.get('client') == own and header['type'] == 'op' \
+                    else decode_tiles(header.get('tiles', ()), payload)
+                self.received.emit(header, tiles)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.closed.emit()
+
+    async def _send(self, header, tiles):
+        header['tiles'], payload = encode_tiles(tiles)
+        self._writer.write(frame(header, payload))
+        await self._writer.drain()
+
+    def _local(self, op):
+        history = self.canvas.history
+        if self._applying or self.client is None:
+            history.changed.clear()
+            return
+        keys = list(history.changed)
+        history.changed.clear()
+        if not keys and not structural(op):
+            return
+        # Salinan copy-on-write; encode di thread jaringan
+        tiles = [(key, self.canvas.image.tile_snapshot(key)) for key in keys]
+        self._next_local += 1
+        self._pending[self._next_local] = [tiles, False]
+        self._thread.submit(self._send({'type': 'op', 'local': self._next_local, 'op': op}, tiles))
+
+    def _apply(self, header, tiles):
+        canvas = self.canvas
+        self._applying = True
+        try:
+            if header['type'] == 'snapshot':
+                self.client = header['client']
+                self._pending.clear()
+                width, height = header['size']
+                canvas.set_document(LayerStack(width, height,
+                                               spill=width * height > 64 * 1024 * 1024))
+                for op in header['structure']:
+                    ops.apply(canvas, op)
+                canvas.apply_tiles(tiles)
+            elif header['client'] == self.client:
+                # Pesan sendiri kembali: sudah terpasang lokal, kecuali tile-nya
+                # sempat ditimpa pesan client lain yang urutannya lebih awal.
+                # Tile yang juga ditulis op lokal berikutnya (masih pending)
+                # tidak dipasang ulang: op itu yang terbaru di urutan server.
+                own, overwritten = self._pending.pop(header['local'])
+                if overwritten:
+                    later = {key for tiles_, _ in self._pending.values() for key, _ in tiles_}
+                    canvas.apply_tiles([(key, state) for key, state in own if key not in later])
+            else:
+                keys = {key for key, _ in tiles}
+                for pending in self._pending.values():
+                    if not pending[1] and any(key in keys for key, _ in pending[0]):
+                        pending[1] = True
+                op = header['op']
+                if tiles:
+                    canvas.apply_tiles(tiles)
+                elif structural(op):
+                    ops.apply(canvas, op)
+        finally:
+            self._applying = False
+        self.seq = header['seq']
+        self.applied.emit(header)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='MiniPaint shared canvas session server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--size', type=int, nargs=2, default=(800, 600), metavar=('W', 'H'))
+    args = parser.parse_args(argv)
+
+    async def run():
+        server = SessionServer(*args.size)
+        port = await server.start(args.host, args.port)
+        print(f'session {args.size[0]}x{args.size[1]} on {args.host}:{port}')
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
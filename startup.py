@@ -0,0 +1,153 @@
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+# Startup cepat + restore sesi.
+#
+# lazy_module: modul berat (NumPy) baru di-import saat atributnya pertama
+# dipakai, jadi window bisa tampil sebelum subsistem NumPy (tiles, fill,
+# filter, selection, raster, ...) dibutuhkan; setelah frame pertama
+# preload mengimpornya di background. MINIPAINT_LAZY=0 mematikannya.
+#
+# State sesi (tool, warna, ukuran, zoom/pan, tab project yang terbuka)
+# disimpan sebagai JSON kecil di samping journal; ditulis di thread
+# background setiap kali berubah. Isi dokumen tab sesi sendiri dipulihkan
+# oleh journal (lihat journal.py).
+#
+# MARKS mencatat waktu (perf_counter) tiap tahap startup: start (awal
+# main.py), imports, window, paint (frame pertama canvas), restore (tab
+# project sesi lalu dibuka lagi). Pekerjaan yang tidak perlu untuk frame
+# pertama didaftarkan lewat after_first_paint. MINIPAINT_STARTUP_BENCH=1
+# mencetak report() sebagai JSON lalu keluar (bench.py --startup).
+
+STATE_VERSION = 1
+MARKS = {}
+_after_paint = []
+
+
+def mark(name):
+    MARKS[name] = time.perf_counter()
+
+
+def report():
+    # ms sejak mark 'start'
+    start = MARKS.get('start', 0.0)
+    return {name: round((t - start) * 1000, 2) for name, t in MARKS.items()}
+
+
+def after_first_paint(fn):
+    # fn dijalankan lewat event loop setelah frame pertama, urut daftar
+    _after_paint.append(fn)
+
+
+def first_paint():
+    from PyQt5.QtCore import QTimer
+    mark('paint')
+    for fn in _after_paint:
+        QTimer.singleShot(0, fn)
+    _after_paint.clear()
+
+
+def exit_with_report():
+    from PyQt5.QtCore import QCoreApplication
+    print(json.dumps(report()), flush=True)
+    QCoreApplication.quit()
+
+
+class _LazyModule:
+    # Atribut yang sudah dipakai disalin ke instance, akses berikutnya
+    # secepat atribut modul biasa. (importlib.util.LazyLoader tidak cukup:
+    # statement import membaca __spec__ dan langsung memuat modulnya.)
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self.__name), attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return f'<lazy module {self.__name!r}>'
+
+
+def lazy_module(name):
+    if name in sys.modules or os.environ.get('MINIPAINT_LAZY', '1') == '0':
+        return importlib.import_module(name)
+    return _LazyModule(name)
+
+
+def preload(*names):
+    # Import di thread background (setelah frame pertama) supaya fill/filter
+    # pertama tidak menunggu import NumPy
+    missing = [name for name in names if name not in sys.modules]
+    if missing:
+        threading.Thread(target=lambda: [importlib.import_module(name) for name in missing],
+                         name='preload').start()
+
+
+def default_path():
+    return os.path.join(os.path.expanduser('~'), '.minipaint', 'state.json')
+
+
+def load_state(path=None):
+    # None kalau belum ada / rusak / versi lain
+    try:
+        with open(path or default_path()) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+        return None
+    return state
+
+
+def write_state(state, path=None):
+    path = path or default_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'version': STATE_VERSION, **state}, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+class StateWriter:
+    # Tulis state terbaru di thread background; state yang datang selagi
+    # menulis menggantikan yang masih antre (hanya yang terakhir ditulis)
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        self.last = None  # state terakhir yang diminta
+        self._next = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='state-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, state):
+        if state == self.last:
+            return
+        self.last = state
+        with self._cond:
+            self._next = state
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._next is None and not self._closed:
+                    self._cond.wait()
+                state, self._next = self._next, None
+                if state is None:
+                    return
+            try:
+                write_state(state, self.path)
+            except OSError:
+                pass
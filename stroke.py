@@ -0,0 +1,91 @@
+import math
+from functools import lru_cache
+
+from PyQt5.QtCore import Qt, QPointF, QRect, QRectF
+from PyQt5.QtGui import QColor, QImage, QPainter
+
+# Stroke engine untuk BRUSH: event mouse dikumpulkan lalu digambar sekali
+# per frame (satu tulisan per flush) sebagai deretan stamp (dab), lewat
+# backend raster.py (stamp antialiased QPainter atau disc NumPy).
+
+
+@lru_cache(maxsize=64)
+def brush_stamp(size, rgba):
+    # Dab bulat antialiased ukuran size, disimpan per (size, warna)
+    dim = size + 2
+    stamp = QImage(dim, dim, QImage.Format_ARGB32_Premultiplied)
+    stamp.fill(Qt.transparent)
+    painter = QPainter(stamp)
+    painter.setRenderHint(QPainter.Antialiasing)
+    painter.setPen(Qt.NoPen)
+    painter.setBrush(QColor.fromRgba(rgba))
+    painter.drawEllipse(QRectF(1, 1, size, size))
+    painter.end()
+    return stamp
+
+
+class StrokeEngine:
+    def __init__(self, spacing=0.25, smoothing=0.0):
+        self.spacing = spacing  # jarak antar dab, relatif ke ukuran brush
+        self.smoothing = smoothing  # 0 = tanpa smoothing, mendekati 1 = sangat halus
+        self._active = False
+        self._queue = []
+        self._dabs = []
+        self._last = None
+        self._carry = 0.0
+
+    def is_active(self):
+        return self._active
+
+    def begin(self, pos, color, size, backend='qpainter'):
+        self._active = True
+        self.backend = backend  # lihat raster.BACKENDS
+        self.size = max(1, int(size))
+        self.color = QColor(color)
+        self.stamp = brush_stamp(self.size, QColor(color).rgba())
+        self._last = QPointF(pos)
+        self._carry = 0.0
+        self._queue = []
+        self._dabs = [QPointF(pos)]
+        self.points = [QPointF(pos)]  # input mentah, untuk disimpan sebagai operasi
+
+    def add_point(self, pos):
+        # Dipanggil dari mouseMoveEvent: cukup antrikan, digambar saat flush
+        self._queue.append(QPointF(pos))
+        self.points.append(QPointF(pos))
+
+    def prepare(self):
+        # Ubah event yang antri jadi posisi dab, return rect image yang akan ditulis
+        step = max(1.0, self.spacing * self.size)
+        keep = self.smoothing
+        for target in self._queue:
+            p = self._last + (target - self._last) * (1.0 - keep)
+            dx, dy = p.x() - self._last.x(), p.y() - self._last.y()
+            dist = math.hypot(dx, dy)
+            if dist > 0:
+                t = step - self._carry
+                while t <= dist:
+                    self._dabs.append(QPointF(self._last.x() + dx * t / dist,
+                                              self._last.y() + dy * t / dist))
+                    t += step
+                self._carry = dist - (t - step)
+                self._last = p
+        self._queue = []
+        if not self._dabs:
+            return QRect()
+        xs = [d.x() for d in self._dabs]
+        ys = [d.y() for d in self._dabs]
+        r = self.stamp.width() / 2.0
+        return QRect(int(math.floor(min(xs) - r)), int(math.floor(min(ys) - r)),
+                     int(math.ceil(max(xs) - min(xs) + 2 * r)) + 1,
+                     int(math.ceil(max(ys) - min(ys) + 2 * r)) + 1)
+
+    def take_dabs(self):
+        # Posisi tengah dab [(x, y), ...] yang siap digambar (raster.py)
+        dabs, self._dabs = self._dabs, []
+        return [(d.x(), d.y()) for d in dabs]
+
+    def end(self):
+        self._active = False
+        self._queue = []
+        self._dabs = []
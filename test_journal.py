@@ -0,0 +1,74 @@
+import os
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import pytest  # noqa: E402
+from PyQt5.QtCore import QPoint  # noqa: E402
+from PyQt5.QtGui import QColor  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+from journal import Journal  # noqa: E402
+from main import Canvas  # noqa: E402
+
+
+@pytest.fixture(scope='module', autouse=True)
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def _draw(canvas, i):
+    canvas.draw_shape('rect', QPoint(10 * i, 10), QPoint(10 * i + 8, 40), QColor('red'), 3, False)
+
+
+def _session(directory, **kwargs):
+    canvas = Canvas()
+    journal = Journal(canvas, str(directory), **kwargs)
+    return canvas, journal, journal.recover()
+
+
+def _pixels(canvas):
+    return canvas.image.copy()
+
+
+def test_corrupt_snapshot_falls_back_and_keeps_journaling(tmp_path):
+    canvas, journal, _ = _session(tmp_path)
+    _draw(canvas, 1)
+    journal.snapshot(wait=True)
+    journal._segment.close()
+    (snapshot,) = tmp_path.glob('snapshot-*.mps')
+    snapshot.write_bytes(b'garbage')
+
+    canvas, journal, replayed = _session(tmp_path)
+    assert replayed == 0
+    assert journal.corrupt == [str(snapshot) + '.corrupt']
+    assert not snapshot.exists()
+    # Journal tetap aktif: op baru dicatat dan dipulihkan di launch berikutnya
+    _draw(canvas, 2)
+    expected = _pixels(canvas)
+    journal._segment.close()
+    canvas, journal, replayed = _session(tmp_path)
+    assert replayed == 1 and not journal.corrupt
+    assert _pixels(canvas) == expected
+
+
+def test_truncated_segment_keeps_intact_ops(tmp_path):
+    canvas, journal, _ = _session(tmp_path, snapshot_every=1000)
+    for i in range(3):
+        _draw(canvas, i)
+        if i == 1:
+            expected = _pixels(canvas)
+    journal._segment.close()
+    (segment,) = tmp_path.glob('journal-*.jsonl')
+    data = segment.read_bytes()
+    segment.write_bytes(data[:-20])  # op terakhir terpotong saat crash
+
+    canvas, journal, replayed = _session(tmp_path)
+    assert replayed == 2
+    assert journal.corrupt == [str(segment) + '.corrupt']
+    assert _pixels(canvas) == expected
+    _draw(canvas, 5)
+    expected = _pixels(canvas)
+    journal._segment.close()
+    canvas, journal, replayed = _session(tmp_path)
+    assert replayed == 3 and not journal.corrupt
+    assert _pixels(canvas) == expected
@@ -0,0 +1,134 @@
+import os
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import pytest  # noqa: E402
+from PyQt5.QtCore import QPoint, QPointF  # noqa: E402
+from PyQt5.QtGui import QColor  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+import session  # noqa: E402
+from main import Canvas  # noqa: E402
+
+SIZE = 300
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def server(app):
+    # Server lokal in-process, snapshot_every kecil supaya tail cepat dilipat
+    server, thread = session.serve_in_thread(SIZE, SIZE, snapshot_every=3)
+    links = []
+
+    def join():
+        canvas = Canvas()
+        link = session.SessionClient(canvas, port=server.port)
+        links.append(link)
+        wait(app, lambda: link.client is not None)
+        return canvas, link
+
+    yield server, join, links
+    for link in links:
+        link.close()
+    session.stop_server(server, thread)
+
+
+def wait(app, ready, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not ready():
+        assert time.monotonic() < deadline, 'session did not converge'
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def settle(app, server, links):
+    # Semua op lokal sudah kembali dari server dan semua pesan terpasang
+    wait(app, lambda: all(not link._pending and link.seq == server.seq for link in links))
+
+
+def assert_same(canvases):
+    first = canvases[0].image
+    for canvas in canvases[1:]:
+        assert len(canvas.image.layers) == len(first.layers)
+        assert canvas.image.copy() == first.copy()
+
+
+def test_concurrent_ops_converge(app, server):
+    server, join, links = server
+    canvases = [join()[0] for _ in range(3)]
+    a, b, c = canvases
+    # Tanpa processEvents di antaranya: op saling menimpa tile yang sama
+    a.draw_shape('rect', QPoint(10, 10), QPoint(200, 150), QColor('red'), 5, False)
+    b.draw_shape('rect', QPoint(50, 40), QPoint(250, 220), QColor('blue'), 7, False)
+    c.brush_stroke([QPointF(0, 0), QPointF(290, 290)], QColor('green'), 9)
+    settle(app, server, links)
+    a.flood_fill(QPoint(100, 100), QColor('yellow'))
+    b.undo()
+    settle(app, server, links)
+    assert_same(canvases)
+
+
+def test_overwritten_pending_tiles_are_reapplied(app, server):
+    server, join, links = server
+    (a, link_a), (b, _) = join(), join()
+    b.draw_shape('rect', QPoint(0, 0), QPoint(100, 100), QColor('blue'), 9, False)
+    # Op b sampai di server lebih dulu, a belum memasangnya saat menggambar
+    deadline = time.monotonic() + 10
+    while server.seq < 1:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    a.draw_shape('rect', QPoint(0, 0), QPoint(100, 100), QColor('red'), 9, False)
+    assert len(link_a._pending) == 1
+    settle(app, server, links)
+    # Urutan server: b lalu a, jadi tile a yang menang di semua client
+    assert QColor(a.image.pixel(2, 2)) == QColor('red')
+    assert_same([a, b])
+
+
+def test_late_joiner_gets_snapshot_and_tail(app, server):
+    server, join, links = server
+    (a, _), (b, _) = join(), join()
+    a.add_layer('Ink')
+    b.draw_shape('circle', QPoint(20, 20), QPoint(180, 160), QColor('black'), 4, False)
+    a.set_layer(1, opacity=0.5, blend='multiply')
+    a.brush_stroke([QPointF(5, 250), QPointF(250, 5)], QColor('purple'), 6)
+    a.draw_shape('line', QPoint(0, 299), QPoint(299, 0), QColor('orange'), 3, True)
+    settle(app, server, links)
+    assert server.base > 0 and server.tail  # sebagian dilipat, sisanya di tail
+    late, _ = join()
+    settle(app, server, links)
+    assert late.image.layers[1].name == 'Ink'
+    assert late.image.layers[1].blend == 'multiply'
+    assert len(late.image.shapes) == len(a.image.shapes) == 1
+    assert_same([a, b, late])
+
+
+def test_stale_own_echo_keeps_later_local_op(app, server):
+    server, join, links = server
+    (a, link_a), (b, _) = join(), join()
+    b.draw_shape('rect', QPoint(0, 0), QPoint(100, 100), QColor('blue'), 9, False)
+    deadline = time.monotonic() + 10
+    while server.seq < 1:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    # op1 (merah) ditimpa op b yang urutannya lebih awal
+    a.draw_shape('rect', QPoint(0, 0), QPoint(100, 100), QColor('red'), 9, False)
+    drawn = []
+
+    def paint_again(header):
+        # op2 (hijau) dibuat setelah op b terpasang, sebelum echo op1 datang
+        if header['client'] != link_a.client and not drawn:
+            drawn.append(header['seq'])
+            a.draw_shape('rect', QPoint(0, 0), QPoint(100, 100), QColor('green'), 9, False)
+
+    link_a.applied.connect(paint_again)
+    settle(app, server, links)
+    assert drawn and len(link_a._pending) == 0
+    # Urutan server: b, op1, op2, jadi op2 yang menang di semua client
+    assert QColor(a.image.pixel(2, 2)) == QColor('green')
+    assert_same([a, b])
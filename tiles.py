@@ -0,0 +1,495 @@
+import struct
+import tempfile
+import zlib
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QRect, QSize
+from PyQt5.QtGui import QColor, QImage, QPainter
+
+from imagebuf import image_array
+from startup import lazy_module
+
+np = lazy_module('numpy')
+
+# Penyimpanan image berbasis tile yang sparse. Tile yang belum pernah
+# ditulis tidak dialokasikan (dianggap berwarna seragam), jadi dokumen
+# 16k x 16k kosong hampir tidak makan memori.
+#
+# State satu tile bisa berupa:
+#   - int   : warna seragam 0xAARRGGBB (tidak ada pixel yang dialokasikan)
+#   - QImage: tile ARGB32 yang sudah ditulis
+#   - _Spilled: tile dingin yang dipindah ke file memory-mapped
+#   - PackedTile: tile terkompresi di file project (lihat project.py),
+#     di-decode saat pertama dipakai
+
+
+class PackedTile:
+    # source: objek dengan load(offset, length) -> QImage dan
+    # read(offset, length) -> bytes (blob encode_tile)
+    __slots__ = ('source', 'offset', 'length')
+
+    def __init__(self, source, offset, length):
+        self.source = source
+        self.offset = offset
+        self.length = length
+
+
+def encode_tile(tile, level=1):
+    # Blob tile: header (w, h, 0) + pixel ARGB32 mentah di-zlib
+    raw = image_array(tile, readonly=True).tobytes()
+    return struct.pack('<III', tile.width(), tile.height(), 0) + zlib.compress(raw, level)
+
+
+def decode_tile(blob):
+    w, h, _ = struct.unpack('<III', blob[:12])
+    tile = QImage(w, h, QImage.Format_ARGB32)
+    image_array(tile)[:] = np.frombuffer(zlib.decompress(blob[12:]), np.uint32).reshape(h, w)
+    return tile
+
+
+class _Spilled:
+    __slots__ = ('slot',)
+
+    def __init__(self, slot):
+        self.slot = slot
+
+
+class TileSpill:
+    # File memory-mapped berisi slot-slot tile (tile_size x tile_size uint32)
+    def __init__(self, tile_size, capacity=64):
+        self.tile_size = tile_size
+        self._file = tempfile.TemporaryFile(prefix='minipaint-tiles-')
+        self._free = []
+        self._used = 0
+        self._map = None
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        if self._map is not None:
+            self._map.flush()
+        ts = self.tile_size
+        self._file.truncate(capacity * ts * ts * 4)
+        self._map = np.memmap(self._file, np.uint32, 'r+',
+                              shape=(capacity, ts, ts))
+        self.capacity = capacity
+
+    def store(self, tile):
+        if self._free:
+            slot = self._free.pop()
+        else:
+            if self._used == self.capacity:
+                self._grow(self.capacity * 2)
+            slot = self._used
+            self._used += 1
+        h, w = tile.height(), tile.width()
+        self._map[slot, :h, :w] = image_array(tile, readonly=True)
+        return slot
+
+    def load(self, slot, width, height):
+        tile = QImage(width, height, QImage.Format_ARGB32)
+        image_array(tile)[:] = self._map[slot, :height, :width]
+        return tile
+
+    def release(self, slot):
+        self._free.append(slot)
+
+    def close(self):
+        self._map = None
+        self._file.close()
+
+
+class TiledImage:
+    def __init__(self, width, height, fill=Qt.white, tile_size=128,
+                 spill=False, max_resident=4096):
+        self._width = width
+        self._height = height
+        self.tile_size = tile_size
+        self.default = QColor(fill).rgba()
+        self.max_resident = max_resident
+        self._tiles = OrderedDict()  # (tx, ty) -> int | QImage | _Spilled | PackedTile
+        self._resident = 0
+        self._spill = TileSpill(tile_size) if spill else None
+        # File project asal (project.Chunks): tile dingin yang isinya sama
+        # dengan chunk di file cukup dilepas, tidak perlu ditulis ke spill
+        self.source = None
+
+    # API mirip QImage yang dipakai Canvas
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def size(self):
+        return QSize(self._width, self._height)
+
+    def rect(self):
+        return QRect(0, 0, self._width, self._height)
+
+    def isNull(self):
+        return self._width <= 0 or self._height <= 0
+
+    def pixel(self, x, y):
+        ts = self.tile_size
+        state = self.tile_state((x // ts, y // ts))
+        if isinstance(state, int):
+            return state
+        return state.pixel(x % ts, y % ts)
+
+    def fill(self, color):
+        for state in self._tiles.values():
+            if isinstance(state, _Spilled):
+                self._spill.release(state.slot)
+        self._tiles.clear()
+        self._resident = 0
+        self.default = QColor(color).rgba()
+
+    def copy(self, rect=None):
+        # Gabungkan tile-tile di rect jadi satu QImage
+        rect = self.rect() if rect is None else rect.normalized()
+        out = QImage(rect.width(), rect.height(), QImage.Format_ARGB32)
+        out.fill(QColor.fromRgba(self.default))
+        painter = QPainter(out)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        for key, tile_rect in self.tile_keys(rect):
+            state = self.tile_state(key)
+            if isinstance(state, int) and state == self.default:
+                continue
+            target = tile_rect.translated(-rect.topLeft())
+            if isinstance(state, int):
+                painter.fillRect(target, QColor.fromRgba(state))
+            else:
+                painter.drawImage(target.topLeft(), state)
+        painter.end()
+        return out
+
+    def paste(self, point, image):
+        # Tulis image (mode Source) ke tile-tile yang ditimpanya
+        rect = QRect(point, image.size())
+        for key, tile_rect in self.tile_keys(rect):
+            tile = self._writable(key)
+            painter = QPainter(tile)
+            painter.setCompositionMode(QPainter.CompositionMode_Source)
+            src = tile_rect.intersected(rect)
+            painter.drawImage(src.topLeft() - tile_rect.topLeft(), image,
+                              src.translated(-point))
+            painter.end()
+
+    def snapshot(self):
+        # Salinan beku untuk dibaca thread lain (save/export). Tile QImage
+        # di-share copy-on-write, tile yang di-spill dibaca ke memori.
+        copy = TiledImage(self._width, self._height, tile_size=self.tile_size)
+        copy.default = self.default
+        for key, state in self._tiles.items():
+            if isinstance(state, _Spilled):
+                rect = self.tile_rect(key)
+                state = self._spill.load(state.slot, rect.width(), rect.height())
+            elif isinstance(state, QImage):  # PackedTile di-share apa adanya
+                state = QImage(state)
+            copy._tiles[key] = state
+        return copy
+
+    def painter(self, rect):
+        # QPainter di koordinat image untuk area rect, ditulis balik saat end()
+        return RegionPainter(self, rect)
+
+    def rows(self):
+        return _Rows(self)
+
+    def fill_spans(self, spans, rgba):
+        # Tulis span (y, x0, x1) hasil scan_fill per pita tile. Tile yang
+        # tertutup penuh cukup jadi warna seragam tanpa alokasi pixel.
+        ts = self.tile_size
+        bands = {}
+        for y, x0, x1 in spans:
+            bands.setdefault(y // ts, []).append((y, x0, x1))
+        value = np.uint32(rgba)
+        for ty, band_spans in bands.items():
+            top = ty * ts
+            mask = np.zeros((min(ts, self._height - top), self._width), bool)
+            for y, x0, x1 in band_spans:
+                mask[y - top, x0:x1] = True
+            for tx in range((self._width + ts - 1) // ts):
+                sub = mask[:, tx * ts:tx * ts + ts]
+                if sub.all():
+                    self.set_tile_state((tx, ty), rgba)
+                elif sub.any():
+                    image_array(self._writable((tx, ty)))[sub] = value
+
+    def paint_spans(self, ys, x0, x1, rgba, chunk_pixels=16 << 20):
+        # Versi array dari fill_spans untuk raster.py: ys/x0/x1 array int,
+        # span boleh tumpang tindih dan keluar batas. Span dijadikan mask
+        # per potongan (beberapa baris tile, <= chunk_pixels) lalu ditulis
+        # per tile. Warna dengan alpha < 255 di-blend source-over (tiap pixel
+        # sekali, seperti satu path QPainter).
+        w, h = self._width, self._height
+        x0, x1 = np.clip(x0, 0, w), np.clip(x1, 0, w)
+        keep = (ys >= 0) & (ys < h) & (x1 > x0)
+        ys, x0, x1 = ys[keep], x0[keep], x1[keep]
+        if len(ys) == 0:
+            return
+        ts = self.tile_size
+        step = max(1, chunk_pixels // (w * ts)) * ts
+        chunk = ys // step
+        if chunk[0] == chunk.min() == chunk.max():
+            self._paint_mask(ys, x0, x1, rgba)
+            return
+        # Urutkan per potongan (int16: argsort stable memakai radix sort)
+        order = np.argsort(chunk.astype(np.int16), kind='stable')
+        ys, x0, x1, chunk = ys[order], x0[order], x1[order], chunk[order]
+        cuts = np.flatnonzero(chunk[1:] != chunk[:-1]) + 1
+        for lo, hi in zip(np.concatenate(([0], cuts)), np.concatenate((cuts, [len(ys)]))):
+            self._paint_mask(ys[lo:hi], x0[lo:hi], x1[lo:hi], rgba)
+
+    def _paint_mask(self, ys, x0, x1, rgba):
+        ts = self.tile_size
+        # Area mask = tile-tile yang disentuh span
+        top, left = int(ys.min()) // ts * ts, int(x0.min()) // ts * ts
+        bottom = min(self._height, (int(ys.max()) // ts + 1) * ts)
+        right = min(self._width, -(-int(x1.max()) // ts) * ts)
+        rows, width = bottom - top, right - left
+        mask = np.zeros(rows * width, bool)
+        row = (ys - top) * width - left
+        count = x1 - x0
+        unit = count == 1
+        # Span 1px (garis tipis) langsung, span panjang lewat pixel kalau
+        # totalnya kecil, selain itu awal +1 / akhir -1 lalu cumsum per baris
+        mask[(row + x0)[unit]] = True
+        if not unit.all():
+            row, x0, x1, count = row[~unit], x0[~unit], x1[~unit], count[~unit]
+            if int(count.sum()) < rows * width:
+                owner = np.repeat(np.arange(len(row)), count)
+                start = np.cumsum(count) - count
+                mask[row[owner] + x0[owner] + (np.arange(len(owner)) - start[owner])] = True
+            else:
+                row = row + (ys[~unit] - top)  # baris selebar width + 1
+                n = rows * (width + 1)
+                delta = (np.bincount(row + x0, minlength=n + 1)
+                         - np.bincount(row + x1, minlength=n + 1))
+                runs = (np.cumsum(delta[:n]) > 0).reshape(rows, width + 1)[:, :width]
+                mask.reshape(rows, width)[runs] = True
+        mask = mask.reshape(rows, width)
+        opaque = rgba >> 24 == 0xff
+        value = np.uint32(rgba)
+        for ty in range(top // ts, (bottom - 1) // ts + 1):
+            for tx in range(left // ts, (right - 1) // ts + 1):
+                sub = mask[ty * ts - top:(ty + 1) * ts - top, tx * ts - left:(tx + 1) * ts - left]
+                covered = np.count_nonzero(sub)
+                if not covered:
+                    continue
+                if opaque and covered == sub.size:
+                    self.set_tile_state((tx, ty), rgba)
+                elif opaque:
+                    np.copyto(image_array(self._writable((tx, ty))), value, where=sub)
+                else:
+                    arr = image_array(self._writable((tx, ty)))
+                    arr[sub] = _source_over(arr[sub], rgba)
+
+    def save(self, path, fmt=None, quality=-1):
+        if (fmt or path.rsplit('.', 1)[-1]).lower() == 'png':
+            return write_png(path, self)
+        return self.copy().save(path, fmt, quality)
+
+    # Akses per tile (dipakai History, RenderCache, dll)
+
+    def tile_rect(self, key):
+        ts = self.tile_size
+        return QRect(key[0] * ts, key[1] * ts, ts, ts).intersected(self.rect())
+
+    def tile_keys(self, rect):
+        rect = rect.normalized().intersected(self.rect())
+        if rect.isEmpty():
+            return
+        ts = self.tile_size
+        for ty in range(rect.top() // ts, rect.bottom() // ts + 1):
+            for tx in range(rect.left() // ts, rect.right() // ts + 1):
+                yield (tx, ty), self.tile_rect((tx, ty))
+
+    def tile_state(self, key):
+        # int (seragam) atau QImage tile yang hidup di store
+        state = self._tiles.get(key, self.default)
+        if isinstance(state, _Spilled):
+            rect = self.tile_rect(key)
+            tile = self._spill.load(state.slot, rect.width(), rect.height())
+            self._spill.release(state.slot)
+            self._store(key, tile)
+            return tile
+        if isinstance(state, PackedTile):
+            tile = state.source.load(state.offset, state.length)
+            self._store(key, tile)
+            return tile
+        if isinstance(state, QImage):
+            self._tiles.move_to_end(key)
+        return state
+
+    def tile_snapshot(self, key):
+        # Salinan state untuk History. QImage(tile) hanya berbagi data
+        # (copy-on-write Qt), pixel baru disalin saat tile ditulis.
+        state = self.tile_state(key)
+        return QImage(state) if isinstance(state, QImage) else state
+
+    def set_tile_state(self, key, state):
+        old = self._tiles.pop(key, None)
+        if isinstance(old, QImage):
+            self._resident -= 1
+        elif isinstance(old, _Spilled):
+            self._spill.release(old.slot)
+        if isinstance(state, QImage):
+            self._store(key, state)
+        elif state != self.default:
+            self._tiles[key] = state
+
+    def tile_bytes(self, state):
+        return state.sizeInBytes() if isinstance(state, QImage) else 64
+
+    def _writable(self, key):
+        state = self.tile_state(key)
+        if isinstance(state, QImage):
+            return state
+        rect = self.tile_rect(key)
+        tile = QImage(rect.width(), rect.height(), QImage.Format_ARGB32)
+        tile.fill(QColor.fromRgba(state))
+        self._store(key, tile)
+        return tile
+
+    def _store(self, key, tile):
+        if not isinstance(self._tiles.get(key), QImage):
+            self._resident += 1
+        self._tiles[key] = tile
+        self._tiles.move_to_end(key)
+        if self._spill is None:
+            return
+        # Tile paling lama tidak dipakai dipindah ke file
+        while self._resident > self.max_resident:
+            old_key = next(k for k, v in self._tiles.items() if isinstance(v, QImage))
+            if old_key == key:
+                break
+            tile = self._tiles[old_key]
+            packed = self.source.pack(tile) if self.source is not None else None
+            self._tiles[old_key] = packed or _Spilled(self._spill.store(tile))
+            self._resident -= 1
+
+
+class RegionPainter(QPainter):
+    # Painter di atas salinan area rect; isinya ditulis ke store saat end()
+    def __init__(self, store, rect):
+        self._store = store
+        self._rect = rect.normalized().intersected(store.rect())
+        if self._rect.isEmpty():
+            self._rect = QRect(0, 0, 1, 1)
+        self._image = store.copy(self._rect)
+        super().__init__(self._image)
+        self.translate(-self._rect.left(), -self._rect.top())
+
+    def end(self):
+        if not self.isActive():
+            return False
+        result = super().end()
+        # Tulis balik hanya tile yang pixelnya berubah: tile seragam di
+        # bounding rect yang tidak tersentuh tetap int, dan History tidak
+        # mencatat tile yang sama dengan sebelumnya
+        store, rect = self._store, self._rect
+        for key, tile_rect in store.tile_keys(rect):
+            part = tile_rect.intersected(rect)
+            pixels = self._image.copy(part.translated(-rect.topLeft()))
+            if _differs(store.tile_state(key), pixels, part.translated(-tile_rect.topLeft())):
+                store.paste(part.topLeft(), pixels)
+        return result
+
+
+def _differs(state, pixels, rect):
+    # Apakah pixels (area rect di dalam tile) berbeda dari isi tile state,
+    # dibandingkan sebagai QImage seperti History (tanpa memuat NumPy)
+    if isinstance(state, int):
+        old = QImage(pixels.size(), QImage.Format_ARGB32)
+        old.fill(QColor.fromRgba(state))
+    else:
+        old = state.copy(rect).convertToFormat(QImage.Format_ARGB32)
+    return old != pixels
+
+
+def _source_over(dst, rgba):
+    # Blend warna rgba di atas pixel ARGB32 (non-premultiplied) dst
+    src = np.array([(rgba >> shift) & 0xff for shift in (0, 8, 16, 24)], np.float32) / 255
+    d = dst.view(np.uint8).reshape(-1, 4).astype(np.float32) / 255  # BGRA
+    sa, da = src[3], d[:, 3:]
+    out_a = sa + da * (1 - sa)
+    out = np.empty_like(d)
+    out[:, :3] = (src[:3] * sa + d[:, :3] * da * (1 - sa)) / np.maximum(out_a, 1e-6)
+    out[:, 3:] = out_a
+    return (out * 255 + 0.5).astype(np.uint8).view(np.uint32).reshape(dst.shape)
+
+
+class _Rows:
+    # Akses baris sebagai array uint32 (read-only), untuk fill.scan_fill dan
+    # selection.magic_wand: rows[y] satu baris, rows[y0:y1] beberapa baris.
+    # Satu pita setinggi tile dirakit sekaligus dan disimpan beberapa.
+    def __init__(self, store, max_bands=8):
+        self.store = store
+        self.shape = (store.height(), store.width())
+        self.max_bands = max_bands
+        self._bands = OrderedDict()
+
+    def __getitem__(self, y):
+        ts = self.store.tile_size
+        if isinstance(y, slice):
+            start, stop, _ = y.indices(self.shape[0])
+            parts = [self._get(ty)[max(0, start - ty * ts):stop - ty * ts]
+                     for ty in range(start // ts, (stop - 1) // ts + 1)]
+            if len(parts) == 1:
+                return parts[0]
+            return np.concatenate(parts) if parts else np.empty((0, self.shape[1]), np.uint32)
+        return self._get(y // ts)[y % ts]
+
+    def _get(self, ty):
+        band = self._bands.get(ty)
+        if band is None:
+            band = self._bands[ty] = self._band(ty)
+            if len(self._bands) > self.max_bands:
+                self._bands.popitem(last=False)
+        return band
+
+    def _band(self, ty):
+        store = self.store
+        ts = store.tile_size
+        band = np.empty((min(ts, store.height() - ty * ts), store.width()), np.uint32)
+        for tx in range((store.width() + ts - 1) // ts):
+            state = store.tile_state((tx, ty))
+            if isinstance(state, int):
+                band[:, tx * ts:tx * ts + ts] = state
+            else:
+                band[:, tx * ts:tx * ts + ts] = image_array(state, readonly=True)
+        return band
+
+
+def _png_chunk(kind, data):
+    chunk = kind + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk))
+
+
+def write_png(path, store, level=6, progress=None, cancelled=None):
+    # Encode PNG per pita setinggi satu tile, tanpa merakit image penuh.
+    # store: TiledImage/LayerStack atau QImage biasa (pita 256 baris)
+    width, height = store.width(), store.height()
+    band = getattr(store, 'tile_size', 256)
+    compressor = zlib.compressobj(level)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        for y in range(0, height, band):
+            if cancelled is not None and cancelled():
+                return False
+            h = min(band, height - y)
+            rows = store.copy(QRect(0, y, width, h)).convertToFormat(QImage.Format_RGBA8888)
+            data = image_array(rows, readonly=True).view(np.uint8).reshape(h, width * 4)
+            filtered = np.zeros((h, width * 4 + 1), np.uint8)
+            filtered[:, 1:] = data
+            chunk = compressor.compress(filtered.tobytes())
+            if chunk:
+                f.write(_png_chunk(b'IDAT', chunk))
+            if progress is not None:
+                progress(min(height, y + h) / height)
+        f.write(_png_chunk(b'IDAT', compressor.flush()))
+        f.write(_png_chunk(b'IEND', b''))
+    return True
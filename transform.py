@@ -0,0 +1,106 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import Qt, QRectF
+from PyQt5.QtGui import QImage, QPainter, QTransform
+
+# Cache hasil rotate/scale floating selection. Saat drag dipakai preview
+# cepat (FastTransformation), hasil halus dihitung sekali saat dilepas
+# dan dipakai ulang oleh apply_transform. Selection besar dibagi per pita
+# ke thread pool (QPainter di QImage aman di thread non-GUI).
+
+ROTATE = 'rotate'
+SCALE = 'scale'
+
+_pool = None
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+    return _pool
+
+
+def rotation(image, angle):
+    transform = QTransform()
+    center = image.rect().center()
+    transform.translate(center.x(), center.y())
+    transform.rotate(angle)
+    transform.translate(-center.x(), -center.y())
+    return transform
+
+
+def scaled_size(image, factor):
+    return int(image.width() * factor), int(image.height() * factor)
+
+
+class TransformCache:
+    def __init__(self, parallel_pixels=1024 * 1024, band_height=128):
+        self.parallel_pixels = parallel_pixels  # mulai pakai thread pool di atas ini
+        self.band_height = band_height
+        self._source = None
+        self._cache = {}
+
+    def reset(self):
+        self._source = None
+        self._cache = {}
+
+    def get(self, image, mode, angle, factor, smooth):
+        if image is not self._source:
+            self.reset()
+            self._source = image
+        if mode == ROTATE:
+            key = (mode, angle, smooth)
+        elif mode == SCALE:
+            key = (mode, factor, smooth)
+        else:
+            return image
+        result = self._cache.get(key)
+        if result is None:
+            # Cukup simpan hasil terakhir per kualitas
+            self._cache = {k: v for k, v in self._cache.items() if k[2] != smooth}
+            result = self._cache[key] = self._render(image, mode, angle, factor, smooth)
+        return result
+
+    def _render(self, image, mode, angle, factor, smooth):
+        quality = Qt.SmoothTransformation if smooth else Qt.FastTransformation
+        big = image.width() * image.height() >= self.parallel_pixels
+        if mode == ROTATE:
+            transform = rotation(image, angle)
+            if smooth and big:
+                return self._banded(image, QImage.trueMatrix(
+                    transform, image.width(), image.height()))
+            return image.transformed(transform, quality)
+        w, h = scaled_size(image, factor)
+        if smooth and big and w > 0 and h > 0:
+            return self._banded(image, QTransform.fromScale(
+                w / image.width(), h / image.height()), (w, h))
+        return image.scaled(w, h, Qt.KeepAspectRatio, quality)
+
+    def _banded(self, image, transform, size=None):
+        # Resample halus per pita horizontal secara paralel
+        if size is None:
+            bounds = transform.mapRect(QRectF(0, 0, image.width(), image.height())).toAlignedRect()
+            size = (bounds.width(), bounds.height())
+            transform = transform * QTransform.fromTranslate(-bounds.x(), -bounds.y())
+        w, h = size
+
+        def band(y):
+            out = QImage(w, min(self.band_height, h - y), QImage.Format_ARGB32_Premultiplied)
+            out.fill(Qt.transparent)
+            painter = QPainter(out)
+            painter.setRenderHint(QPainter.SmoothPixmapTransform)
+            painter.setTransform(transform * QTransform.fromTranslate(0, -y))
+            painter.drawImage(0, 0, image)
+            painter.end()
+            return y, out
+
+        result = QImage(w, h, QImage.Format_ARGB32_Premultiplied)
+        result.fill(Qt.transparent)
+        painter = QPainter(result)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        for y, out in _executor().map(band, range(0, h, self.band_height)):
+            painter.drawImage(0, y, out)
+        painter.end()
+        return result.convertToFormat(QImage.Format_ARGB32)
@@ -0,0 +1,278 @@
+import math
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QPoint, QRect
+from PyQt5.QtGui import QColor, QImage, QPainter, QPen
+
+# Overlay shape vektor (LINE / RECT / CIRCLE) di atas semua layer raster
+# (lihat layers.py). Geometrinya disimpan dan diindeks quadtree supaya
+# hit-test dan render hanya menyentuh shape di sekitar area yang diminta.
+# Shape tidak diubah di tempat: move membuat Shape baru dengan id yang
+# sama, jadi History cukup menyimpan objeknya.
+
+LINE = 'line'
+RECT = 'rect'
+CIRCLE = 'circle'
+
+
+class Shape:
+    __slots__ = ('id', 'kind', 'start', 'end', 'color', 'width', '_pen')
+
+    def __init__(self, id, kind, start, end, color, width):
+        self.id = id
+        self.kind = kind
+        self.start = QPoint(start)
+        self.end = QPoint(end)
+        self.color = QColor(color).rgba()
+        self.width = width
+        self._pen = None
+
+    def bounds(self):
+        # Sama dengan Canvas._pen_rect
+        pad = self.width // 2 + 2
+        return QRect(self.start, self.end).normalized().adjusted(-pad, -pad, pad, pad)
+
+    def moved(self, dx, dy):
+        offset = QPoint(dx, dy)
+        return Shape(self.id, self.kind, self.start + offset, self.end + offset,
+                     QColor.fromRgba(self.color), self.width)
+
+    def pen(self):
+        if self._pen is None:
+            color = QColor.fromRgba(self.color)
+            if self.kind == LINE:
+                self._pen = QPen(color, self.width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
+            else:
+                self._pen = QPen(color, self.width)
+        return self._pen
+
+    def draw(self, painter):
+        painter.setPen(self.pen())
+        if self.kind == LINE:
+            painter.drawLine(self.start, self.end)
+        elif self.kind == RECT:
+            painter.drawRect(QRect(self.start, self.end))
+        elif self.kind == CIRCLE:
+            painter.drawEllipse(QRect(self.start, self.end))
+
+    def distance(self, x, y):
+        # Jarak titik ke garis shape (outline), dalam pixel image
+        x0, y0, x1, y1 = self.start.x(), self.start.y(), self.end.x(), self.end.y()
+        if self.kind == LINE:
+            return _segment_distance(x, y, x0, y0, x1, y1)
+        if self.kind == RECT:
+            return min(_segment_distance(x, y, x0, y0, x1, y0),
+                       _segment_distance(x, y, x1, y0, x1, y1),
+                       _segment_distance(x, y, x1, y1, x0, y1),
+                       _segment_distance(x, y, x0, y1, x0, y0))
+        # Elips: pendekatan jarak radial ternormalisasi
+        a, b = max(abs(x1 - x0) / 2, 0.5), max(abs(y1 - y0) / 2, 0.5)
+        dx, dy = x - (x0 + x1) / 2, y - (y0 + y1) / 2
+        return abs(math.hypot(dx / a, dy / b) - 1) * min(a, b)
+
+    def to_dict(self):
+        return {'id': self.id, 'kind': self.kind,
+                'start': [self.start.x(), self.start.y()],
+                'end': [self.end.x(), self.end.y()],
+                'color': QColor.fromRgba(self.color).name(QColor.HexArgb),
+                'width': self.width}
+
+    @staticmethod
+    def from_dict(data):
+        return Shape(data['id'], data['kind'], QPoint(*data['start']),
+                     QPoint(*data['end']), QColor(data['color']), data['width'])
+
+
+def _segment_distance(x, y, x0, y0, x1, y1):
+    dx, dy = x1 - x0, y1 - y0
+    length = dx * dx + dy * dy
+    t = 0.0 if length == 0 else max(0.0, min(1.0, ((x - x0) * dx + (y - y0) * dy) / length))
+    return math.hypot(x - (x0 + t * dx), y - (y0 + t * dy))
+
+
+class QuadTree:
+    # Quadtree "longgar": item masuk ke node yang memuat titik tengah
+    # bounds-nya, dan tiap node menyimpan extent (gabungan bounds semua
+    # item di bawahnya) untuk memangkas query. Shape yang memotong garis
+    # bagi tetap turun ke node kecil, tidak menumpuk di root.
+    def __init__(self, rect, max_items=16, max_depth=12, depth=0):
+        self.rect = QRect(rect)
+        self.max_items = max_items
+        self.max_depth = max_depth
+        self.depth = depth
+        self.items = {}  # id -> bounds
+        self.children = None
+        self.extent = QRect()
+
+    def insert(self, id, bounds, index):
+        center = bounds.center()
+        node = self
+        while True:
+            node.extent = node.extent.united(bounds)
+            if node.children is None:
+                break
+            node = node._child_for(center)
+        node.items[id] = bounds
+        index[id] = node
+        if len(node.items) > node.max_items and node.depth < node.max_depth:
+            node._split(index)
+
+    def query(self, rect, out):
+        if not self.extent.intersects(rect):
+            return out
+        for id, bounds in self.items.items():
+            if bounds.intersects(rect):
+                out.append(id)
+        if self.children is not None:
+            for child in self.children:
+                child.query(rect, out)
+        return out
+
+    def _child_for(self, point):
+        r = self.rect
+        right = point.x() >= r.left() + r.width() // 2
+        bottom = point.y() >= r.top() + r.height() // 2
+        return self.children[right * 2 + bottom]
+
+    def _split(self, index):
+        r = self.rect
+        hw, hh = r.width() // 2, r.height() // 2
+        if hw < 8 or hh < 8:
+            return
+        self.children = [QuadTree(QRect(x, y, w, h), self.max_items, self.max_depth, self.depth + 1)
+                         for x, w in ((r.left(), hw), (r.left() + hw, r.width() - hw))
+                         for y, h in ((r.top(), hh), (r.top() + hh, r.height() - hh))]
+        items, self.items = self.items, {}
+        for id, bounds in items.items():
+            child = self._child_for(bounds.center())
+            child.items[id] = bounds
+            child.extent = child.extent.united(bounds)
+            index[id] = child
+
+
+class ShapeLayer:
+    def __init__(self, rect):
+        self.rect = QRect(rect)
+        self.shapes = {}  # id -> Shape, id naik = urutan gambar
+        self.next_id = 1
+        self._tree = QuadTree(self.rect)
+        self._nodes = {}  # id -> node quadtree
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def create(self, kind, start, end, color, width):
+        shape = Shape(self.next_id, kind, start, end, color, width)
+        self.next_id += 1
+        self.put(shape.id, shape)
+        return shape
+
+    def get(self, id):
+        return self.shapes.get(id)
+
+    def put(self, id, shape):
+        # shape None = hapus. Return bounds yang berubah (lama + baru)
+        dirty = QRect()
+        old = self.shapes.pop(id, None)
+        if old is not None:
+            dirty = old.bounds()
+            del self._nodes.pop(id).items[id]
+        if shape is not None:
+            self.shapes[id] = shape
+            self.next_id = max(self.next_id, id + 1)  # id dari luar (sesi) tidak dipakai ulang
+            self._tree.insert(id, shape.bounds(), self._nodes)
+            dirty = dirty.united(shape.bounds())
+        return dirty
+
+    def query(self, rect):
+        # Shape yang bounds-nya kena rect, urut dari bawah ke atas
+        return [self.shapes[id] for id in sorted(self._tree.query(rect, []))]
+
+    def hit_test(self, point, tolerance=3):
+        # Shape paling atas yang garisnya dalam jarak tolerance dari point
+        area = QRect(point.x() - int(tolerance) - 1, point.y() - int(tolerance) - 1,
+                     2 * int(tolerance) + 3, 2 * int(tolerance) + 3)
+        for shape in reversed(self.query(area)):
+            if shape.distance(point.x(), point.y()) <= shape.width / 2 + tolerance:
+                return shape
+        return None
+
+    def draw(self, painter, rect):
+        # Gambar shape yang terlihat di rect (koordinat image, transform painter bebas)
+        shapes = self.query(rect)
+        if not shapes:
+            return
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setBrush(Qt.NoBrush)
+        for shape in shapes:
+            shape.draw(painter)
+        painter.restore()
+
+    def copy(self):
+        layer = ShapeLayer(self.rect)
+        layer.next_id = self.next_id
+        for id, shape in self.shapes.items():
+            layer.put(id, shape)
+        return layer
+
+
+class ShapeCache:
+    # Tile hasil rasterisasi shape pada zoom tertentu (koordinat image yang
+    # sudah di-zoom), untuk zoom >= 1. Repaint berikutnya di zoom yang sama
+    # cukup menggambar tile, shape hanya dirasterisasi ulang di tile yang
+    # di-invalidate.
+    def __init__(self, tile_size=256, max_tiles=192):
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()  # (zoom, tx, ty) -> QImage | None (kosong)
+
+    def invalidate(self, rect=None):
+        if rect is None:
+            self._tiles.clear()
+            return
+        rect = rect.normalized()
+        if rect.isEmpty() or not self._tiles:
+            return
+        ts = self.tile_size
+        for zoom in {key[0] for key in self._tiles}:
+            for ty in range(int(rect.top() * zoom) // ts, int((rect.bottom() + 1) * zoom) // ts + 1):
+                for tx in range(int(rect.left() * zoom) // ts, int((rect.right() + 1) * zoom) // ts + 1):
+                    self._tiles.pop((zoom, tx, ty), None)
+
+    def draw(self, painter, layer, zoom, origin, clip, image_rect):
+        # origin: posisi widget pixel (0, 0) image, clip: rect widget
+        ts = self.tile_size
+        x0 = max(clip.left() - origin.x(), 0)
+        y0 = max(clip.top() - origin.y(), 0)
+        x1 = min(clip.right() + 1 - origin.x(), int(image_rect.width() * zoom))
+        y1 = min(clip.bottom() + 1 - origin.y(), int(image_rect.height() * zoom))
+        if x1 <= x0 or y1 <= y0:
+            return
+        for ty in range(y0 // ts, (y1 - 1) // ts + 1):
+            for tx in range(x0 // ts, (x1 - 1) // ts + 1):
+                tile = self._tile(layer, zoom, tx, ty)
+                if tile is not None:
+                    painter.drawImage(origin.x() + tx * ts, origin.y() + ty * ts, tile)
+
+    def _tile(self, layer, zoom, tx, ty):
+        key = (zoom, tx, ty)
+        if key in self._tiles:
+            self._tiles.move_to_end(key)
+            return self._tiles[key]
+        ts = self.tile_size
+        area = QRect(int(tx * ts / zoom) - 1, int(ty * ts / zoom) - 1,
+                     int(ts / zoom) + 3, int(ts / zoom) + 3)
+        tile = None
+        if layer.query(area):
+            tile = QImage(ts, ts, QImage.Format_ARGB32_Premultiplied)
+            tile.fill(Qt.transparent)
+            painter = QPainter(tile)
+            painter.translate(-tx * ts, -ty * ts)
+            painter.scale(zoom, zoom)
+            layer.draw(painter, area)
+            painter.end()
+        self._tiles[key] = tile
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return tile